@@ -0,0 +1,165 @@
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class _RequestReader(io.RawIOBase):
+    """The request head, then at most ``length`` body bytes read from the connection.
+
+    Used from a worker thread: each read waits for the event loop to receive
+    the next piece, so the handler sees the body as it arrives and limits
+    such as the multipart size check apply before it is read.
+    """
+
+    def __init__(self, head, reader, length, loop):
+        self._head = memoryview(head)
+        self._reader = reader
+        self._remaining = length
+        self._loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = asyncio.run_coroutine_threadsafe(self._reader.read(size), self._loop).result()
+        buffer[: len(data)] = data
+        self._remaining = self._remaining - len(data) if data else 0
+        return len(data)
+
+
+class _ResponseWriter(io.RawIOBase):
+    """Writes go straight to the connection, waiting for the transport to drain."""
+
+    def __init__(self, writer, loop):
+        self._writer = writer
+        self._loop = loop
+
+    def writable(self):
+        return True
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def write(self, data):
+        data = bytes(data)
+        if data:
+            asyncio.run_coroutine_threadsafe(self._send(data), self._loop).result()
+        return len(data)
+
+
+def _streaming_handler(handler_class):
+    # Runs an unmodified BaseHTTPRequestHandler over the asyncio connection.
+    class StreamingHandler(handler_class):
+        def setup(self):
+            self.connection = None
+            self.rfile, self.wfile = self.request
+
+        def finish(self):
+            pass
+
+    return StreamingHandler
+
+
+class _BadRequest(Exception):
+    """A request head the handler never gets to see; answered on the event loop."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _error_response(status, message):
+    body = json.dumps({"error": message}).encode("utf-8")
+    head = (
+        f"HTTP/1.0 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+class _ServerStub:
+    def __init__(self, host, port):
+        self.server_address = (host, port)
+        self.server_name = host
+        self.server_port = port
+
+
+async def _read_head(reader):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        head = None
+    if head is None or len(head) > MAX_HEADER_BYTES:
+        raise _BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "request header too large")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            value = value.strip()
+            if not value.isdigit():
+                raise _BadRequest(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+            length = int(value)
+    return head, length
+
+
+def _dispatch(handler_class, streams, client_address, server):
+    handler_class(streams, client_address, server)
+
+
+async def _serve(handler_class, host, port, workers):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mock-worker")
+    streaming = _streaming_handler(handler_class)
+    stub = _ServerStub(host, port)
+
+    async def on_connection(reader, writer):
+        client_address = writer.get_extra_info("peername")
+        try:
+            try:
+                head, length = await _read_head(reader)
+            except _BadRequest as exc:
+                writer.write(_error_response(exc.status, str(exc)))
+                await writer.drain()
+                return
+            streams = (
+                io.BufferedReader(_RequestReader(head, reader, length, loop)),
+                _ResponseWriter(writer, loop),
+            )
+            await loop.run_in_executor(executor, _dispatch, streaming, streams, client_address, stub)
+        except asyncio.IncompleteReadError:
+            pass
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(
+        on_connection, host, port, limit=MAX_HEADER_BYTES
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def serve_async(handler_class, host, port, workers=4):
+    # Connections are accepted and read on the event loop and each request is
+    # handled in the worker pool, so CPU-bound rendering never blocks accepting
+    # connections. Bodies and responses stream between the two as they go.
+    asyncio.run(_serve(handler_class, host, port, workers))
@@ -0,0 +1,84 @@
+"""Compare N single-color /render calls with one /render/batch call.
+
+The backend runs with the render cache disabled so both sides do the full
+work on every round.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_concurrency import BACKEND, _free_port, _post_form, _wait_ready  # noqa: E402
+
+COLOR_IDS = ("A1", "B2", "C3")
+
+
+def _session(base, size):
+    payload = json.loads(_post_form(base, "/process", {"width": size, "height": size}))
+    return payload["session_id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--layers", type=int, default=24)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            BACKEND,
+            "--port",
+            str(port),
+            "--user-backend",
+            "memory",
+            "--render-cache-bytes",
+            "0",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base)
+        session_id = _session(base, args.size)
+        layers = [COLOR_IDS[index % len(COLOR_IDS)] for index in range(args.layers)]
+
+        started = time.perf_counter()
+        single_bytes = 0
+        for _ in range(args.rounds):
+            for color_id in layers:
+                single_bytes += len(
+                    _post_form(base, "/render", {"session_id": session_id, "color_id": color_id})
+                )
+        single = (time.perf_counter() - started) / args.rounds
+
+        started = time.perf_counter()
+        batch_bytes = 0
+        for _ in range(args.rounds):
+            batch_bytes += len(
+                _post_form(
+                    base,
+                    "/render/batch",
+                    {"session_id": session_id, "selections": ";".join(layers)},
+                )
+            )
+        batch = (time.perf_counter() - started) / args.rounds
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{args.layers} layers of {args.size}x{args.size}, {args.rounds} rounds")
+    print(f"{'mode':<10}{'ms/round':>10}{'bytes/round':>13}")
+    print(f"{'single':<10}{single * 1000:>10.1f}{single_bytes // args.rounds:>13}")
+    print(f"{'batch':<10}{batch * 1000:>10.1f}{batch_bytes // args.rounds:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Measure render and color_map throughput through the compute pool.
+
+Each row submits --jobs calls from --clients threads. workers=0 runs the calls
+on the client threads (the old behavior), so it shows how far the GIL lets
+threads alone go; the other rows should scale with the number of cores.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline  # noqa: E402
+import raster  # noqa: E402
+from compute_pool import ComputePool  # noqa: E402
+
+
+def _render_job(size):
+    draw = (raster.isolated_pixels, (size, size, (255, 0, 0, 255), 7))
+    return raster.draw_png, (draw, raster.full_region(size, size), 6)
+
+
+def _color_map_job(size, seed=5):
+    rng = random.Random(seed)
+    palette = [
+        (f"C{index}", (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        for index in range(48)
+    ]
+    rgba = bytes(
+        value
+        for _ in range(size * size)
+        for value in (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+    )
+    mask = bytes(size * size)
+    return pipeline.color_map, (size, size, rgba, mask, palette, 16, True, "rgb")
+
+
+def _run(pool, job, jobs, clients):
+    fn, args = job
+    remaining = [jobs]
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            pool.run(fn, *args)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", default=f"0,1,2,{os.cpu_count() or 1}")
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--render-size", type=int, default=1024)
+    parser.add_argument("--map-size", type=int, default=128)
+    args = parser.parse_args()
+
+    jobs = {
+        "render": _render_job(args.render_size),
+        "color_map": _color_map_job(args.map_size),
+    }
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'job':<11}{'workers':>8}{'jobs/s':>10}{'shared MiB':>12}")
+    for workers in sorted({int(value) for value in args.workers.split(",")}):
+        # Room for every client, so no call is turned away with ComputeBusy.
+        pool = ComputePool(workers, queue_size=args.clients)
+        try:
+            for name, (fn, job_args) in jobs.items():
+                pool.run(fn, *job_args)  # warm up workers and caches
+                before = pool.stats()["shared_bytes"]
+                seconds = _run(pool, (fn, job_args), args.jobs, args.clients)
+                shared = pool.stats()["shared_bytes"] - before
+                print(
+                    f"{name:<11}{workers:>8}{args.jobs / seconds:>10.1f}"
+                    f"{shared / 2**20:>12.1f}"
+                )
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Measure /health and /render latency under N parallel clients for each server mode."""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+MOCK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(MOCK_DIR, "mock_backend.py")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"backend at {base} did not become ready")
+
+
+def _post_form(base, path, fields):
+    data = urlencode(fields).encode("utf-8")
+    request = urllib.request.Request(
+        f"{base}{path}",
+        data=data,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read()
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run_clients(base, session_id, clients, requests_per_client):
+    latencies = {"/health": [], "/render": []}
+    lock = threading.Lock()
+
+    def client(index):
+        local = {"/health": [], "/render": []}
+        for step in range(requests_per_client):
+            path = "/render" if (step + index) % 2 == 0 else "/health"
+            started = time.perf_counter()
+            if path == "/render":
+                _post_form(base, path, {"session_id": session_id, "color_id": "A1"})
+            else:
+                with urllib.request.urlopen(f"{base}{path}", timeout=60) as response:
+                    response.read()
+            local[path].append(time.perf_counter() - started)
+        with lock:
+            for key, values in local.items():
+                latencies[key].extend(values)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def bench_mode(mode, args):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [
+        sys.executable,
+        BACKEND,
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--mode",
+        mode,
+        "--user-backend",
+        "memory",
+    ]
+    server = subprocess.Popen(command, cwd=MOCK_DIR, stdout=subprocess.DEVNULL)
+    try:
+        _wait_ready(base)
+        session = json.loads(
+            _post_form(base, "/process", {"width": args.size, "height": args.size})
+        )
+        latencies, elapsed = _run_clients(
+            base, session["session_id"], args.clients, args.requests
+        )
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    total = sum(len(values) for values in latencies.values())
+    print(f"mode={mode} clients={args.clients} {total / elapsed:.1f} req/s")
+    for path, values in latencies.items():
+        p50 = _percentile(values, 0.50) * 1000
+        p99 = _percentile(values, 0.99) * 1000
+        print(f"  {path:<8} n={len(values):<5} p50={p50:8.1f}ms p99={p99:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", nargs="+", default=["single", "threaded", "async"])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--size", type=int, default=512, help="render width and height")
+    args = parser.parse_args()
+    for mode in args.modes:
+        bench_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
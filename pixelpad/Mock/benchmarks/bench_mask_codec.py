@@ -0,0 +1,68 @@
+"""Background-mask RLE: encoded size and throughput versus raw masks, with round-trip checks."""
+
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mask_codec  # noqa: E402
+
+
+def _subject_mask(size):
+    # Background everywhere except a centered disc with a rectangular hole.
+    mask = bytearray(size * size)
+    radius = size * 0.35
+    center = size / 2
+    for y in range(size):
+        for x in range(size):
+            inside = (x - center) ** 2 + (y - center) ** 2 <= radius * radius
+            hole = abs(x - center) < size * 0.05 and abs(y - center) < size * 0.15
+            mask[y * size + x] = 0 if inside and not hole else 1
+    return bytes(mask)
+
+
+def _best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 512, 2048])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = "numpy" if mask_codec.np is not None else "python"
+    print(f"engine={engine}")
+    print(
+        f"{'size':>10}{'raw u8':>12}{'bitmask':>10}{'rle':>10}{'rle b64':>10}"
+        f"{'encode':>10}{'decode':>10}{'Mpx/s':>8}"
+    )
+    for size in args.sizes:
+        mask = _subject_mask(size)
+        (rle, start), encode_time = _best_of(lambda: mask_codec.encode_rle(mask), args.repeat)
+        decoded, decode_time = _best_of(
+            lambda: mask_codec.decode_rle(rle, start, len(mask)), args.repeat
+        )
+        if decoded != mask:
+            raise SystemExit(f"round trip failed at {size}x{size}")
+        encoded = base64.b64encode(rle)
+        throughput = len(mask) / encode_time / 1e6
+        print(
+            f"{f'{size}x{size}':>10}{len(mask):>12}{(len(mask) + 7) // 8:>10}{len(rle):>10}"
+            f"{len(encoded):>10}{encode_time * 1000:>8.2f}ms{decode_time * 1000:>8.2f}ms"
+            f"{throughput:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Nearest-palette assignment: brute force versus the cached palette index."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import palette_index  # noqa: E402
+from palette_index import PaletteIndex, brute_force_nearest  # noqa: E402
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--palette-sizes", type=int, nargs="+", default=[24, 96, 291])
+    parser.add_argument("--pixels", type=int, default=20000, help="query colors per run")
+    parser.add_argument("--distinct", type=int, default=4000, help="distinct query colors")
+    parser.add_argument("--metric", choices=palette_index.METRICS, default="rgb")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    distinct = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(args.distinct)]
+    queries = [rng.choice(distinct) for _ in range(args.pixels)]
+    print(f"{args.pixels} pixels, {args.distinct} distinct colors, metric={args.metric}")
+    print(f"{'palette':>8}{'brute':>12}{'build':>10}{'kd-tree':>10}{'numpy':>10}")
+    for size in args.palette_sizes:
+        palette = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(size)]
+        expected, brute = _timed(lambda: brute_force_nearest(queries, palette, args.metric))
+        index, build = _timed(lambda: PaletteIndex(palette, args.metric))
+        tree_result, tree = _timed(lambda: [index.nearest(color) for color in queries])
+        columns = [brute, build, tree]
+        if tree_result != expected:
+            raise SystemExit(f"kd-tree disagrees with brute force for palette {size}")
+        if palette_index.np is not None:
+            numpy_result, vectorized = _timed(lambda: index.nearest_many(queries))
+            mismatches = sum(a != b for a, b in zip(numpy_result, expected))
+            if mismatches and args.metric == "rgb":
+                raise SystemExit(f"numpy disagrees with brute force for palette {size}")
+            columns.append(vectorized)
+        row = "".join(f"{seconds * 1000:>8.1f}ms" for seconds in columns)
+        print(f"{size:>8}  {row}")
+
+
+if __name__ == "__main__":
+    main()
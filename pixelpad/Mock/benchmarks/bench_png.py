@@ -0,0 +1,83 @@
+"""Report PNG size and encode time for each color mode, filter mode and level."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raster  # noqa: E402
+
+PALETTE = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)]
+# (label, color mode, filter mode); the first row is the previous encoder.
+MODES = (
+    ("rgba/none", "rgba", "none"),
+    ("rgba/adaptive", "rgba", "adaptive"),
+    ("indexed", "auto", "adaptive"),
+)
+
+
+def _board_pixels(size, colors, seed=3):
+    # Blocky bead-board-like image: random palette colors in 8x8 cells.
+    rng = random.Random(seed)
+    palette = [bytes([rng.randrange(256) for _ in range(3)] + [255]) for _ in range(colors)]
+    cells = (size + 7) // 8
+    grid = [rng.choice(palette) for _ in range(cells * cells)]
+    rows = []
+    for y in range(size):
+        row = b"".join(grid[(y // 8) * cells + x // 8] for x in range(size))
+        rows.append(row)
+    return b"".join(rows)
+
+
+def _gradient_pixels(size):
+    return bytes(
+        channel
+        for y in range(size)
+        for x in range(size)
+        for channel in (x * 255 // size, y * 255 // size, (x + y) % 256, 255)
+    )
+
+
+def _time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--engine", default=None, choices=raster.ENGINES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = args.size
+    engine = raster.resolve_engine(args.engine)
+    cases = {
+        "banded": raster.banded_pixels(size, size, PALETTE, engine=engine),
+        "isolated": raster.isolated_pixels(size, size, PALETTE[0], 7, engine=engine),
+        "board-24": _board_pixels(size, 24),
+        "gradient": _gradient_pixels(size),
+    }
+    print(f"engine={engine} size={size}x{size}")
+    print(f"{'case':<10}{'mode':<15}{'level':>6}{'bytes':>12}{'encode':>12}")
+    for case, pixels in cases.items():
+        for level in args.levels:
+            for label, mode, filters in MODES:
+                seconds, data = _time(
+                    lambda: raster.png_from_pixels(size, size, pixels, engine, mode, filters, level),
+                    args.repeat,
+                )
+                print(f"{case:<10}{label:<15}{level:>6}{len(data):>12}{seconds * 1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
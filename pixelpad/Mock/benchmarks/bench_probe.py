@@ -0,0 +1,84 @@
+"""Time header-only probing against Pillow for each upload format.
+
+"probe" is image_probe.probe_image on the upload head, "open" is Pillow's
+lazy Image.open (header parse only) and "decode" is imaging.decode_image,
+which the pipeline falls back to when the size cannot be probed. Formats
+other than PNG need Pillow to build the sample files.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raster  # noqa: E402
+from image_probe import PROBE_BYTES, probe_image  # noqa: E402
+from imaging import Image, decode_image  # noqa: E402
+
+FORMATS = (
+    ("png", "PNG", {}),
+    ("jpeg", "JPEG", {"quality": 90}),
+    ("webp", "WEBP", {"quality": 80}),
+    ("webp-lossless", "WEBP", {"lossless": True}),
+    ("bmp", "BMP", {}),
+)
+
+
+def _samples(size):
+    pixels = bytes(
+        value
+        for y in range(size)
+        for x in range(size)
+        for value in (x * 255 // size, y * 255 // size, (x ^ y) & 255, 255)
+    )
+    if Image is None:
+        return {"png": raster.png_from_pixels(size, size, pixels)}
+    image = Image.frombytes("RGBA", (size, size), pixels)
+    samples = {}
+    for name, pillow_format, options in FORMATS:
+        out = io.BytesIO()
+        converted = image if pillow_format in ("PNG", "WEBP") else image.convert("RGB")
+        converted.save(out, pillow_format, **options)
+        samples[name] = out.getvalue()
+    return samples
+
+
+def _time(call, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        call()
+    return (time.perf_counter() - started) / rounds
+
+
+def _pillow_open(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.size}x{args.size} samples")
+    print(f"{'format':<15}{'bytes':>9}{'probe us':>10}{'open us':>10}{'decode ms':>11}")
+    for name, data in _samples(args.size).items():
+        head = data[:PROBE_BYTES]
+        info = probe_image(head)
+        assert info and (info["width"], info["height"]) == (args.size, args.size), name
+        probe = _time(lambda: probe_image(head), args.rounds)
+        opened = _time(lambda: _pillow_open(data), args.rounds) if Image is not None else None
+        decode = _time(lambda: decode_image(data), max(1, args.rounds // 200))
+        print(
+            f"{name:<15}{len(data):>9}{probe * 1e6:>10.2f}"
+            f"{opened * 1e6 if opened is not None else float('nan'):>10.2f}"
+            f"{decode * 1000:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
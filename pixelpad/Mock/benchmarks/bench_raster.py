@@ -0,0 +1,54 @@
+"""Compare the pure-Python and NumPy raster engines used by /render."""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raster  # noqa: E402
+
+SIZES = (128, 512, 2048)
+PALETTE = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)]
+
+
+def _time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engines = raster.available_engines()
+    if "numpy" not in engines:
+        print("numpy is not installed; only the python engine will be measured")
+    print(f"{'case':<10}{'size':>8}" + "".join(f"{name:>12}" for name in engines))
+    for size in args.sizes:
+        cases = {
+            "banded": lambda engine: raster.banded_png(size, size, PALETTE, engine),
+            "isolated": lambda engine: raster.isolated_png(size, size, PALETTE[0], 7, engine),
+        }
+        for case, func in cases.items():
+            outputs = {}
+            timings = []
+            for engine in engines:
+                outputs[engine] = func(engine)
+                timings.append(_time(lambda: func(engine), args.repeat))
+            if len(set(outputs.values())) != 1:
+                raise SystemExit(f"engines disagree for {case} at {size}x{size}")
+            row = "".join(f"{seconds * 1000:>10.1f}ms" for seconds in timings)
+            print(f"{case:<10}{f'{size}x{size}':>8}{row}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare the memory and /render color lookup cost of session payloads.
+
+"dict" builds the nested dicts /process used to store (hex strings and rgba
+lists per color); "compact" builds MockSession objects. Memory is the
+tracemalloc delta for --counts live sessions, lookup is the cost of resolving
+every color of one session the way /render does.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_payload import ColorTable, MockSession, _rgba_from_hex  # noqa: E402
+
+COLORS = (
+    ("A1", 50, (255, 0, 0, 255)),
+    ("B2", 30, (0, 255, 0, 255)),
+    ("C3", 20, (0, 0, 255, 255)),
+)
+
+
+def _dict_session(session_id):
+    return {
+        "session_id": session_id,
+        "total_pixels": 1024,
+        "detected_colors": [
+            {
+                "id": color_id,
+                "count": count,
+                "rgba": list(rgba),
+                "hex": "#%02x%02x%02x" % rgba[:3],
+            }
+            for color_id, count, rgba in COLORS
+        ],
+        "settings_file": "MARD-24.json",
+        "width": 128,
+        "height": 128,
+    }
+
+
+def _compact_session(session_id):
+    colors = ColorTable(
+        [color_id for color_id, _count, _rgba in COLORS],
+        b"".join(bytes(rgba) for _id, _count, rgba in COLORS),
+        [count for _id, count, _rgba in COLORS],
+    )
+    return MockSession(session_id, "MARD-24.json", 128, 128, 1024, colors)
+
+
+def _dict_lookup(session):
+    colors = session["detected_colors"]
+    return [_rgba_from_hex(color["hex"]) for color in colors]
+
+
+def _compact_lookup(session):
+    return session.colors.colors()
+
+
+def _measure(build, ids):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = {session_id: build(session_id) for session_id in ids}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return sessions, used
+
+
+def _lookup(sessions, lookup, calls):
+    items = list(sessions.values())
+    started = time.perf_counter()
+    for index in range(calls):
+        lookup(items[index % len(items)])
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", default="10000,100000", help="comma-separated session counts")
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'sessions':>9} {'mode':<8}{'MiB':>8}{'B/session':>11}{'lookup us':>11}")
+    for count in (int(value) for value in args.counts.split(",")):
+        # Same ids on both sides; their strings are not counted.
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+        for name, build, lookup in (
+            ("dict", _dict_session, _dict_lookup),
+            ("compact", _compact_session, _compact_lookup),
+        ):
+            sessions, used = _measure(build, ids)
+            seconds = _lookup(sessions, lookup, args.calls)
+            print(
+                f"{count:>9} {name:<8}{used / 2**20:>8.1f}{used // count:>11}"
+                f"{seconds * 1e6:>11.2f}"
+            )
+            del sessions
+
+
+if __name__ == "__main__":
+    main()
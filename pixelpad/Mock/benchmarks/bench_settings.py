@@ -0,0 +1,75 @@
+"""Compare per-request settings handling with the palette registry.
+
+"scan" lists the directory and re-parses the named file on every call, which
+is what /settings/list and the pipeline did before the registry. "registry"
+serves both from the preloaded palettes and only stats the files.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from palette_registry import PaletteRegistry  # noqa: E402
+from pipeline import parse_palette  # noqa: E402
+
+
+def _write_settings(directory, files, colors, seed=3):
+    rng = random.Random(seed)
+    for index in range(files):
+        entries = [
+            {"id": f"C{slot}", "color": "#%06X" % rng.randrange(1 << 24)}
+            for slot in range(colors)
+        ]
+        with open(os.path.join(directory, f"PAL-{index:03d}.json"), "w", encoding="utf-8") as handle:
+            json.dump(entries, handle)
+
+
+def _scan(directory, name):
+    files = sorted(entry for entry in os.listdir(directory) if entry.lower().endswith(".json"))
+    with open(os.path.join(directory, name), "r", encoding="utf-8") as handle:
+        parse_palette(json.load(handle))
+    return files
+
+
+def _registry(registry, name):
+    files, _etag = registry.listing()
+    registry.get(name)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--colors", type=int, default=221)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        _write_settings(directory, args.files, args.colors)
+        registry = PaletteRegistry(directory)
+        started = time.perf_counter()
+        registry.load_all()
+        preload = time.perf_counter() - started
+        names = [f"PAL-{index % args.files:03d}.json" for index in range(args.calls)]
+
+        print(f"{args.files} files x {args.colors} colors, preload {preload * 1000:.1f} ms")
+        print(f"{'mode':<10}{'us/call':>10}")
+        for label, call in (
+            ("scan", lambda name: _scan(directory, name)),
+            ("registry", lambda name: _registry(registry, name)),
+        ):
+            started = time.perf_counter()
+            for name in names:
+                call(name)
+            seconds = time.perf_counter() - started
+            print(f"{label:<10}{seconds / args.calls * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
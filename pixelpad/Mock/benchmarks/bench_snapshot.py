@@ -0,0 +1,126 @@
+"""Measure cold start of the journal user store at large user counts.
+
+"json" is the old startup path: read the JSON data file (every user parsed,
+every key converted with int()) and index it in memory. "snapshot" opens
+the binary snapshot with JournalUserStore, which serves lookups from the
+mapped file. Each row reports the time to open, then to answer one get and
+one login for random users.
+
+Before timing, a data directory in the JSON-plus-journal format that came
+before snapshots is opened at the snapshot path to check that its users,
+journaled changes included, are carried over.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_store  # noqa: E402
+
+
+def _user(user_id):
+    phone = f"139{user_id:08d}"
+    return {
+        "id": user_id,
+        "phone": phone,
+        "username": f"User{phone[-4:]}",
+        "password": "secret",
+        "email": "",
+        "birthday": "2000-01-01",
+        "mbti": "",
+        "avatarMode": "logo",
+    }
+
+
+def _records(count):
+    for user_id in range(1, count + 1):
+        yield (user_id, *user_store._encode_user(_user(user_id)))
+
+
+def _write_json(path, count):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write('{"next_id":%d,"users":{' % (count + 1))
+        for user_id in range(1, count + 1):
+            if user_id > 1:
+                handle.write(",")
+            handle.write('"%d":%s' % (user_id, json.dumps(_user(user_id))))
+        handle.write("}}")
+
+
+def _open_json(path):
+    return user_store.MemoryUserStore(*user_store.read_snapshot(path))
+
+
+def _open_snapshot(path):
+    return user_store.JournalUserStore(path, flush_interval=0)
+
+
+def _check_migration(directory):
+    legacy_path = os.path.join(directory, "mock_data.json")
+    _write_json(legacy_path, 3)
+    with open(f"{legacy_path}.journal", "w", encoding="utf-8") as handle:
+        for entry in (
+            {"next_id": 4, "user": dict(_user(2), username="Renamed")},
+            {"next_id": 5, "user": _user(4)},
+        ):
+            handle.write(json.dumps(entry) + "\n")
+    snapshot_path = os.path.join(directory, "mock_data.snap")
+    for migrated_from in (legacy_path, None):
+        store = user_store.JournalUserStore(snapshot_path, seed={1: _user(1)}, flush_interval=0)
+        assert store.migrated_from == migrated_from
+        assert len(store) == 4 and store.next_id == 5
+        assert store.get(2)["username"] == "Renamed"
+        assert store.authenticate(_user(4)["phone"], "secret")["id"] == 4
+        store.close()
+
+
+def _cold_start(open_store, path, probes):
+    started = time.perf_counter()
+    store = open_store(path)
+    opened = time.perf_counter() - started
+    started = time.perf_counter()
+    for user_id in probes:
+        assert store.get(user_id)["id"] == user_id
+        assert store.authenticate(f"139{user_id:08d}", "secret")["id"] == user_id
+    lookups = (time.perf_counter() - started) / len(probes)
+    store.close()
+    return opened, lookups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--probes", type=int, default=1000)
+    parser.add_argument("--skip-json", action="store_true", help="only time the snapshot")
+    args = parser.parse_args()
+    rng = random.Random(7)
+    probes = [rng.randint(1, args.users) for _ in range(args.probes)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        _check_migration(directory)
+        print("migration from JSON data file and journal: ok")
+        snapshot_path = os.path.join(directory, "users.snap")
+        started = time.perf_counter()
+        user_store.write_user_snapshot(snapshot_path, _records(args.users), args.users + 1)
+        written = time.perf_counter() - started
+        print(f"{args.users} users, snapshot built and written in {written:.2f} s")
+        print(f"{'mode':<10}{'MiB':>8}{'open s':>9}{'get+login us':>14}")
+        rows = [("snapshot", _open_snapshot, snapshot_path)]
+        if not args.skip_json:
+            json_path = os.path.join(directory, "users.json")
+            _write_json(json_path, args.users)
+            rows.insert(0, ("json", _open_json, json_path))
+        for name, open_store, path in rows:
+            size = os.path.getsize(path)
+            opened, lookups = _cold_start(open_store, path, probes)
+            print(f"{name:<10}{size / 2**20:>8.1f}{opened:>9.3f}{lookups * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare buffered and streamed PNG encoding of large board-like renders.
+
+Reports time to the first IDAT byte, total time and peak traced memory for
+each image size. Buffered encoding should grow on every column; streamed
+encoding should keep time-to-first-byte and peak memory roughly flat.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raster  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# A 16-color bead board: one pseudo-random color per 8x8 cell.
+COLORS = [((index * 73) % 256, (index * 151) % 256, (index * 199) % 256, 255) for index in range(16)]
+CELL = 8
+
+
+def _cell_color(cx, cy):
+    return ((cx * 2654435761) ^ (cy * 40503)) >> 7 & 15
+
+
+def _draw(engine):
+    def draw(width, height, region):
+        x0, y0, out_width, out_height, step = region
+        if engine == "numpy":
+            xs = (x0 + np.arange(out_width, dtype=np.int64) * step) // CELL
+            ys = (y0 + np.arange(out_height, dtype=np.int64) * step) // CELL
+            slots = ((xs[None, :] * 2654435761) ^ (ys[:, None] * 40503)) >> 7 & 15
+            return np.asarray(COLORS, dtype=np.uint8)[slots]
+        table = [bytes(color) for color in COLORS]
+        rows = []
+        for row in range(out_height):
+            cy = (y0 + row * step) // CELL
+            rows.append(
+                b"".join(
+                    table[_cell_color((x0 + column * step) // CELL, cy)]
+                    for column in range(out_width)
+                )
+            )
+        return b"".join(rows)
+
+    return draw
+
+
+def _buffered(size, engine):
+    started = time.perf_counter()
+    pixels = _draw(engine)(size, size, raster.full_region(size, size))
+    data = raster.png_from_pixels(size, size, pixels, engine)
+    # The whole file is ready before its first byte can be sent.
+    first = time.perf_counter() - started
+    return first, time.perf_counter() - started, len(data)
+
+
+def _streamed(size, engine):
+    started = time.perf_counter()
+    draw = _draw(engine)
+    region = raster.full_region(size, size)
+    bands = (draw(size, size, band) for band in raster.region_bands(region))
+    first = None
+    total = 0
+    for piece in raster.stream_png(size, size, bands, COLORS, engine):
+        # The first piece is the header; time the first compressed bytes.
+        if first is None and b"IDAT" in piece[:8]:
+            first = time.perf_counter() - started
+        total += len(piece)
+    return first, time.perf_counter() - started, total
+
+
+def _measure(run, size, engine):
+    tracemalloc.start()
+    first, seconds, length = run(size, engine)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, seconds, length, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1024,2048,4096", help="comma-separated edge lengths")
+    parser.add_argument("--engine", choices=raster.available_engines(), default=None)
+    args = parser.parse_args()
+    engine = raster.resolve_engine(args.engine)
+
+    print(f"engine: {engine}")
+    print(f"{'size':>6} {'mode':<9}{'ttfb ms':>10}{'total ms':>10}{'bytes':>10}{'peak MiB':>10}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        for name, run in (("buffered", _buffered), ("streamed", _streamed)):
+            first, seconds, length, peak = _measure(run, size, engine)
+            print(
+                f"{size:>6} {name:<9}{first * 1000:>10.1f}{seconds * 1000:>10.1f}"
+                f"{length:>10}{peak / 2**20:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare one full /render of a color-mapped board with fetching it as tiles.
+
+Before timing, a tile covering the whole board is checked to be byte-for-byte
+the full render, with the same X-Render-Size. Both sides run with the render
+cache disabled, so every round draws and encodes every pixel.
+"""
+
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_backend  # noqa: E402
+from render_cache import RenderCache  # noqa: E402
+from session_payload import ColorTable  # noqa: E402
+
+from bench_compute_pool import _color_map_job  # noqa: E402
+
+
+def _render(port, fields):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.request(
+        "POST",
+        "/render",
+        urlencode(fields),
+        {"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    assert response.status == 200, body
+    return response.getheader("X-Render-Size"), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    function, job_args = _color_map_job(args.size)
+    entries, mapping = function(*job_args)
+    board = {"width": args.size, "height": args.size, "palette": entries, "mapping": mapping}
+    session_id = "bench-tiles"
+    mock_backend.SESSIONS.put(
+        session_id, {"board": board, "colors": ColorTable.from_entries(board["palette"])}
+    )
+    mock_backend.RENDER_CACHE = RenderCache(0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), mock_backend.MockHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        full = _render(port, {"session_id": session_id})
+        whole = _render(
+            port, {"session_id": session_id, "x": 0, "y": 0, "w": args.size, "h": args.size}
+        )
+        assert whole == full, "full-coverage tile differs from the full render"
+        print(f"full-coverage tile matches the full render ({full[0]})")
+
+        columns = -(-args.size // args.tile_size)
+        tiles = [f"0/{column}/{row}" for row in range(columns) for column in range(columns)]
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            _render(port, {"session_id": session_id})
+        single = (time.perf_counter() - started) / args.rounds
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for tile in tiles:
+                _render(port, {"session_id": session_id, "tile": tile, "tile_size": args.tile_size})
+        tiled = (time.perf_counter() - started) / args.rounds
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"{args.size}x{args.size} board, {len(tiles)} tiles of {args.tile_size}")
+    print(f"{'mode':<8}{'ms/round':>10}")
+    print(f"{'full':<8}{single * 1000:>10.1f}")
+    print(f"{'tiles':<8}{tiled * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
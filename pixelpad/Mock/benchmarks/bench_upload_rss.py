@@ -0,0 +1,104 @@
+"""Peak RSS of parsing a multipart upload: streaming parser versus full-body BytesParser."""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+MOCK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOUNDARY = "----pixelpad-bench"
+SIZES_MB = (1, 8, 32, 128)
+
+
+def _write_body(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as handle:
+        handle.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="settings_file"\r\n\r\n'
+            f"MARD-24.json\r\n--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="upload.png"\r\n'
+            "Content-Type: image/png\r\n\r\n".encode("utf-8")
+        )
+        remaining = size
+        while remaining > 0:
+            chunk = block[: min(len(block), remaining)]
+            handle.write(chunk)
+            remaining -= len(chunk)
+        handle.write(f"\r\n--{BOUNDARY}--\r\n".encode("utf-8"))
+
+
+def _parse_legacy(handle, length):
+    from email import policy
+    from email.parser import BytesParser
+
+    body = handle.read(length)
+    header = f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n\r\n".encode()
+    message = BytesParser(policy=policy.default).parsebytes(header + body)
+    sizes = []
+    for part in message.iter_parts():
+        payload = part.get_payload(decode=True) or b""
+        sizes.append(len(payload))
+    return sizes
+
+
+def _parse_streaming(handle, length):
+    sys.path.insert(0, MOCK_DIR)
+    from multipart import parse_multipart
+
+    data, files = parse_multipart(
+        handle,
+        f"multipart/form-data; boundary={BOUNDARY}",
+        length,
+        max_body_bytes=0,
+    )
+    sizes = [len(value) for value in data.values()] + [f.size for f in files.values()]
+    for upload in files.values():
+        upload.close()
+    return sizes
+
+
+def _child(parser_name, path):
+    length = os.path.getsize(path)
+    parse = _parse_legacy if parser_name == "legacy" else _parse_streaming
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with open(path, "rb") as handle:
+        parse(handle, length)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{baseline} {peak} {elapsed}")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        _child(sys.argv[2], sys.argv[3])
+        return
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=list(SIZES_MB))
+    args = parser.parse_args()
+
+    print(f"{'upload':>8}{'parser':>11}{'peak rss':>12}{'delta':>12}{'time':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_mb in args.sizes_mb:
+            path = os.path.join(workdir, f"body-{size_mb}.bin")
+            _write_body(path, size_mb * 1024 * 1024)
+            for parser_name in ("legacy", "streaming"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", parser_name, path],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.split()
+                baseline, peak, elapsed = int(output[0]), int(output[1]), float(output[2])
+                print(
+                    f"{size_mb:>6}MB{parser_name:>11}{peak / 1024:>10.1f}MB"
+                    f"{(peak - baseline) / 1024:>10.1f}MB{elapsed * 1000:>8.0f}ms"
+                )
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Register and log in many users against each user store backend.
+
+The "legacy" row reproduces the old behavior: a linear login scan and a full
+indent=2 rewrite of the data file on every registration. Because that cost
+grows with the user count, it runs on --legacy-users only.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_store  # noqa: E402
+
+
+def _user(user_id, phone):
+    return {
+        "id": user_id,
+        "phone": phone,
+        "username": f"User{phone[-4:]}",
+        "password": "secret",
+        "email": "",
+        "birthday": "2000-01-01",
+        "mbti": "",
+        "avatarMode": "logo",
+    }
+
+
+def _phones(count):
+    return [f"139{index:08d}" for index in range(count)]
+
+
+class _LegacyStore:
+    def __init__(self, path):
+        self.path = path
+        self.users = {}
+        self.next_id = 1
+
+    def create(self, build):
+        user = build(self.next_id)
+        self.users[self.next_id] = user
+        self.next_id += 1
+        payload = {"next_id": self.next_id, "users": {str(k): v for k, v in self.users.items()}}
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as handle:
+            json.dump(payload, handle, ensure_ascii=False, indent=2)
+        os.replace(f"{self.path}.tmp", self.path)
+        return user
+
+    def authenticate(self, phone, password):
+        for user in self.users.values():
+            if user["phone"] == phone and user["password"] == password:
+                return user
+        return None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def _run(name, store, count, logins):
+    phones = _phones(count)
+    started = time.perf_counter()
+    for phone in phones:
+        store.create(lambda user_id, phone=phone: _user(user_id, phone))
+    register_seconds = time.perf_counter() - started
+    step = max(1, count // logins)
+    sample = phones[::step][:logins]
+    started = time.perf_counter()
+    for phone in sample:
+        if store.authenticate(phone, "secret") is None:
+            raise SystemExit(f"{name}: login failed for {phone}")
+    login_seconds = time.perf_counter() - started
+    store.flush()
+    stats = store.stats()
+    store.close()
+    print(
+        f"{name:<16}{count:>9}{count / register_seconds:>14.0f}"
+        f"{len(sample) / login_seconds:>14.0f}{stats.get('fsyncs', '-'):>8}"
+        f"{stats.get('compactions', '-'):>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--logins", type=int, default=100_000)
+    parser.add_argument("--legacy-users", type=int, default=2_000)
+    parser.add_argument(
+        "--sync-users", type=int, default=5_000, help="users for the fsync-per-change run"
+    )
+    args = parser.parse_args()
+
+    print(f"{'backend':<16}{'users':>9}{'register/s':>14}{'login/s':>14}{'fsyncs':>8}{'compact':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        _run(
+            "legacy",
+            _LegacyStore(os.path.join(directory, "legacy.json")),
+            args.legacy_users,
+            min(args.logins, args.legacy_users),
+        )
+        _run("memory", user_store.create_user_store("memory"), args.users, args.logins)
+        _run(
+            "journal",
+            user_store.create_user_store("journal", os.path.join(directory, "journal.json")),
+            args.users,
+            args.logins,
+        )
+        _run(
+            "journal sync",
+            user_store.create_user_store(
+                "journal", os.path.join(directory, "sync.json"), flush_interval=0
+            ),
+            args.sync_users,
+            min(args.logins, args.sync_users),
+        )
+        _run(
+            "sqlite",
+            user_store.create_user_store("sqlite", os.path.join(directory, "users.sqlite3")),
+            args.users,
+            args.logins,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Bytes on the wire and serialization time per pipeline endpoint and response format."""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire  # noqa: E402
+
+
+def _payloads(size, rng):
+    pixels = size * size
+    # Pixel-art-like content: a few dozen colors in horizontal runs.
+    colors = [bytes(rng.randrange(256) for _ in range(3)) + b"\xff" for _ in range(24)]
+    rgba = bytearray()
+    mapping = bytearray()
+    while len(rgba) < pixels * 4:
+        slot = rng.randrange(len(colors))
+        run = rng.randint(1, 12)
+        rgba += colors[slot] * run
+        mapping += (slot + 1).to_bytes(2, "little") * run
+    rgba = bytes(rgba[: pixels * 4])
+    mapping = bytes(mapping[: pixels * 2])
+    rle = b"".join(rng.randint(1, 40).to_bytes(4, "little") for _ in range(size * 2))
+    palette = [
+        {"idx": i + 1, "id": f"M{i}", "count": 1, "rgba": list(c), "hex": "#" + c[:3].hex()}
+        for i, c in enumerate(colors)
+    ]
+    base = {"session_id": "bench", "width": size, "height": size}
+    return {
+        "/perfect_pixel": (base, {"rgba_u8": rgba}),
+        "/remove_background": (
+            dict(base, bg_mask_start=True, preview_padding=[0, 0, 0, 0]),
+            {"bg_mask_rle_u32le": rle},
+        ),
+        "/color_map": (
+            dict(base, palette=palette, preview_padding=[0, 0, 0, 0]),
+            {"mapping_u16le": mapping},
+        ),
+    }
+
+
+def _as_json(header, sections):
+    payload = dict(header)
+    for name, blob in sections.items():
+        payload[f"{name}_base64"] = base64.b64encode(blob).decode("ascii")
+    return json.dumps(payload).encode("utf-8")
+
+
+def _formats():
+    formats = [("json", _as_json, None), ("frame", wire.encode_frame, None)]
+    for encoding in wire.available_encodings():
+        formats.append((f"json+{encoding}", _as_json, encoding))
+        formats.append((f"frame+{encoding}", wire.encode_frame, encoding))
+    return formats
+
+
+def _measure(build, encoding, header, sections, repeat):
+    best = None
+    data = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = build(header, sections)
+        if encoding:
+            data = wire.compress(data, encoding)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(data), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(11)
+
+    for size in args.sizes:
+        print(f"grid {size}x{size}")
+        for endpoint, (header, sections) in _payloads(size, rng).items():
+            print(f"  {endpoint}")
+            for name, build, encoding in _formats():
+                size_bytes, seconds = _measure(build, encoding, header, sections, args.repeat)
+                print(f"    {name:<14}{size_bytes:>12} B{seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
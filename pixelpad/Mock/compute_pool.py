@@ -0,0 +1,151 @@
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+DEFAULT_SHARE_BYTES = 64 * 1024
+# Jobs that may wait for a worker, per worker, before callers get ComputeBusy.
+DEFAULT_QUEUE_PER_WORKER = 2
+
+
+class ComputeBusy(RuntimeError):
+    def __init__(self, retry_after):
+        super().__init__("compute pool is saturated")
+        self.retry_after = retry_after
+
+
+class _Shared:
+    # Stands in for a bytes value that was copied into a shared memory block.
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+def _share(value, blocks, min_bytes):
+    if isinstance(value, (bytes, bytearray)) and len(value) >= min_bytes:
+        block = shared_memory.SharedMemory(create=True, size=len(value))
+        block.buf[: len(value)] = value
+        blocks.append(block)
+        return _Shared(block.name, len(value))
+    if isinstance(value, tuple):
+        return tuple(_share(item, blocks, min_bytes) for item in value)
+    if isinstance(value, list):
+        return [_share(item, blocks, min_bytes) for item in value]
+    if isinstance(value, dict):
+        return {key: _share(item, blocks, min_bytes) for key, item in value.items()}
+    return value
+
+
+def _unshare(value, unlink=False, sizes=None):
+    if isinstance(value, _Shared):
+        block = shared_memory.SharedMemory(name=value.name)
+        try:
+            if sizes is not None:
+                sizes.append(value.size)
+            return bytes(block.buf[: value.size])
+        finally:
+            block.close()
+            if unlink:
+                block.unlink()
+    if isinstance(value, tuple):
+        return tuple(_unshare(item, unlink, sizes) for item in value)
+    if isinstance(value, list):
+        return [_unshare(item, unlink, sizes) for item in value]
+    if isinstance(value, dict):
+        return {key: _unshare(item, unlink, sizes) for key, item in value.items()}
+    return value
+
+
+def _invoke(fn, args, min_bytes):
+    # Runs in a worker. Large results go back through shared memory; the
+    # caller copies them out and unlinks the blocks.
+    result = fn(*_unshare(args))
+    blocks = []
+    shared = _share(result, blocks, min_bytes)
+    for block in blocks:
+        block.close()
+    return shared
+
+
+def _context():
+    # forkserver children do not inherit the server's threads or locks.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+class ComputePool:
+    """Runs CPU-bound calls in worker processes.
+
+    ``run(fn, *args)`` blocks the calling thread until the result is ready.
+    bytes values of at least ``share_min_bytes`` in the arguments or the
+    result (including inside tuples, lists and dicts) travel through
+    ``multiprocessing.shared_memory`` instead of the executor's pipe. At most
+    ``workers + queue_size`` calls are in flight; past that ``run`` raises
+    :class:`ComputeBusy`. With ``workers=0`` calls run inline.
+    """
+
+    def __init__(self, workers=0, queue_size=None, share_min_bytes=DEFAULT_SHARE_BYTES):
+        self.workers = max(0, int(workers))
+        if queue_size is None:
+            queue_size = self.workers * DEFAULT_QUEUE_PER_WORKER
+        self.max_pending = self.workers + max(0, int(queue_size))
+        self.share_min_bytes = share_min_bytes
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Moving average of job seconds, used to suggest a Retry-After.
+        self._job_seconds = 0.0
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0, "shared_bytes": 0}
+        self._executor = None
+        if self.workers:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=_context())
+
+    def run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise ComputeBusy(self._retry_after())
+            self._pending += 1
+            self._counters["submitted"] += 1
+        started = time.perf_counter()
+        blocks = []
+        sizes = []
+        try:
+            shared = _share(args, blocks, self.share_min_bytes)
+            future = self._executor.submit(_invoke, fn, shared, self.share_min_bytes)
+            return _unshare(future.result(), unlink=True, sizes=sizes)
+        finally:
+            for block in blocks:
+                sizes.append(block.size)
+                block.close()
+                block.unlink()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._counters["completed"] += 1
+                self._counters["shared_bytes"] += sum(sizes)
+                self._job_seconds += (elapsed - self._job_seconds) * 0.1
+
+    def _retry_after(self):
+        # Seconds until the queue has likely drained, rounded up.
+        return max(1, math.ceil(self._job_seconds * self._pending / max(1, self.workers)))
+
+    def stats(self):
+        with self._lock:
+            payload = dict(self._counters)
+            payload.update(
+                {
+                    "workers": self.workers,
+                    "max_pending": self.max_pending,
+                    "pending": self._pending,
+                }
+            )
+        return payload
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,118 @@
+import struct
+
+from raster import PNG_SIGNATURE
+
+# How much of an upload to keep for probing. Enough for PNG, WebP and BMP
+# headers and for JPEG files whose EXIF and ICC segments fit before the frame
+# header.
+PROBE_BYTES = 64 * 1024
+
+# JPEG start-of-frame markers: every SOFn except DHT (C4), JPG (C8) and DAC (CC).
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers that carry no length field.
+_JPEG_STANDALONE = frozenset(range(0xD0, 0xD9)) | {0x01}
+
+
+def _info(width, height, image_format, alpha):
+    if width <= 0 or height <= 0:
+        return None
+    return {"width": width, "height": height, "format": image_format, "alpha": alpha}
+
+
+def _probe_png(data):
+    if len(data) < 33 or data[12:16] != b"IHDR":
+        return None
+    width, height, _depth, color_type = struct.unpack(">IIBB", data[16:26])
+    alpha = color_type in (4, 6)
+    # A tRNS chunk, if any, sits between IHDR and the first IDAT.
+    offset = 33
+    while not alpha and offset + 8 <= len(data):
+        length, tag = struct.unpack(">I4s", data[offset : offset + 8])
+        if tag in (b"IDAT", b"IEND"):
+            break
+        alpha = tag == b"tRNS"
+        offset += 12 + length
+    return _info(width, height, "png", alpha)
+
+
+def _probe_jpeg(data):
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1  # fill byte
+            continue
+        if marker in _JPEG_STANDALONE:
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            return None  # end of image or scan data before any frame header
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        if marker in _JPEG_SOF:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+            return _info(width, height, "jpeg", False)
+        offset += 2 + length
+    return None
+
+
+def _probe_webp(data):
+    if len(data) < 30:
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        if data[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", data[26:30])
+        return _info(width & 0x3FFF, height & 0x3FFF, "webp", False)
+    if chunk == b"VP8L":
+        if data[20] != 0x2F:
+            return None
+        (bits,) = struct.unpack("<I", data[21:25])
+        width = (bits & 0x3FFF) + 1
+        height = (bits >> 14 & 0x3FFF) + 1
+        return _info(width, height, "webp", bool(bits >> 28 & 1))
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return _info(width, height, "webp", bool(data[20] & 0x10))
+    return None
+
+
+def _probe_bmp(data):
+    if len(data) < 26:
+        return None
+    (header_size,) = struct.unpack("<I", data[14:18])
+    if header_size == 12:
+        width, height, _planes, bits = struct.unpack("<HHHH", data[18:26])
+        return _info(width, height, "bmp", False)
+    if header_size < 40 or len(data) < 34:
+        return None
+    width, height, _planes, bits, compression = struct.unpack("<iiHHI", data[18:34])
+    alpha = False
+    # BI_BITFIELDS / BI_ALPHABITFIELDS with a non-zero alpha mask.
+    if bits == 32 and compression in (3, 6) and header_size >= 56 and len(data) >= 70:
+        alpha = struct.unpack("<I", data[66:70])[0] != 0
+    # A negative height marks a top-down bitmap.
+    return _info(width, abs(height), "bmp", alpha)
+
+
+def probe_image(data):
+    """Read size, format and alpha from the first bytes of an image.
+
+    Returns ``{"width", "height", "format", "alpha"}`` for PNG, JPEG, WebP
+    and BMP, or None when the format is unknown or ``data`` stops before the
+    fields are reached. Pixels are never decoded.
+    """
+    if data[:8] == PNG_SIGNATURE:
+        return _probe_png(data)
+    if data[:2] == b"\xff\xd8":
+        return _probe_jpeg(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _probe_webp(data)
+    if data[:2] == b"BM":
+        return _probe_bmp(data)
+    return None
@@ -0,0 +1,246 @@
+import io
+import struct
+import zlib
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; PNG uploads decode without it.
+    Image = None
+
+from raster import PNG_SIGNATURE
+
+MAX_DECODE_PIXELS = 40_000_000
+
+_ADAM7 = (
+    (0, 0, 8, 8),
+    (4, 0, 8, 8),
+    (0, 4, 4, 8),
+    (2, 0, 4, 4),
+    (0, 2, 2, 4),
+    (1, 0, 2, 2),
+    (0, 1, 1, 2),
+)
+
+
+class ImageDecodeError(ValueError):
+    pass
+
+
+def decode_image(payload):
+    """Decode an uploaded image to ``(width, height, rgba_bytes)``.
+
+    Pillow handles every format it knows when installed; otherwise only PNG
+    is supported.
+    """
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(payload)) as image:
+                image.load()
+                if image.width * image.height > MAX_DECODE_PIXELS:
+                    raise ImageDecodeError("image too large")
+                rgba = image.convert("RGBA")
+                return rgba.width, rgba.height, rgba.tobytes()
+        except ImageDecodeError:
+            raise
+        except Exception as exc:
+            raise ImageDecodeError(f"cannot decode image: {exc}") from exc
+    if payload[:8] != PNG_SIGNATURE:
+        raise ImageDecodeError("only PNG uploads are supported without Pillow")
+    return decode_png(payload)
+
+
+def _read_chunks(payload):
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(payload):
+        length, tag = struct.unpack(">I4s", payload[offset : offset + 8])
+        data = payload[offset + 8 : offset + 8 + length]
+        if len(data) != length:
+            raise ImageDecodeError("truncated PNG chunk")
+        yield tag, data
+        if tag == b"IEND":
+            return
+        offset += 12 + length
+
+
+def _unfilter(raw, offset, rows, row_bytes, bpp):
+    out = bytearray(rows * row_bytes)
+    prior = bytearray(row_bytes)
+    for y in range(rows):
+        filter_type = raw[offset]
+        line = bytearray(raw[offset + 1 : offset + 1 + row_bytes])
+        if len(line) != row_bytes:
+            raise ImageDecodeError("truncated PNG image data")
+        offset += 1 + row_bytes
+        if filter_type == 1:
+            for i in range(bpp, row_bytes):
+                line[i] = (line[i] + line[i - bpp]) & 0xFF
+        elif filter_type == 2:
+            for i in range(row_bytes):
+                line[i] = (line[i] + prior[i]) & 0xFF
+        elif filter_type == 3:
+            for i in range(row_bytes):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prior[i]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for i in range(row_bytes):
+                a = line[i - bpp] if i >= bpp else 0
+                b = prior[i]
+                c = prior[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    predictor = a
+                elif pb <= pc:
+                    predictor = b
+                else:
+                    predictor = c
+                line[i] = (line[i] + predictor) & 0xFF
+        elif filter_type != 0:
+            raise ImageDecodeError(f"unknown PNG filter {filter_type}")
+        out[y * row_bytes : (y + 1) * row_bytes] = line
+        prior = line
+    return out, offset
+
+
+def _samples(rows, width, height, depth, channels):
+    # Returns one list of 0-255 samples per pixel row.
+    row_bytes = (width * channels * depth + 7) // 8
+    result = []
+    for y in range(height):
+        line = rows[y * row_bytes : (y + 1) * row_bytes]
+        if depth == 8:
+            result.append(line)
+        elif depth == 16:
+            result.append(line[0::2])
+        else:
+            mask = (1 << depth) - 1
+            values = bytearray()
+            for byte in line:
+                for shift in range(8 - depth, -1, -depth):
+                    values.append((byte >> shift) & mask)
+            result.append(values[: width * channels])
+    return result
+
+
+def _to_rgba(samples, width, color_type, depth, palette, transparency, raw16=None):
+    scale = 255 // ((1 << depth) - 1) if depth < 8 else 1
+    out = bytearray(width * 4)
+    if color_type == 6:
+        out[:] = samples[: width * 4]
+    elif color_type == 2:
+        out[0::4] = samples[0::3]
+        out[1::4] = samples[1::3]
+        out[2::4] = samples[2::3]
+        out[3::4] = b"\xff" * width
+        if transparency is not None:
+            for x in range(width):
+                if tuple(raw16[x * 3 : x * 3 + 3]) == transparency:
+                    out[x * 4 + 3] = 0
+    elif color_type == 0:
+        for x in range(width):
+            value = samples[x] * scale
+            out[x * 4 : x * 4 + 4] = bytes((value, value, value, 255))
+            if transparency is not None and raw16[x] == transparency[0]:
+                out[x * 4 + 3] = 0
+    elif color_type == 4:
+        out[0::4] = samples[0::2]
+        out[1::4] = samples[0::2]
+        out[2::4] = samples[0::2]
+        out[3::4] = samples[1::2]
+    elif color_type == 3:
+        for x in range(width):
+            index = samples[x]
+            if index >= len(palette):
+                raise ImageDecodeError("PNG palette index out of range")
+            out[x * 4 : x * 4 + 4] = palette[index]
+    return out
+
+
+def _raw_values(rows, width, height, depth, channels):
+    # Unscaled sample values, needed to compare against tRNS keys.
+    if depth == 16:
+        row_bytes = width * channels * 2
+        return [
+            struct.unpack(f">{width * channels}H", rows[y * row_bytes : (y + 1) * row_bytes])
+            for y in range(height)
+        ]
+    return _samples(rows, width, height, depth, channels)
+
+
+def decode_png(payload):
+    header = None
+    palette = []
+    alpha = b""
+    transparency = None
+    idat = []
+    for tag, data in _read_chunks(payload):
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", data)
+        elif tag == b"PLTE":
+            palette = [bytearray(data[i : i + 3]) + b"\xff" for i in range(0, len(data) - 2, 3)]
+        elif tag == b"tRNS":
+            alpha = data
+        elif tag == b"IDAT":
+            idat.append(data)
+    if header is None:
+        raise ImageDecodeError("missing PNG header")
+    width, height, depth, color_type, _compression, _filter, interlace = header
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color_type)
+    if channels is None or depth not in (1, 2, 4, 8, 16):
+        raise ImageDecodeError("unsupported PNG color type or bit depth")
+    if width <= 0 or height <= 0 or width * height > MAX_DECODE_PIXELS:
+        raise ImageDecodeError("unsupported PNG dimensions")
+    if color_type == 3:
+        for index, value in enumerate(alpha[: len(palette)]):
+            palette[index][3] = value
+    elif alpha and color_type in (0, 2):
+        count = 1 if color_type == 0 else 3
+        transparency = struct.unpack(f">{count}H", alpha[: count * 2])
+    try:
+        raw = zlib.decompress(b"".join(idat))
+    except zlib.error as exc:
+        raise ImageDecodeError("corrupt PNG image data") from exc
+
+    bpp = max(1, channels * depth // 8)
+    if interlace:
+        passes = []
+        offset = 0
+        for x0, y0, dx, dy in _ADAM7:
+            pass_width = (width - x0 + dx - 1) // dx
+            pass_height = (height - y0 + dy - 1) // dy
+            if pass_width <= 0 or pass_height <= 0:
+                passes.append(None)
+                continue
+            row_bytes = (pass_width * channels * depth + 7) // 8
+            rows, offset = _unfilter(raw, offset, pass_height, row_bytes, bpp)
+            passes.append((pass_width, pass_height, rows))
+    else:
+        row_bytes = (width * channels * depth + 7) // 8
+        rows, _ = _unfilter(raw, 0, height, row_bytes, bpp)
+        passes = [(width, height, rows)]
+
+    rgba = bytearray(width * height * 4)
+    layout = _ADAM7 if interlace else ((0, 0, 1, 1),)
+    for (x0, y0, dx, dy), entry in zip(layout, passes):
+        if entry is None:
+            continue
+        pass_width, pass_height, rows = entry
+        sample_rows = _samples(rows, pass_width, pass_height, depth, channels)
+        raw_rows = (
+            _raw_values(rows, pass_width, pass_height, depth, channels)
+            if transparency is not None
+            else [None] * pass_height
+        )
+        for py in range(pass_height):
+            line = _to_rgba(
+                sample_rows[py], pass_width, color_type, depth, palette, transparency, raw_rows[py]
+            )
+            y = y0 + py * dy
+            if dx == 1:
+                start = y * width * 4
+                rgba[start : start + width * 4] = line
+                continue
+            for px in range(pass_width):
+                x = x0 + px * dx
+                rgba[(y * width + x) * 4 : (y * width + x) * 4 + 4] = line[px * 4 : px * 4 + 4]
+    return width, height, bytes(rgba)
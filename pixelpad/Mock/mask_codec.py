@@ -0,0 +1,132 @@
+import struct
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the byte-scan fallback gives the same output.
+    np = None
+
+_TO_BITS = bytes([0] + [1] * 255)
+DEFAULT_TOLERANCE = 24
+
+
+def _normalize(mask):
+    return bytes(mask).translate(_TO_BITS)
+
+
+def encode_rle(mask):
+    """Encode a per-pixel mask as ``(u32le run lengths, start value)``.
+
+    Runs alternate between the start value and its inverse, which is the
+    layout ``decodeRleMask`` in the app's pixel_codec.dart reads back.
+    """
+    if not len(mask):
+        return b"", False
+    if np is not None:
+        bits = np.frombuffer(_normalize(mask), dtype=np.uint8)
+        edges = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+        bounds = np.concatenate(([0], edges, [len(bits)]))
+        return np.diff(bounds).astype("<u4").tobytes(), bool(bits[0])
+    bits = _normalize(mask)
+    runs = []
+    position = 0
+    current = bits[0]
+    while position < len(bits):
+        following = bits.find(b"\x00" if current else b"\x01", position)
+        if following < 0:
+            following = len(bits)
+        runs.append(following - position)
+        position = following
+        current ^= 1
+    return struct.pack(f"<{len(runs)}I", *runs), bool(bits[0])
+
+
+def decode_rle(data, start, total):
+    """Inverse of :func:`encode_rle` with the same clamping rules as the app."""
+    if total <= 0:
+        return b""
+    count = len(data) // 4
+    if np is not None:
+        runs = np.frombuffer(data[: count * 4], dtype="<u4").astype(np.int64)
+        values = np.arange(count, dtype=np.uint8) % 2 ^ (1 if start else 0)
+        mask = np.repeat(values.astype(np.uint8), runs)[:total]
+        if len(mask) < total:
+            mask = np.concatenate((mask, np.zeros(total - len(mask), dtype=np.uint8)))
+        return mask.tobytes()
+    mask = bytearray()
+    current = 1 if start else 0
+    for (length,) in struct.iter_unpack("<I", data[: count * 4]):
+        if len(mask) >= total:
+            break
+        mask += (b"\x01" if current else b"\x00") * min(length, total - len(mask))
+        current ^= 1
+    mask += bytes(total - len(mask))
+    return bytes(mask)
+
+
+def _color_distance(rgba, offset, reference):
+    return max(
+        abs(rgba[offset] - reference[0]),
+        abs(rgba[offset + 1] - reference[1]),
+        abs(rgba[offset + 2] - reference[2]),
+    )
+
+
+def detect_background(width, height, rgba, tolerance=DEFAULT_TOLERANCE, alpha_threshold=128):
+    """Flood fill from the borders and return a per-pixel background mask.
+
+    Transparent pixels always count as background. Opaque pixels join the fill
+    when every channel is within ``tolerance`` of the most common opaque
+    border color, so the subject is kept even when it shares that color inside.
+    """
+    total = width * height
+    if total == 0:
+        return b""
+    border = set()
+    for x in range(width):
+        border.add(x)
+        border.add((height - 1) * width + x)
+    for y in range(height):
+        border.add(y * width)
+        border.add(y * width + width - 1)
+    counts = {}
+    for pixel in border:
+        offset = pixel * 4
+        if rgba[offset + 3] >= alpha_threshold:
+            key = bytes(rgba[offset : offset + 3])
+            counts[key] = counts.get(key, 0) + 1
+    reference = max(counts, key=counts.get) if counts else None
+
+    def passable(pixel):
+        offset = pixel * 4
+        if rgba[offset + 3] < alpha_threshold:
+            return True
+        return reference is not None and _color_distance(rgba, offset, reference) <= tolerance
+
+    mask = bytearray(total)
+    queue = deque()
+    for pixel in border:
+        if passable(pixel):
+            mask[pixel] = 1
+            queue.append(pixel)
+    while queue:
+        pixel = queue.popleft()
+        x = pixel % width
+        neighbors = []
+        if x > 0:
+            neighbors.append(pixel - 1)
+        if x < width - 1:
+            neighbors.append(pixel + 1)
+        if pixel >= width:
+            neighbors.append(pixel - width)
+        if pixel + width < total:
+            neighbors.append(pixel + width)
+        for neighbor in neighbors:
+            if not mask[neighbor] and passable(neighbor):
+                mask[neighbor] = 1
+                queue.append(neighbor)
+    # Interior transparent holes are background too, even when not connected.
+    for pixel, alpha in enumerate(rgba[3::4]):
+        if alpha < alpha_threshold:
+            mask[pixel] = 1
+    return bytes(mask)
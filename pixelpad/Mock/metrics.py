@@ -0,0 +1,233 @@
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+
+    def samples(self, name, labels):
+        # Prometheus buckets are cumulative and end with le="+Inf".
+        running = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            running += count
+            yield f"{name}_bucket", {**labels, "le": str(bound)}, running
+        yield f"{name}_sum", labels, self.total
+        yield f"{name}_count", labels, running
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class RequestTimer:
+    """Collects phase timings for one request; created by :meth:`Metrics.start`."""
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.bytes_in = 0
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class Metrics:
+    """Thread-safe request counters and latency histograms.
+
+    Latency is kept per endpoint and, for the named phases (parse, compute,
+    encode, write), per endpoint and phase. ``render`` produces the Prometheus
+    text exposition format.
+    """
+
+    def __init__(self, prefix="pixelpad"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._durations = {}
+        self._phases = {}
+        self._bytes_in = {}
+        self._bytes_out = {}
+        self._in_flight = {}
+
+    def start(self, endpoint, method):
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+        return RequestTimer(endpoint, method)
+
+    def finish(self, timer, status, bytes_out):
+        elapsed = time.perf_counter() - timer.started
+        endpoint = timer.endpoint
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+            key = (endpoint, timer.method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._durations.setdefault(endpoint, Histogram()).observe(elapsed)
+            for phase, seconds in timer.phases.items():
+                self._phases.setdefault((endpoint, phase), Histogram()).observe(seconds)
+            self._bytes_in[endpoint] = self._bytes_in.get(endpoint, 0) + timer.bytes_in
+            self._bytes_out[endpoint] = self._bytes_out.get(endpoint, 0) + bytes_out
+
+    def render(self, gauges=None):
+        """Return the exposition text; ``gauges`` adds ``{name: (help, value)}``."""
+        p = self.prefix
+        families = []
+        with self._lock:
+            families.append(
+                (
+                    f"{p}_requests_total",
+                    "counter",
+                    "Requests handled by endpoint, method and status.",
+                    [
+                        (f"{p}_requests_total", {"endpoint": e, "method": m, "status": s}, n)
+                        for (e, m, s), n in sorted(self._requests.items())
+                    ],
+                )
+            )
+            families.append(
+                (
+                    f"{p}_request_duration_seconds",
+                    "histogram",
+                    "Time from parsed request line to finished response.",
+                    [
+                        sample
+                        for endpoint, histogram in sorted(self._durations.items())
+                        for sample in histogram.samples(
+                            f"{p}_request_duration_seconds", {"endpoint": endpoint}
+                        )
+                    ],
+                )
+            )
+            families.append(
+                (
+                    f"{p}_phase_duration_seconds",
+                    "histogram",
+                    "Time spent per request in each phase (parse, compute, encode, write).",
+                    [
+                        sample
+                        for (endpoint, phase), histogram in sorted(self._phases.items())
+                        for sample in histogram.samples(
+                            f"{p}_phase_duration_seconds", {"endpoint": endpoint, "phase": phase}
+                        )
+                    ],
+                )
+            )
+            for name, help_text, values in (
+                ("request_bytes_total", "Request body bytes received.", self._bytes_in),
+                ("response_bytes_total", "Response bytes written, headers included.", self._bytes_out),
+            ):
+                families.append(
+                    (
+                        f"{p}_{name}",
+                        "counter",
+                        help_text,
+                        [(f"{p}_{name}", {"endpoint": e}, n) for e, n in sorted(values.items())],
+                    )
+                )
+            families.append(
+                (
+                    f"{p}_requests_in_flight",
+                    "gauge",
+                    "Requests currently being handled.",
+                    [
+                        (f"{p}_requests_in_flight", {"endpoint": e}, n)
+                        for e, n in sorted(self._in_flight.items())
+                    ],
+                )
+            )
+        for name, (help_text, value) in (gauges or {}).items():
+            families.append((f"{p}_{name}", "gauge", help_text, [(f"{p}_{name}", {}, value)]))
+
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class CountingWriter:
+    """Wraps a handler's wfile and counts the bytes written through it."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class RequestProfiler:
+    """Profiles every ``every``-th request with cProfile and dumps it to ``directory``.
+
+    Only one request is profiled at a time; if a sampled request arrives while
+    another is being profiled it runs unprofiled.
+    """
+
+    def __init__(self, every, directory):
+        self.every = max(1, int(every))
+        self.directory = directory
+        self._count = 0
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def maybe_profile(self, label):
+        with self._lock:
+            self._count += 1
+            sequence = self._count
+        if sequence % self.every or not self._active.acquire(blocking=False):
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+            name = re.sub(r"[^A-Za-z0-9]+", "_", label()).strip("_") or "request"
+            profile.dump_stats(
+                os.path.join(self.directory, f"{int(time.time() * 1000)}-{sequence:06d}-{name}.prof")
+            )
+        finally:
+            self._active.release()
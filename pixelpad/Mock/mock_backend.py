@@ -1,23 +1,134 @@
+import argparse
 import base64
 import json
+import itertools
 import os
-import struct
 import uuid
-import zlib
-from email import policy
-from email.parser import BytesParser
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 from urllib.parse import parse_qs, urlparse
 
+from async_server import serve_async
+from compute_pool import DEFAULT_QUEUE_PER_WORKER, ComputeBusy, ComputePool
+from image_probe import PROBE_BYTES, probe_image
+from imaging import MAX_DECODE_PIXELS, ImageDecodeError, decode_image
+from mask_codec import encode_rle
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import CountingWriter, Metrics, RequestProfiler
+from multipart import (
+    DEFAULT_MAX_BODY_BYTES,
+    DEFAULT_SPILL_BYTES,
+    MultipartError,
+    parse_multipart,
+)
+from palette_registry import PaletteRegistry
+from pipeline import (
+    PipelineError,
+    ensure_background,
+    ensure_color_map,
+    ensure_perfect_pixel,
+)
+from raster import (
+    DEFAULT_LEVEL as DEFAULT_PNG_LEVEL,
+    banded_pixels,
+    draw_png,
+    full_region,
+    isolated_pixels,
+    layer_pngs,
+    png_from_pixels,
+    region_bands,
+    stream_png,
+)
+from render_cache import DEFAULT_MAX_BYTES as DEFAULT_RENDER_CACHE_BYTES
+from render_cache import RenderCache, etag_matches, make_etag, render_key
+from session_payload import EMPTY_COLORS, ColorTable, MockSession
+from session_store import (
+    BACKENDS as SESSION_BACKENDS,
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL_SECONDS,
+    create_session_store,
+)
+from snapshot import SnapshotError, Snapshotter
+from tiles import (
+    RegionError,
+    board_pixels,
+    board_slots,
+    crop_board_rows,
+    resolve_region,
+    tile_selection,
+    wants_region,
+)
+from user_store import (
+    BACKENDS as USER_BACKENDS,
+    DEFAULT_COMPACT_AFTER,
+    DEFAULT_FLUSH_INTERVAL,
+    create_user_store,
+)
+from wire import (
+    FRAME_CONTENT_TYPE,
+    MIN_COMPRESS_BYTES,
+    accepts_frame,
+    compress,
+    encode_bundle,
+    encode_frame,
+    negotiate_bundle,
+    negotiate_encoding,
+)
+
 HOST = "0.0.0.0"
 PORT = 8080
-DATA_FILE = os.path.join(os.path.dirname(__file__), "mock_data.json")
+DATA_FILE = os.path.join(os.path.dirname(__file__), "mock_data.snap")
+USER_DB_FILE = os.path.join(os.path.dirname(__file__), "mock_users.sqlite3")
 ROOT_DIR = os.path.dirname(__file__)
 SETTINGS_DIR = os.path.join(ROOT_DIR, "settings")
 
-PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+SERVER_MODES = ("single", "threaded", "async")
+MAX_UPLOAD_BYTES = DEFAULT_MAX_BODY_BYTES
+UPLOAD_SPILL_BYTES = DEFAULT_SPILL_BYTES
+# Uploaded images whose header declares more pixels are refused mid-upload.
+MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+# /render streams outputs of at least this many pixels; 0 only streams on request
+# and None streams what the render cache could not hold anyway.
+STREAM_MIN_PIXELS = None
+TRANSPARENT = (0, 0, 0, 0)
+MAX_BATCH_LAYERS = 256
+
+# Colors every mock /process session reports, before max_colors trims them.
+MOCK_DETECTED_COLORS = (
+    {"id": "A1", "count": 50, "rgba": [255, 0, 0, 255]},
+    {"id": "B2", "count": 30, "rgba": [0, 255, 0, 255]},
+    {"id": "C3", "count": 20, "rgba": [0, 0, 255, 255]},
+)
 
-SESSIONS = {}
+SESSIONS = create_session_store()
+# Parsed palettes; main() preloads them and sessions hold the shared objects.
+SETTINGS = PaletteRegistry(SETTINGS_DIR)
+RENDER_CACHE = RenderCache()
+# Inline until main() starts --compute-workers processes.
+COMPUTE = ComputePool()
+METRICS = Metrics()
+# Set by --profile-every; samples every Nth request with cProfile.
+PROFILER = None
+# Routes reported by name in /metrics; anything else is counted as "other".
+METRIC_ENDPOINTS = {
+    "/health",
+    "/metrics",
+    "/sessions/stats",
+    "/render/stats",
+    "/users/stats",
+    "/compute/stats",
+    "/settings/list",
+    "/settings/stats",
+    "/login",
+    "/register",
+    "/process",
+    "/sessions",
+    "/perfect_pixel",
+    "/remove_background",
+    "/color_map",
+    "/render",
+    "/render/batch",
+}
 
 
 def _default_user(user_id, phone, password):
@@ -48,137 +159,183 @@ def _seed_users():
     }
 
 
-def _load_data():
-    if not os.path.exists(DATA_FILE):
-        users = _seed_users()
-        return users, 2
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as handle:
-            payload = json.load(handle)
-        raw_users = payload.get("users", {})
-        users = {int(key): value for key, value in raw_users.items()}
-        next_id = int(payload.get("next_id", max(users.keys(), default=0) + 1))
-        return users, next_id
-    except (OSError, ValueError, json.JSONDecodeError):
-        users = _seed_users()
-        return users, 2
-
-
-def _save_data(users, next_id):
-    payload = {"next_id": next_id, "users": {str(k): v for k, v in users.items()}}
-    temp_path = f"{DATA_FILE}.tmp"
-    with open(temp_path, "w", encoding="utf-8") as handle:
-        json.dump(payload, handle, ensure_ascii=False, indent=2)
-    os.replace(temp_path, DATA_FILE)
-
-
-USERS, NEXT_ID = _load_data()
-
-
-def _rgba_from_hex(hex_value):
-    hex_value = (hex_value or "").lstrip("#")
-    if len(hex_value) != 6:
-        return 0, 0, 0, 255
-    r = int(hex_value[0:2], 16)
-    g = int(hex_value[2:4], 16)
-    b = int(hex_value[4:6], 16)
-    return r, g, b, 255
-
-
-def _png_from_pixels(width, height, pixels):
-    raw = bytearray()
-    stride = width * 4
-    for y in range(height):
-        raw.append(0)
-        start = y * stride
-        raw.extend(pixels[start : start + stride])
-    compressed = zlib.compress(bytes(raw), level=6)
-
-    def _chunk(tag, payload):
-        return (
-            struct.pack(">I", len(payload))
-            + tag
-            + payload
-            + struct.pack(">I", zlib.crc32(tag + payload) & 0xFFFFFFFF)
-        )
+# In memory until main() opens the configured backend, so importing this
+# module never touches DATA_FILE.
+USERS = create_user_store("memory", seed=_seed_users())
 
-    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
-    return (
-        PNG_SIGNATURE
-        + _chunk(b"IHDR", ihdr)
-        + _chunk(b"IDAT", compressed)
-        + _chunk(b"IEND", b"")
-    )
 
+def _session_board(session):
+    return session.get("board") if isinstance(session, dict) else None
 
-def _solid_png(width, height, rgba):
-    r, g, b, a = rgba
-    pixels = bytes([r, g, b, a]) * (width * height)
-    return _png_from_pixels(width, height, pixels)
-
-
-def _banded_png(width, height, palette):
-    if not palette:
-        return _solid_png(width, height, (0, 0, 0, 0))
-    band_height = max(1, height // len(palette))
-    pixels = bytearray()
-    for y in range(height):
-        idx = min(y // band_height, len(palette) - 1)
-        r, g, b, a = palette[idx]
-        for _ in range(width):
-            pixels.extend([r, g, b, a])
-    return _png_from_pixels(width, height, bytes(pixels))
-
-
-def _isolated_png(width, height, rgba, seed):
-    r, g, b, a = rgba
-    pixels = bytearray()
-    for y in range(height):
-        for x in range(width):
-            if (x * 3 + y * 5 + seed) % 11 == 0:
-                pixels.extend([r, g, b, a])
-            else:
-                pixels.extend([0, 0, 0, 0])
-    return _png_from_pixels(width, height, bytes(pixels))
+
+def _render_version(session):
+    # Bumped whenever a session's output changes under the same render key.
+    return session.get("render_version", 0) if isinstance(session, dict) else 0
+
+
+def _session_size(session):
+    if isinstance(session, MockSession):
+        return session.width, session.height
+    board = session.get("board")
+    if board is not None:
+        return board["width"], board["height"]
+    return int(session.get("width") or 128), int(session.get("height") or 128)
+
+
+def _session_colors(session):
+    if isinstance(session, MockSession):
+        return session.colors
+    return session.get("colors") or EMPTY_COLORS
+
+
+def _metrics_endpoint(path):
+    path = urlparse(path).path
+    if path in METRIC_ENDPOINTS:
+        return path
+    if path.startswith("/users/"):
+        return "/users/{id}"
+    return "other"
+
+
+def _metrics_gauges():
+    cache = RENDER_CACHE.stats()
+    return {
+        "sessions": ("Sessions currently stored.", len(SESSIONS)),
+        "users": ("Registered users.", len(USERS)),
+        "render_cache_entries": ("PNGs held by the render cache.", cache["entries"]),
+        "render_cache_bytes": ("Bytes held by the render cache.", cache["bytes"]),
+        "compute_pending": (
+            "Jobs running or queued in the compute pool.",
+            COMPUTE.stats()["pending"],
+        ),
+    }
 
 
-def _infer_png_size(payload):
-    if not payload or len(payload) < 24 or payload[:8] != PNG_SIGNATURE:
-        return None
-    width = struct.unpack(">I", payload[16:20])[0]
-    height = struct.unpack(">I", payload[20:24])[0]
-    if width <= 0 or height <= 0:
-        return None
-    return width, height
+def _check_image_head(upload):
+    # Called by the multipart parser once the head of a file is in, so an
+    # oversize image is refused before the rest of its body is read.
+    info = probe_image(upload.head)
+    if info and MAX_IMAGE_PIXELS and info["width"] * info["height"] > MAX_IMAGE_PIXELS:
+        raise MultipartError(
+            f"image too large: {info['width']}x{info['height']}", status=413
+        )
 
 
 class MockHandler(BaseHTTPRequestHandler):
+    def handle_one_request(self):
+        self._uploads = []
+        self._timer = None
+        self._status = 0
+        if not isinstance(self.wfile, CountingWriter):
+            self.wfile = CountingWriter(self.wfile)
+        self.wfile.written = 0
+        profile = (
+            PROFILER.maybe_profile(
+                lambda: f"{self.command} {_metrics_endpoint(self.path)}" if self._timer else ""
+            )
+            if PROFILER is not None
+            else nullcontext()
+        )
+        try:
+            with profile:
+                super().handle_one_request()
+        finally:
+            for upload in self._uploads:
+                upload.close()
+            if self._timer is not None:
+                METRICS.finish(self._timer, self._status, self.wfile.written)
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        self._timer = METRICS.start(_metrics_endpoint(self.path), self.command)
+        try:
+            self._timer.bytes_in = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            pass
+        return True
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def _phase(self, name):
+        # Times a block as parse, compute, encode or write for /metrics.
+        return self._timer.phase(name) if self._timer is not None else nullcontext()
+
     def _read_json(self):
         length = int(self.headers.get("Content-Length", "0"))
         if length == 0:
             return {}
-        raw = self.rfile.read(length).decode("utf-8")
-        if not raw:
-            return {}
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
-            return {}
+        with self._phase("parse"):
+            raw = self.rfile.read(length).decode("utf-8")
+            if not raw:
+                return {}
+            try:
+                return json.loads(raw)
+            except json.JSONDecodeError:
+                return {}
+
+    def _send_json(self, payload, status=200, binary=None, headers=None):
+        # binary maps field names to raw bytes. JSON clients get them as
+        # "<name>_base64"; clients accepting the frame format get them raw.
+        content_type = "application/json; charset=utf-8"
+        with self._phase("encode"):
+            if binary and accepts_frame(self.headers.get("Accept")):
+                data = encode_frame(payload, binary)
+                content_type = FRAME_CONTENT_TYPE
+            else:
+                if binary:
+                    payload = dict(payload)
+                    for name, blob in binary.items():
+                        payload[f"{name}_base64"] = base64.b64encode(blob).decode("ascii")
+                data = json.dumps(payload).encode("utf-8")
+            encoding = None
+            if len(data) >= MIN_COMPRESS_BYTES:
+                encoding = negotiate_encoding(self.headers.get("Accept-Encoding"))
+                if encoding:
+                    data = compress(data, encoding)
+        with self._phase("write"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            if binary or encoding:
+                self.send_header("Vary", "Accept, Accept-Encoding")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    def _send_text(self, text, content_type):
+        self._send_bytes(text.encode("utf-8"), content_type)
 
-    def _send_json(self, payload, status=200):
-        data = json.dumps(payload).encode("utf-8")
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(data)))
-        self.end_headers()
-        self.wfile.write(data)
-
-    def _send_png(self, data, status=200):
-        self.send_response(status)
-        self.send_header("Content-Type", "image/png")
-        self.send_header("Content-Length", str(len(data)))
-        self.end_headers()
-        self.wfile.write(data)
+    def _send_bytes(self, data, content_type):
+        with self._phase("write"):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    def _send_png(self, data, status=200, etag=None, headers=None):
+        with self._phase("write"):
+            if etag and status == 200 and etag_matches(self.headers.get("If-None-Match"), etag):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "private, no-cache")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
 
     def _not_found(self):
         self._send_json({"error": "not found"}, status=404)
@@ -187,67 +344,446 @@ class MockHandler(BaseHTTPRequestHandler):
         content_type = self.headers.get("Content-Type", "")
         if content_type.startswith("multipart/form-data"):
             length = int(self.headers.get("Content-Length", "0"))
-            body = self.rfile.read(length) if length else b""
-            if not body:
+            if not length:
                 return {}, {}
-            header = f"Content-Type: {content_type}\r\n\r\n".encode("utf-8")
-            message = BytesParser(policy=policy.default).parsebytes(header + body)
-            data = {}
-            files = {}
-            for part in message.iter_parts():
-                name = part.get_param("name", header="Content-Disposition")
-                if not name:
-                    continue
-                filename = part.get_filename()
-                payload = part.get_payload(decode=True)
-                if filename:
-                    files[name] = {"filename": filename, "content": payload or b""}
-                else:
-                    data[name] = (payload or b"").decode("utf-8")
+            try:
+                with self._phase("parse"):
+                    data, files = parse_multipart(
+                        self.rfile,
+                        content_type,
+                        length,
+                        spill_bytes=UPLOAD_SPILL_BYTES,
+                        max_body_bytes=MAX_UPLOAD_BYTES,
+                        on_file_head=_check_image_head,
+                        head_bytes=PROBE_BYTES,
+                    )
+            except MultipartError as exc:
+                self.close_connection = True
+                self._send_json({"error": str(exc)}, status=exc.status)
+                return None
+            self._uploads.extend(files.values())
             return data, files
         if content_type.startswith("application/x-www-form-urlencoded"):
             length = int(self.headers.get("Content-Length", "0"))
-            raw = self.rfile.read(length).decode("utf-8") if length else ""
-            parsed = parse_qs(raw)
+            with self._phase("parse"):
+                raw = self.rfile.read(length).decode("utf-8") if length else ""
+                parsed = parse_qs(raw)
             return {k: v[0] for k, v in parsed.items()}, {}
         return {}, {}
 
-    def _list_settings(self):
-        if not os.path.isdir(SETTINGS_DIR):
-            return []
-        return sorted(
-            name
-            for name in os.listdir(SETTINGS_DIR)
-            if name.lower().endswith(".json")
-        )
+    def _session_palette(self, session):
+        # The registry's current palette, so /color_map follows edits to the
+        # settings file; the one the session started with if it is gone.
+        try:
+            session["palette"] = SETTINGS.get(session["settings_file"])
+        except PipelineError:
+            if session.get("palette") is None:
+                raise
+        return session["palette"]
 
-    def _make_session(self, settings_file, max_colors):
+    def _make_session(self, settings_file, max_colors, width=None, height=None, palette=None):
         session_id = str(uuid.uuid4())
-        detected_colors = [
-            {"id": "A1", "count": 50, "rgba": [255, 0, 0, 255], "hex": "#ff0000"},
-            {"id": "B2", "count": 30, "rgba": [0, 255, 0, 255], "hex": "#00ff00"},
-            {"id": "C3", "count": 20, "rgba": [0, 0, 255, 255], "hex": "#0000ff"},
-        ]
+        detected_colors = MOCK_DETECTED_COLORS
         if max_colors is not None:
             detected_colors = detected_colors[:max(0, min(len(detected_colors), max_colors))]
-        payload = {
+        if not (width and height):
+            width, height = 128, 128
+        session = MockSession(
+            session_id,
+            settings_file,
+            width,
+            height,
+            1024,
+            ColorTable.from_entries(detected_colors),
+            palette,
+        )
+        with self._phase("compute"):
+            SESSIONS.put(session_id, session)
+        return session
+
+    def _parse_bool(self, value, default):
+        if value is None or str(value).strip() == "":
+            return default
+        return str(value).strip().lower() in {"1", "true", "yes"}
+
+    def _parse_int(self, value):
+        try:
+            return int(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    def _create_pipeline_session(self, data, files):
+        upload = files.get("file")
+        if upload is None or not upload.size:
+            self._send_json({"error": "file required"}, status=400)
+            return
+        settings_file = str(data.get("settings_file") or "MARD-24.json")
+        try:
+            with self._phase("compute"):
+                palette = SETTINGS.get(settings_file)
+                source = upload.read()
+                info = probe_image(upload.head)
+                if info is not None:
+                    size = info["width"], info["height"]
+                else:
+                    width, height, _rgba = decode_image(source)
+                    size = width, height
+        except (PipelineError, ImageDecodeError) as exc:
+            self._send_json({"error": str(exc)}, status=400)
+            return
+        session_id = str(uuid.uuid4())
+        session = {
             "session_id": session_id,
-            "total_pixels": 1024,
-            "detected_colors": detected_colors,
             "settings_file": settings_file,
-            "width": 128,
-            "height": 128,
+            "palette": palette,
+            "max_colors": self._parse_int(data.get("max_colors")),
+            "width": size[0],
+            "height": size[1],
+            "source": source,
+            "stages": {},
+        }
+        SESSIONS.put(session_id, session)
+        self._send_json(
+            {
+                "session_id": session_id,
+                "width": size[0],
+                "height": size[1],
+                "settings_file": settings_file,
+            }
+        )
+
+    def _run_pipeline_stage(self, stage, data):
+        session_id = str(data.get("session_id", "")).strip()
+        session = SESSIONS.get(session_id) if session_id else None
+        if not isinstance(session, dict) or "source" not in session:
+            self._send_json({"error": "invalid session_id"}, status=400)
+            return
+        try:
+            if stage == "/perfect_pixel":
+                grid_mode = str(data.get("grid_mode") or "").strip() or None
+                with self._phase("compute"):
+                    result = ensure_perfect_pixel(session, grid_mode, run=COMPUTE.run)
+                payload = {
+                    "session_id": session_id,
+                    "width": result["width"],
+                    "height": result["height"],
+                }
+                binary = {"rgba_u8": result["rgba"]}
+            elif stage == "/remove_background":
+                tight_crop = data.get("tight_crop")
+                if tight_crop is not None:
+                    tight_crop = self._parse_bool(tight_crop, False)
+                tolerance = self._parse_int(data.get("tolerance"))
+                with self._phase("compute"):
+                    result = ensure_background(session, tight_crop, tolerance, run=COMPUTE.run)
+                with self._phase("encode"):
+                    rle, start = encode_rle(result["mask"])
+                payload = {
+                    "session_id": session_id,
+                    "width": result["width"],
+                    "height": result["height"],
+                    "bg_mask_start": start,
+                    "preview_padding": result["padding"],
+                }
+                binary = {"bg_mask_rle_u32le": rle}
+            else:
+                max_colors = self._parse_int(data.get("max_colors"))
+                if max_colors is None:
+                    max_colors = session.get("max_colors")
+                with self._phase("compute"):
+                    palette = self._session_palette(session)
+                    result = ensure_color_map(
+                        session,
+                        palette,
+                        max_colors=max_colors,
+                        alpha_harden=self._parse_bool(data.get("alpha_harden"), True),
+                        mode=str(data.get("color_map_mode") or "nearest").strip(),
+                        run=COMPUTE.run,
+                    )
+                # Lets /render draw layers for pipeline sessions too.
+                session["colors"] = ColorTable.from_entries(result["palette"])
+                # Region and tile renders draw the mapped board itself.
+                session["board"] = result
+                # Streamed renders are not cached; their ETags change with this.
+                session["render_version"] = session.get("render_version", 0) + 1
+                RENDER_CACHE.invalidate_session(session_id)
+                payload = {
+                    "session_id": session_id,
+                    "width": result["width"],
+                    "height": result["height"],
+                    "palette": result["palette"],
+                    "preview_padding": result["padding"],
+                }
+                binary = {"mapping_u16le": result["mapping"]}
+        except (PipelineError, ImageDecodeError) as exc:
+            self._send_json({"error": str(exc)}, status=400)
+            return
+        SESSIONS.put(session_id, session)
+        self._send_json(payload, binary=binary)
+
+    def _render_image(
+        self, session_id, session, selected_ids, width, height, region=None, level=DEFAULT_PNG_LEVEL
+    ):
+        region = region or full_region(width, height)
+        pattern = self._render_pattern(session_id, session, selected_ids, width, height)
+        if pattern is None:
+            return None
+        return self._draw_png(pattern[0], region, level)
+
+    def _draw_png(self, draw, region, level):
+        # With compute workers the whole render runs in a worker process.
+        if COMPUTE.workers:
+            with self._phase("compute"):
+                return COMPUTE.run(draw_png, draw, region, level)
+        function, args = draw
+        with self._phase("compute"):
+            pixels = function(*args, region)
+        with self._phase("encode"):
+            return png_from_pixels(region[2], region[3], pixels, level=level)
+
+    def _render_pattern(self, session_id, session, selected_ids, width, height):
+        # Returns (draw, colors). draw is (function, args) and function(*args,
+        # region) builds RGBA pixels; it stays picklable for compute workers.
+        # colors lists every value it can produce. None for an unknown id.
+        # Color-mapped sessions draw their board, whatever the request shape.
+        board = _session_board(session)
+        if board is not None:
+            selected = board_slots(board, selected_ids)
+            if selected is None:
+                return None
+            return (
+                (board_pixels, (board, selected)),
+                [tuple(entry["rgba"]) for entry in board["palette"] if entry["idx"] in selected]
+                + [TRANSPARENT],
+            )
+        colors = _session_colors(session)
+        if not selected_ids:
+            palette = colors.colors()
+            return (banded_pixels, (width, height, palette)), palette or [TRANSPARENT]
+        selected_palette = []
+        for color_id in selected_ids:
+            target = colors.find(color_id)
+            if target is None:
+                return None
+            selected_palette.append(target)
+        if len(selected_palette) == 1:
+            seed = sum(bytearray((session_id + selected_ids[0]).encode("utf-8")))
+            return (
+                (isolated_pixels, (width, height, selected_palette[0], seed)),
+                [selected_palette[0], TRANSPARENT],
+            )
+        return (banded_pixels, (width, height, selected_palette)), selected_palette
+
+    def _render_level(self, data):
+        level = self._parse_int(data.get("compression_level"))
+        if level is None:
+            return DEFAULT_PNG_LEVEL
+        if not 0 <= level <= 9:
+            self._send_json({"error": "invalid compression_level"}, status=400)
+            return None
+        return level
+
+    def _render_batch(self, data):
+        # Renders several /render selections at once. Layers share one pass:
+        # colors are resolved once, isolated layers are drawn together, and
+        # every layer lands in the render cache under its /render key.
+        session_id = str(data.get("session_id", "")).strip()
+        session = SESSIONS.get(session_id) if session_id else None
+        if not session:
+            self._send_json({"error": "invalid session_id"}, status=400)
+            return
+        level = self._render_level(data)
+        if level is None:
+            return
+        bundle_format = negotiate_bundle(
+            str(data.get("format", "")).strip().lower(), self.headers.get("Accept")
+        )
+        if bundle_format is None:
+            self._send_json({"error": "invalid format"}, status=400)
+            return
+        # selections: ";" between layers, "," between the colors of a layer.
+        # Without it every detected color becomes its own layer.
+        raw_selections = str(data.get("selections", "")).strip()
+        if raw_selections:
+            selections = [
+                [item.strip() for item in group.split(",") if item.strip()]
+                for group in raw_selections.split(";")
+            ]
+        else:
+            selections = [
+                [color_id.strip()] for color_id in _session_colors(session).ids if color_id.strip()
+            ]
+        if not 0 < len(selections) <= MAX_BATCH_LAYERS:
+            self._send_json(
+                {"error": f"selections must list 1 to {MAX_BATCH_LAYERS} layers"}, status=400
+            )
+            return
+        width, height = _session_size(session)
+        layers = []
+        for selected_ids in selections:
+            pattern = self._render_pattern(session_id, session, selected_ids, width, height)
+            if pattern is None:
+                self._send_json(
+                    {"error": "invalid color_id", "color_id": ",".join(selected_ids)}, status=400
+                )
+                return
+            key = render_key(session_id, selected_ids, width, height, level)
+            layers.append([selected_ids, key, pattern[0], RENDER_CACHE.get(key)])
+        missing = [layer for layer in layers if layer[3] is None]
+        if missing:
+            with self._phase("compute"):
+                images = COMPUTE.run(
+                    layer_pngs, [layer[2] for layer in missing], full_region(width, height), level
+                )
+            for layer, image in zip(missing, images):
+                layer[3] = RENDER_CACHE.put(layer[1], image)
+        files = []
+        for position, (selected_ids, _key, _draw, (etag, image)) in enumerate(layers):
+            label = "+".join(selected_ids) or "all"
+            label = "".join(char if char.isalnum() or char in "+-_" else "_" for char in label)
+            name = f"{position:03d}_{label}.png"
+            headers = {
+                "Content-Type": "image/png",
+                "X-Color-Id": ",".join(selected_ids),
+                "ETag": etag,
+            }
+            files.append((name, headers, image))
+        with self._phase("encode"):
+            content_type, body = encode_bundle(files, bundle_format)
+        self._send_bytes(body, content_type)
+
+    def _wants_stream(self, data, pixels):
+        flag = str(data.get("stream", "")).strip()
+        if flag:
+            return self._parse_bool(flag, False)
+        if STREAM_MIN_PIXELS is None:
+            # Raw RGBA is an upper bound on the PNG, so only renders that could
+            # never fit the cache skip it.
+            return bool(RENDER_CACHE.max_bytes) and pixels * 4 > RENDER_CACHE.max_bytes
+        return bool(STREAM_MIN_PIXELS) and pixels >= STREAM_MIN_PIXELS
+
+    def _send_png_stream(self, key, region, draw, colors, level, headers=None):
+        # Large renders are drawn, filtered and compressed one band at a time
+        # and sent with chunked transfer encoding, so neither the pixels nor
+        # the PNG are ever held whole. They are not cached, so the ETag comes
+        # from the render key rather than the bytes.
+        etag = make_etag(repr(key).encode("utf-8"))
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self._send_png(b"", etag=etag)
+            return
+        function, args = draw
+
+        def draw_band(band):
+            if function is board_pixels:
+                # Workers get only the rows the band samples, not the whole mapping.
+                board, selected = args
+                board, band = crop_board_rows(board, band)
+                return COMPUTE.run(function, board, selected, band)
+            return COMPUTE.run(function, *args, band)
+
+        bands = iter(region_bands(region))
+        # The first band is drawn before the headers go out, so a busy pool
+        # still gets a 503 instead of a truncated PNG.
+        first = draw_band(next(bands))
+        pieces = stream_png(
+            region[2],
+            region[3],
+            itertools.chain([first], map(draw_band, bands)),
+            colors,
+            level=level,
+        )
+        chunked = self.request_version == "HTTP/1.1"
+        with self._phase("write"):
+            if chunked:
+                self.protocol_version = "HTTP/1.1"
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("ETag", etag)
+            if chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            for piece in pieces:
+                if chunked:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+                else:
+                    self.wfile.write(piece)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+
+    def _render_region(self, session_id, session, selected_ids, data, level):
+        # Tiles are cached on their own. Board tiles are keyed by the selected
+        # colors they contain, so toggling a color leaves other tiles cached.
+        board = _session_board(session)
+        width, height = _session_size(session)
+        try:
+            region = resolve_region(width, height, data)
+        except RegionError as exc:
+            self._send_json({"error": str(exc)}, status=400)
+            return
+        x, y, out_width, out_height, step = region
+        headers = {
+            "X-Render-Region": f"{x},{y},{out_width * step},{out_height * step}",
+            "X-Render-Step": str(step),
+            "X-Render-Size": f"{width}x{height}",
         }
-        SESSIONS[session_id] = payload
-        return payload
+        pattern = self._render_pattern(session_id, session, selected_ids, width, height)
+        if pattern is None:
+            self._send_json({"error": "invalid color_id"}, status=400)
+            return
+        if self._wants_stream(data, out_width * out_height):
+            key = (session_id, "tile", tuple(selected_ids), region, level)
+            self._send_png_stream(
+                (key, _render_version(session)), region, *pattern, level, headers
+            )
+            return
+        if board is not None:
+            _function, (_board, selected) = pattern[0]
+            with self._phase("compute"):
+                selection = tile_selection(board, selected, region)
+            cache_key = (session_id, "tile", selection, region, level)
+        else:
+            cache_key = (session_id, "tile", tuple(selected_ids), width, height, region, level)
+        cached = RENDER_CACHE.get(cache_key)
+        if cached is None:
+            cached = RENDER_CACHE.put(cache_key, self._draw_png(pattern[0], region, level))
+        etag, image = cached
+        self._send_png(image, etag=etag, headers=headers)
 
     def do_GET(self):
         parsed = urlparse(self.path)
         if parsed.path == "/health":
             self._send_json({"status": "ok"})
             return
+        if parsed.path == "/sessions/stats":
+            self._send_json(SESSIONS.stats())
+            return
+        if parsed.path == "/users/stats":
+            self._send_json(USERS.stats())
+            return
+        if parsed.path == "/render/stats":
+            self._send_json(RENDER_CACHE.stats())
+            return
+        if parsed.path == "/compute/stats":
+            self._send_json(COMPUTE.stats())
+            return
+        if parsed.path == "/metrics":
+            self._send_text(METRICS.render(_metrics_gauges()), METRICS_CONTENT_TYPE)
+            return
         if parsed.path == "/settings/list":
-            self._send_json({"files": self._list_settings()})
+            files, etag = SETTINGS.listing()
+            if etag_matches(self.headers.get("If-None-Match"), etag):
+                with self._phase("write"):
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                return
+            self._send_json({"files": files}, headers={"ETag": etag})
+            return
+        if parsed.path == "/settings/stats":
+            self._send_json(SETTINGS.stats())
             return
         if parsed.path.startswith("/users/"):
             try:
@@ -264,6 +800,16 @@ class MockHandler(BaseHTTPRequestHandler):
         self._not_found()
 
     def do_POST(self):
+        try:
+            self._handle_post()
+        except ComputeBusy as exc:
+            self._send_json(
+                {"error": "server busy"},
+                status=503,
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+
+    def _handle_post(self):
         parsed = urlparse(self.path)
         if parsed.path == "/login":
             payload = self._read_json()
@@ -272,18 +818,18 @@ class MockHandler(BaseHTTPRequestHandler):
             if not phone or not password:
                 self._send_json({"error": "phone and password required"}, status=400)
                 return
-            user = None
-            for candidate in USERS.values():
-                if candidate.get("phone") == phone and candidate.get("password") == password:
-                    user = candidate
-                    break
+            with self._phase("compute"):
+                user = USERS.authenticate(phone, password)
             if not user:
                 self._send_json({"error": "invalid credentials"}, status=401)
                 return
             self._send_json(user)
             return
         if parsed.path == "/process":
-            data, _files = self._read_form()
+            form = self._read_form()
+            if form is None:
+                return
+            data, _files = form
             settings_file = str(data.get("settings_file") or "MARD-24.json")
             max_colors = data.get("max_colors")
             mock_flag = str(data.get("mock", "")).lower() in {"1", "true", "yes"}
@@ -301,55 +847,89 @@ class MockHandler(BaseHTTPRequestHandler):
             if not mock_flag:
                 # This mock server always returns dummy data; keep behavior explicit.
                 mock_flag = True
-            payload = self._make_session(settings_file, max_colors)
             file_info = _files.get("file")
-            if file_info and isinstance(file_info, dict):
-                inferred = _infer_png_size(file_info.get("content"))
-                if inferred:
-                    width, height = inferred
-            if width and height:
-                payload["width"] = width
-                payload["height"] = height
-            self._send_json(payload)
+            if file_info is not None:
+                info = probe_image(file_info.head)
+                if info:
+                    width, height = info["width"], info["height"]
+            # Mock sessions keep working without a settings directory; a file
+            # that exists must parse, and the session shares its palette.
+            palette = None
+            if settings_file in SETTINGS:
+                try:
+                    palette = SETTINGS.get(settings_file)
+                except PipelineError as exc:
+                    self._send_json({"error": str(exc)}, status=400)
+                    return
+            session = self._make_session(settings_file, max_colors, width, height, palette)
+            self._send_json(session.to_json())
+            return
+        if parsed.path == "/sessions":
+            form = self._read_form()
+            if form is None:
+                return
+            self._create_pipeline_session(*form)
+            return
+        if parsed.path in ("/perfect_pixel", "/remove_background", "/color_map"):
+            form = self._read_form()
+            if form is None:
+                return
+            self._run_pipeline_stage(parsed.path, form[0])
+            return
+        if parsed.path == "/render/batch":
+            form = self._read_form()
+            if form is None:
+                return
+            self._render_batch(form[0])
             return
         if parsed.path == "/render":
-            data, _files = self._read_form()
+            form = self._read_form()
+            if form is None:
+                return
+            data, _files = form
             session_id = str(data.get("session_id", "")).strip()
             raw_color_id = str(data.get("color_id", "")).strip()
             selected_ids = [
                 item.strip() for item in raw_color_id.split(",") if item.strip()
             ]
-            if not session_id or session_id not in SESSIONS:
+            session = SESSIONS.get(session_id) if session_id else None
+            if not session:
                 self._send_json({"error": "invalid session_id"}, status=400)
                 return
-            session = SESSIONS[session_id]
-            width = int(session.get("width") or 128)
-            height = int(session.get("height") or 128)
-            palette = [
-                _rgba_from_hex(color.get("hex"))
-                for color in session.get("detected_colors", [])
-            ]
-            if selected_ids:
-                colors_by_id = {
-                    str(color.get("id")): _rgba_from_hex(color.get("hex"))
-                    for color in session.get("detected_colors", [])
-                    if str(color.get("id", "")).strip()
-                }
-                selected_palette = []
-                for color_id in selected_ids:
-                    target = colors_by_id.get(color_id)
-                    if not target:
-                        self._send_json({"error": "invalid color_id"}, status=400)
-                        return
-                    selected_palette.append(target)
-                if len(selected_palette) == 1:
-                    seed = sum(bytearray((session_id + selected_ids[0]).encode("utf-8")))
-                    image = _isolated_png(width, height, selected_palette[0], seed)
-                else:
-                    image = _banded_png(width, height, selected_palette)
-            else:
-                image = _banded_png(width, height, palette)
-            self._send_png(image)
+            level = self._render_level(data)
+            if level is None:
+                return
+            if wants_region(data):
+                self._render_region(session_id, session, selected_ids, data, level)
+                return
+            width, height = _session_size(session)
+            headers = {"X-Render-Size": f"{width}x{height}"}
+            if self._wants_stream(data, width * height):
+                pattern = self._render_pattern(session_id, session, selected_ids, width, height)
+                if pattern is None:
+                    self._send_json({"error": "invalid color_id"}, status=400)
+                    return
+                key = render_key(session_id, selected_ids, width, height, level)
+                self._send_png_stream(
+                    (key, _render_version(session)),
+                    full_region(width, height),
+                    *pattern,
+                    level,
+                    headers,
+                )
+                return
+            cache_key = render_key(session_id, selected_ids, width, height, level)
+            cached = RENDER_CACHE.get(cache_key)
+            if cached is None:
+                image = self._render_image(
+                    session_id, session, selected_ids, width, height, level=level
+                )
+                if image is None:
+                    self._send_json({"error": "invalid color_id"}, status=400)
+                    return
+                cached = RENDER_CACHE.put(cache_key, image)
+            etag, image = cached
+            self._send_png(image, etag=etag, headers=headers)
             return
         if parsed.path == "/register":
             payload = self._read_json()
@@ -358,12 +938,8 @@ class MockHandler(BaseHTTPRequestHandler):
             if not phone or not password:
                 self._send_json({"error": "phone and password required"}, status=400)
                 return
-            global NEXT_ID
-            user_id = NEXT_ID
-            NEXT_ID += 1
-            user = _default_user(user_id, phone, password)
-            USERS[user_id] = user
-            _save_data(USERS, NEXT_ID)
+            with self._phase("compute"):
+                user = USERS.create(lambda user_id: _default_user(user_id, phone, password))
             self._send_json(user, status=201)
             return
         self._not_found()
@@ -380,20 +956,24 @@ class MockHandler(BaseHTTPRequestHandler):
                 self._not_found()
                 return
             payload = self._read_json()
-            user = USERS[user_id]
-            for key in [
-                "phone",
-                "username",
-                "password",
-                "email",
-                "birthday",
-                "mbti",
-                "avatarMode",
-            ]:
-                if key in payload and payload[key] is not None:
-                    user[key] = payload[key]
-            USERS[user_id] = user
-            _save_data(USERS, NEXT_ID)
+            changes = {
+                key: payload[key]
+                for key in [
+                    "phone",
+                    "username",
+                    "password",
+                    "email",
+                    "birthday",
+                    "mbti",
+                    "avatarMode",
+                ]
+                if key in payload and payload[key] is not None
+            }
+            with self._phase("compute"):
+                user = USERS.update(user_id, changes)
+            if user is None:
+                self._not_found()
+                return
             self._send_json(user)
             return
         self._not_found()
@@ -402,11 +982,186 @@ class MockHandler(BaseHTTPRequestHandler):
         return
 
 
-def main():
-    _save_data(USERS, NEXT_ID)
-    server = HTTPServer((HOST, PORT), MockHandler)
-    print(f"Mock backend running on http://{HOST}:{PORT}")
-    server.serve_forever()
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PixelPad mock backend")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--mode",
+        choices=SERVER_MODES,
+        default="single",
+        help="single: one request at a time; threaded: thread per connection; "
+        "async: asyncio front end with a worker pool for request handling",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="worker pool size for --mode async"
+    )
+    parser.add_argument("--user-backend", choices=USER_BACKENDS, default="journal")
+    parser.add_argument(
+        "--user-db",
+        default=None,
+        help=f"snapshot file for --user-backend journal (default {DATA_FILE}) or "
+        f"database file for sqlite (default {USER_DB_FILE})",
+    )
+    parser.add_argument(
+        "--user-flush-interval",
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help="seconds between journal fsyncs; 0 syncs every change",
+    )
+    parser.add_argument(
+        "--user-compact-after",
+        type=int,
+        default=DEFAULT_COMPACT_AFTER,
+        help="rewrite the snapshot once the journal exceeds this many lines "
+        "(or the user count, if larger)",
+    )
+    parser.add_argument("--session-backend", choices=SESSION_BACKENDS, default="memory")
+    parser.add_argument(
+        "--session-db",
+        default=os.path.join(ROOT_DIR, "mock_sessions.sqlite3"),
+        help="database file for --session-backend sqlite",
+    )
+    parser.add_argument(
+        "--session-max", type=int, default=DEFAULT_MAX_ENTRIES, help="0 disables the limit"
+    )
+    parser.add_argument(
+        "--session-ttl",
+        type=float,
+        default=DEFAULT_TTL_SECONDS,
+        help="idle seconds before a session expires; 0 disables expiry",
+    )
+    parser.add_argument(
+        "--session-snapshot",
+        default=os.path.join(ROOT_DIR, "mock_sessions.snap"),
+        help="file that --session-backend memory restores sessions from at startup "
+        "and snapshots them to; empty disables it",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        default=60.0,
+        help="seconds between background snapshots of users and sessions; "
+        "0 only snapshots at shutdown",
+    )
+    parser.add_argument(
+        "--render-cache-bytes",
+        type=int,
+        default=DEFAULT_RENDER_CACHE_BYTES,
+        help="byte budget for cached /render PNGs; 0 disables the cache",
+    )
+    parser.add_argument(
+        "--settings-dir", default=SETTINGS_DIR, help="directory holding palette JSON files"
+    )
+    parser.add_argument(
+        "--max-upload-bytes",
+        type=int,
+        default=DEFAULT_MAX_BODY_BYTES,
+        help="reject multipart bodies larger than this with 413; 0 disables the limit",
+    )
+    parser.add_argument(
+        "--max-image-pixels",
+        type=int,
+        default=MAX_DECODE_PIXELS,
+        help="refuse uploaded images whose header declares more pixels with 413; "
+        "0 disables the check",
+    )
+    parser.add_argument(
+        "--upload-spill-bytes",
+        type=int,
+        default=DEFAULT_SPILL_BYTES,
+        help="file parts larger than this are spooled to a temporary file",
+    )
+    parser.add_argument(
+        "--compute-workers",
+        type=int,
+        default=0,
+        help="worker processes for rendering and pipeline stages; 0 runs them "
+        "on the request thread",
+    )
+    parser.add_argument(
+        "--compute-queue",
+        type=int,
+        default=None,
+        help="jobs that may wait for a compute worker before requests get 503 "
+        f"(default {DEFAULT_QUEUE_PER_WORKER} per worker)",
+    )
+    parser.add_argument(
+        "--stream-min-pixels",
+        type=int,
+        default=STREAM_MIN_PIXELS,
+        help="stream /render PNGs of at least this many pixels with chunked transfer "
+        "encoding; 0 streams only when the request sets stream=1 (default: renders "
+        "whose pixels exceed --render-cache-bytes)",
+    )
+    parser.add_argument(
+        "--profile-every",
+        type=int,
+        default=0,
+        help="cProfile every Nth request and dump it to --profile-dir; 0 disables",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=os.path.join(ROOT_DIR, "profiles"),
+        help="directory for .prof files written by --profile-every",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    global SESSIONS, USERS, RENDER_CACHE, MAX_UPLOAD_BYTES, UPLOAD_SPILL_BYTES, SETTINGS
+    global MAX_IMAGE_PIXELS
+    global PROFILER, STREAM_MIN_PIXELS, COMPUTE
+    SETTINGS = PaletteRegistry(args.settings_dir)
+    for name, message in sorted(SETTINGS.load_all().items()):
+        print(f"Skipping {name}: {message}")
+    MAX_UPLOAD_BYTES = args.max_upload_bytes
+    MAX_IMAGE_PIXELS = args.max_image_pixels
+    UPLOAD_SPILL_BYTES = args.upload_spill_bytes
+    STREAM_MIN_PIXELS = args.stream_min_pixels
+    RENDER_CACHE = RenderCache(args.render_cache_bytes)
+    SESSIONS = create_session_store(
+        args.session_backend,
+        max_entries=args.session_max,
+        ttl_seconds=args.session_ttl,
+        path=args.session_db,
+    )
+    USERS = create_user_store(
+        args.user_backend,
+        path=args.user_db or (USER_DB_FILE if args.user_backend == "sqlite" else DATA_FILE),
+        seed=_seed_users(),
+        flush_interval=args.user_flush_interval,
+        compact_after=args.user_compact_after,
+    )
+    if USERS.migrated_from:
+        print(f"Migrated users from {USERS.migrated_from}")
+    jobs = [USERS.snapshot]
+    if args.session_backend == "memory" and args.session_snapshot:
+        try:
+            restored = SESSIONS.restore(args.session_snapshot)
+            print(f"Restored {restored} sessions from {args.session_snapshot}")
+        except FileNotFoundError:
+            pass
+        except (OSError, SnapshotError) as exc:
+            print(f"Ignoring session snapshot: {exc}")
+        jobs.append(lambda: SESSIONS.snapshot(args.session_snapshot))
+    snapshotter = Snapshotter(args.snapshot_interval, jobs)
+    COMPUTE = ComputePool(args.compute_workers, args.compute_queue)
+    if args.profile_every > 0:
+        PROFILER = RequestProfiler(args.profile_every, args.profile_dir)
+    print(f"Mock backend running on http://{args.host}:{args.port} ({args.mode})")
+    try:
+        if args.mode == "async":
+            serve_async(MockHandler, args.host, args.port, workers=max(1, args.workers))
+            return
+        server_class = ThreadingHTTPServer if args.mode == "threaded" else HTTPServer
+        server = server_class((args.host, args.port), MockHandler)
+        server.serve_forever()
+    finally:
+        COMPUTE.close()
+        snapshotter.close()
+        USERS.close()
 
 
 if __name__ == "__main__":
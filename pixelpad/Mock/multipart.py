@@ -0,0 +1,206 @@
+import tempfile
+from email.message import Message
+
+CHUNK_SIZE = 64 * 1024
+HEAD_BYTES = 64
+DEFAULT_SPILL_BYTES = 1024 * 1024
+DEFAULT_MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_FIELD_BYTES = 1024 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class MultipartError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadedFile:
+    """A file part whose content lives in memory until it passes the spill threshold.
+
+    ``head`` holds the first ``head_bytes`` of the part so callers can sniff
+    the format without reading the content back.
+    """
+
+    def __init__(self, name, filename, content_type, spill_bytes, head_bytes=HEAD_BYTES):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.head = b""
+        self.head_bytes = head_bytes
+        self._file = tempfile.SpooledTemporaryFile(max_size=spill_bytes)
+
+    @property
+    def spilled(self):
+        return bool(getattr(self._file, "_rolled", False))
+
+    def write(self, data):
+        if len(self.head) < self.head_bytes:
+            self.head += data[: self.head_bytes - len(self.head)]
+        self._file.write(data)
+        self.size += len(data)
+
+    def open(self):
+        self._file.seek(0)
+        return self._file
+
+    def read(self):
+        return self.open().read()
+
+    def close(self):
+        self._file.close()
+
+
+class _LimitedReader:
+    def __init__(self, stream, length):
+        self._stream = stream
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return b""
+        data = self._stream.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+def _boundary_from(content_type):
+    message = Message()
+    message["Content-Type"] = content_type
+    boundary = message.get_param("boundary")
+    if not boundary:
+        raise MultipartError("missing multipart boundary")
+    return boundary.encode("latin-1")
+
+
+def _parse_part_headers(raw):
+    message = Message()
+    for line in raw.decode("utf-8", "replace").split("\r\n"):
+        name, sep, value = line.partition(":")
+        if sep:
+            message[name.strip()] = value.strip()
+    name = message.get_param("name", header="Content-Disposition")
+    filename = message.get_param("filename", header="Content-Disposition")
+    return name, filename, message.get_content_type()
+
+
+def iter_multipart(
+    stream,
+    content_type,
+    content_length,
+    spill_bytes=DEFAULT_SPILL_BYTES,
+    max_body_bytes=DEFAULT_MAX_BODY_BYTES,
+    on_file_head=None,
+    head_bytes=HEAD_BYTES,
+):
+    """Yield ``(name, value)`` for each part while reading ``stream`` in chunks.
+
+    ``value`` is a ``str`` for plain fields and an :class:`UploadedFile` for
+    file parts. ``on_file_head(upload)`` is called once the first
+    ``head_bytes`` of a file (or all of a shorter one) are known and may raise
+    :class:`MultipartError` to stop the upload.
+    """
+    if max_body_bytes and content_length > max_body_bytes:
+        raise MultipartError("upload too large", status=413)
+    boundary = _boundary_from(content_type)
+    reader = _LimitedReader(stream, content_length)
+    delimiter = b"\r\n--" + boundary
+    # Prefixing CRLF lets the first boundary match the same delimiter as the rest.
+    buffer = bytearray(b"\r\n")
+    eof = False
+
+    def fill():
+        nonlocal eof
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer.extend(chunk)
+
+    while True:
+        index = buffer.find(delimiter)
+        if index >= 0:
+            del buffer[: index + len(delimiter)]
+            break
+        if eof:
+            raise MultipartError("multipart boundary not found")
+        del buffer[: max(0, len(buffer) - len(delimiter))]
+        fill()
+
+    while True:
+        while len(buffer) < 2 and not eof:
+            fill()
+        if buffer[:2] == b"--":
+            return
+        index = buffer.find(b"\r\n\r\n")
+        while index < 0:
+            if eof or len(buffer) > MAX_HEADER_BYTES:
+                raise MultipartError("malformed multipart headers")
+            fill()
+            index = buffer.find(b"\r\n\r\n")
+        name, filename, part_type = _parse_part_headers(bytes(buffer[:index]).strip())
+        del buffer[: index + 4]
+
+        if filename:
+            sink = UploadedFile(name, filename, part_type, spill_bytes, head_bytes)
+        else:
+            sink = bytearray()
+        notified = False
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                sink_data, tail = bytes(buffer[:index]), index + len(delimiter)
+            elif eof:
+                raise MultipartError("unterminated multipart part")
+            else:
+                keep = len(delimiter) - 1
+                sink_data, tail = bytes(buffer[: max(0, len(buffer) - keep)]), None
+            if sink_data:
+                if isinstance(sink, UploadedFile):
+                    sink.write(sink_data)
+                    if not notified and on_file_head and (
+                        len(sink.head) >= head_bytes or tail is not None
+                    ):
+                        notified = True
+                        try:
+                            on_file_head(sink)
+                        except Exception:
+                            sink.close()
+                            raise
+                else:
+                    sink.extend(sink_data)
+                    if len(sink) > MAX_FIELD_BYTES:
+                        raise MultipartError("form field too large", status=413)
+            if tail is not None:
+                del buffer[:tail]
+                break
+            del buffer[: len(sink_data)]
+            fill()
+
+        if not name:
+            if isinstance(sink, UploadedFile):
+                sink.close()
+            continue
+        if isinstance(sink, UploadedFile):
+            yield name, sink
+        else:
+            yield name, bytes(sink).decode("utf-8")
+
+
+def parse_multipart(stream, content_type, content_length, **kwargs):
+    data = {}
+    files = {}
+    try:
+        for name, value in iter_multipart(stream, content_type, content_length, **kwargs):
+            if isinstance(value, UploadedFile):
+                previous = files.get(name)
+                if previous is not None:
+                    previous.close()
+                files[name] = value
+            else:
+                data[name] = value
+    except Exception:
+        for upload in files.values():
+            upload.close()
+        raise
+    return data, files
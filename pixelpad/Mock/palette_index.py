@@ -0,0 +1,208 @@
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the KD-tree path needs only the standard library.
+    np = None
+
+METRICS = ("rgb", "lab")
+MAX_CACHED_INDEXES = 32
+NUMPY_CHUNK = 4096
+
+
+def _srgb_to_linear(channel):
+    value = channel / 255.0
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _lab_f(t):
+    return t ** (1.0 / 3.0) if t > 216.0 / 24389.0 else (24389.0 / 27.0 * t + 16.0) / 116.0
+
+
+def rgb_to_lab(rgb):
+    r, g, b = (_srgb_to_linear(channel) for channel in rgb)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+    fx, fy, fz = _lab_f(x), _lab_f(y), _lab_f(z)
+    return 116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)
+
+
+def _rgb_to_lab_array(rgb):
+    value = rgb.astype(np.float64) / 255.0
+    linear = np.where(value <= 0.04045, value / 12.92, ((value + 0.055) / 1.055) ** 2.4)
+    matrix = np.array(
+        [
+            [0.4124564 / 0.95047, 0.3575761 / 0.95047, 0.1804375 / 0.95047],
+            [0.2126729, 0.7151522, 0.0721750],
+            [0.0193339 / 1.08883, 0.1191920 / 1.08883, 0.9503041 / 1.08883],
+        ]
+    )
+    xyz = linear @ matrix.T
+    f = np.where(xyz > 216.0 / 24389.0, np.cbrt(xyz), (24389.0 / 27.0 * xyz + 16.0) / 116.0)
+    return np.stack(
+        [116.0 * f[:, 1] - 16.0, 500.0 * (f[:, 0] - f[:, 1]), 200.0 * (f[:, 1] - f[:, 2])],
+        axis=1,
+    )
+
+
+def _build_tree(points, depth=0):
+    # points: [(coords, index), ...]; nodes are (coords, index, axis, left, right).
+    if not points:
+        return None
+    axis = depth % 3
+    points.sort(key=lambda item: item[0][axis])
+    middle = len(points) // 2
+    coords, index = points[middle]
+    return (
+        coords,
+        index,
+        axis,
+        _build_tree(points[:middle], depth + 1),
+        _build_tree(points[middle + 1 :], depth + 1),
+    )
+
+
+def _tree_nearest(node, target, best):
+    if node is None:
+        return best
+    coords, index, axis, left, right = node
+    distance = (
+        (coords[0] - target[0]) ** 2
+        + (coords[1] - target[1]) ** 2
+        + (coords[2] - target[2]) ** 2
+    )
+    # Ties resolve to the lower palette index, matching a linear scan.
+    if distance < best[0] or (distance == best[0] and index < best[1]):
+        best = (distance, index)
+    delta = target[axis] - coords[axis]
+    near, far = (left, right) if delta < 0 else (right, left)
+    best = _tree_nearest(near, target, best)
+    if delta * delta <= best[0]:
+        best = _tree_nearest(far, target, best)
+    return best
+
+
+class PaletteIndex:
+    """Exact nearest-color lookup over a fixed palette.
+
+    Uses chunked NumPy distance matrices over the distinct query colors when
+    NumPy is installed and a KD-tree otherwise. ``metric`` is ``"rgb"``
+    (squared Euclidean in sRGB) or ``"lab"`` (CIE76 in CIE Lab).
+    """
+
+    def __init__(self, colors, metric="rgb"):
+        if metric not in METRICS:
+            raise ValueError(f"unknown palette metric: {metric}")
+        if not colors:
+            raise ValueError("palette is empty")
+        self.colors = [tuple(color[:3]) for color in colors]
+        self.metric = metric
+        self._space = rgb_to_lab if metric == "lab" else (lambda rgb: rgb)
+        self._points = [self._space(color) for color in self.colors]
+        self._tree = _build_tree([(point, i) for i, point in enumerate(self._points)])
+        self._array = np.asarray(self._points, dtype=np.float64) if np is not None else None
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.colors)
+
+    def nearest(self, rgb):
+        rgb = tuple(rgb[:3])
+        index = self._memo.get(rgb)
+        if index is None:
+            index = _tree_nearest(self._tree, self._space(rgb), (float("inf"), -1))[1]
+            with self._lock:
+                if len(self._memo) < 1 << 18:
+                    self._memo[rgb] = index
+        return index
+
+    def nearest_many(self, colors):
+        """Return the nearest palette index for each ``(r, g, b)`` in ``colors``."""
+        colors = list(colors)
+        if not colors:
+            return []
+        if self._array is None:
+            return [self.nearest(color) for color in colors]
+        query = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        return self.nearest_array(query).tolist()
+
+    def nearest_array(self, rgb):
+        """Vectorized lookup for an ``(N, 3)`` uint8 array; returns an int array."""
+        packed = (
+            rgb[:, 0].astype(np.uint32) << 16 | rgb[:, 1].astype(np.uint32) << 8 | rgb[:, 2]
+        )
+        unique, inverse = np.unique(packed, return_inverse=True)
+        unique_rgb = np.stack(
+            [(unique >> 16) & 0xFF, (unique >> 8) & 0xFF, unique & 0xFF], axis=1
+        ).astype(np.uint8)
+        points = (
+            _rgb_to_lab_array(unique_rgb) if self.metric == "lab" else unique_rgb.astype(np.float64)
+        )
+        result = np.empty(len(unique), dtype=np.int64)
+        for start in range(0, len(unique), NUMPY_CHUNK):
+            block = points[start : start + NUMPY_CHUNK]
+            distances = ((block[:, None, :] - self._array[None, :, :]) ** 2).sum(axis=2)
+            result[start : start + NUMPY_CHUNK] = distances.argmin(axis=1)
+        return result[inverse.reshape(-1)]
+
+    def subset(self, indices):
+        """Index over ``indices`` only; lookups return positions in the original palette."""
+        indices = list(indices)
+        return _SubsetIndex(self, indices)
+
+
+class _SubsetIndex:
+    def __init__(self, parent, indices):
+        self._indices = indices
+        self._index = PaletteIndex([parent.colors[i] for i in indices], parent.metric)
+
+    def nearest(self, rgb):
+        return self._indices[self._index.nearest(rgb)]
+
+    def nearest_many(self, colors):
+        return [self._indices[i] for i in self._index.nearest_many(colors)]
+
+
+def brute_force_nearest(colors, palette, metric="rgb"):
+    space = rgb_to_lab if metric == "lab" else (lambda rgb: rgb)
+    points = [space(color) for color in palette]
+    result = []
+    for color in colors:
+        target = space(color)
+        best = min(
+            range(len(points)),
+            key=lambda i: sum((points[i][axis] - target[axis]) ** 2 for axis in range(3)),
+        )
+        result.append(best)
+    return result
+
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def get_palette_index(colors, metric="rgb"):
+    """Shared index for ``colors``; sessions using the same palette reuse one build."""
+    key = (tuple(tuple(color[:3]) for color in colors), metric)
+    with _CACHE_LOCK:
+        index = _CACHE.get(key)
+        if index is not None:
+            _CACHE.move_to_end(key)
+            _CACHE_STATS["hits"] += 1
+            return index
+        _CACHE_STATS["misses"] += 1
+    index = PaletteIndex(list(key[0]), metric)
+    with _CACHE_LOCK:
+        _CACHE[key] = index
+        while len(_CACHE) > MAX_CACHED_INDEXES:
+            _CACHE.popitem(last=False)
+    return index
+
+
+def cache_stats():
+    with _CACHE_LOCK:
+        return dict(_CACHE_STATS, entries=len(_CACHE))
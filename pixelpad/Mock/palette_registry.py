@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+from array import array
+
+from palette_index import rgb_to_lab
+from pipeline import PipelineError, parse_palette
+from render_cache import make_etag
+
+
+class Palette:
+    """A parsed settings file, shared by every session that names it.
+
+    Iterates and indexes as ``(id, (r, g, b))`` pairs like
+    :func:`pipeline.parse_palette`. ``rgba`` packs four bytes per color and
+    ``lab`` three doubles per color. Instances are never mutated; a changed
+    file produces a new instance.
+    """
+
+    __slots__ = ("name", "mtime_ns", "ids", "rgba", "lab", "_entries")
+
+    def __init__(self, name, mtime_ns, entries):
+        self.name = name
+        self.mtime_ns = mtime_ns
+        self._entries = tuple((color_id, tuple(rgb)) for color_id, rgb in entries)
+        self.ids = tuple(color_id for color_id, _rgb in self._entries)
+        self.rgba = bytes(value for _id, rgb in self._entries for value in (*rgb, 255))
+        self.lab = array("d", (value for _id, rgb in self._entries for value in rgb_to_lab(rgb)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getstate__(self):
+        return self.name, self.mtime_ns, self._entries
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def read_palette(path, name, mtime_ns):
+    """Parse and validate one settings file; raises PipelineError."""
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            entries = parse_palette(json.load(handle))
+    except (OSError, ValueError) as exc:
+        if isinstance(exc, PipelineError):
+            raise PipelineError(f"invalid settings_file: {name}: {exc}") from exc
+        raise PipelineError(f"invalid settings_file: {name}") from exc
+    seen = set()
+    for color_id, _rgb in entries:
+        if color_id in seen:
+            raise PipelineError(f"invalid settings_file: {name}: duplicate color id {color_id}")
+        seen.add(color_id)
+    return Palette(name, mtime_ns, entries)
+
+
+class PaletteRegistry:
+    """Parsed settings files from one directory, loaded once and kept current.
+
+    :meth:`load_all` parses every ``*.json`` file up front. Afterwards a file
+    is re-parsed only when its mtime changes, and the directory is rescanned
+    only when the directory's own mtime changes (a file was added, removed or
+    renamed). Files that fail validation are left out and listed in
+    ``errors``.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._palettes = {}
+        self._errors = {}
+        self._scanned_mtime_ns = None
+        self._listing = None
+        self._counters = {"loads": 0, "reloads": 0, "failures": 0}
+
+    def _path(self, name):
+        base = os.path.basename(name or "")
+        if base != name or not base.lower().endswith(".json"):
+            return None
+        return os.path.join(self.directory, base)
+
+    def _mtime_ns(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self, name, path):
+        # Caller holds the lock. Returns the current palette or None.
+        mtime_ns = self._mtime_ns(path)
+        current = self._palettes.get(name)
+        if mtime_ns is None:
+            if current is not None or name in self._errors:
+                self._palettes.pop(name, None)
+                self._errors.pop(name, None)
+                self._listing = None
+            return None
+        if current is not None and current.mtime_ns == mtime_ns:
+            return current
+        failed = self._errors.get(name)
+        if failed is not None and failed[0] == mtime_ns:
+            return None
+        try:
+            palette = read_palette(path, name, mtime_ns)
+        except PipelineError as exc:
+            self._palettes.pop(name, None)
+            self._errors[name] = (mtime_ns, str(exc))
+            self._counters["failures"] += 1
+            self._listing = None
+            return None
+        self._counters["reloads" if current is not None else "loads"] += 1
+        if current is None or name in self._errors:
+            self._listing = None
+        self._errors.pop(name, None)
+        self._palettes[name] = palette
+        return palette
+
+    def _scan(self):
+        # Caller holds the lock.
+        mtime_ns = self._mtime_ns(self.directory)
+        if mtime_ns is not None and mtime_ns == self._scanned_mtime_ns:
+            return
+        self._scanned_mtime_ns = mtime_ns
+        names = set()
+        if mtime_ns is not None:
+            names = {name for name in os.listdir(self.directory) if name.lower().endswith(".json")}
+        for name in names | set(self._palettes) | set(self._errors):
+            self._refresh(name, os.path.join(self.directory, name))
+
+    def load_all(self):
+        with self._lock:
+            self._scanned_mtime_ns = None
+            self._scan()
+            return dict((name, message) for name, (_mtime, message) in self._errors.items())
+
+    def __contains__(self, name):
+        path = self._path(name)
+        return path is not None and os.path.isfile(path)
+
+    def get(self, name):
+        """Return the :class:`Palette` for ``name``; raises PipelineError."""
+        path = self._path(name)
+        if path is None:
+            raise PipelineError(f"unknown settings_file: {name}")
+        with self._lock:
+            palette = self._refresh(name, path)
+            if palette is None:
+                error = self._errors.get(name)
+                if error is not None:
+                    raise PipelineError(error[1])
+                raise PipelineError(f"unknown settings_file: {name}")
+            return palette
+
+    def listing(self):
+        """Return ``(names, etag)`` for the valid settings files."""
+        with self._lock:
+            self._scan()
+            if self._listing is None:
+                names = sorted(self._palettes)
+                self._listing = names, make_etag(json.dumps(names).encode("utf-8"))
+            return self._listing
+
+    def stats(self):
+        with self._lock:
+            payload = dict(self._counters)
+            payload.update(
+                {
+                    "palettes": len(self._palettes),
+                    "errors": {name: message for name, (_mtime, message) in self._errors.items()},
+                }
+            )
+        return payload
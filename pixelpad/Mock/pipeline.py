@@ -0,0 +1,312 @@
+import math
+import struct
+from itertools import groupby
+
+from imaging import decode_image
+from mask_codec import DEFAULT_TOLERANCE, detect_background
+from palette_index import get_palette_index
+
+DEFAULT_GRID_EDGE = 64
+ALPHA_THRESHOLD = 128
+# color_map_mode -> distance metric used by the palette index.
+COLOR_MAP_MODES = {"nearest": "rgb", "lab": "lab", "perceptual": "lab"}
+
+
+class PipelineError(ValueError):
+    pass
+
+
+# Palettes ------------------------------------------------------------------
+
+
+def _parse_color(value):
+    if isinstance(value, str):
+        text = value.strip().lstrip("#")
+        if len(text) in (6, 8):
+            try:
+                channels = [int(text[i : i + 2], 16) for i in range(0, len(text), 2)]
+            except ValueError:
+                return None
+            return tuple(channels[:3])
+        return None
+    if isinstance(value, (list, tuple)) and len(value) >= 3:
+        return tuple(max(0, min(255, int(channel))) for channel in value[:3])
+    if isinstance(value, dict) and all(key in value for key in "rgb"):
+        return tuple(max(0, min(255, int(value[key]))) for key in "rgb")
+    return None
+
+
+def parse_palette(payload):
+    """Return ``[(id, (r, g, b)), ...]`` from a settings JSON document.
+
+    Accepts a list of color objects, an object wrapping that list under
+    ``colors``/``palette``/``beads``/``items``, or a flat ``{id: hex}`` map.
+    """
+    entries = payload
+    if isinstance(payload, dict):
+        for key in ("colors", "palette", "beads", "items"):
+            if isinstance(payload.get(key), list):
+                entries = payload[key]
+                break
+        else:
+            entries = [{"id": key, "hex": value} for key, value in payload.items()]
+    if not isinstance(entries, list):
+        raise PipelineError("settings file has no palette")
+    palette = []
+    for position, item in enumerate(entries):
+        if not isinstance(item, dict):
+            rgb = _parse_color(item)
+            color_id = str(position + 1)
+        else:
+            rgb = None
+            for key in ("hex", "rgba", "rgb", "color", "value"):
+                if key in item:
+                    rgb = _parse_color(item[key])
+                    break
+            if rgb is None:
+                rgb = _parse_color(item)
+            color_id = next(
+                (str(item[key]) for key in ("id", "num", "code", "label", "name") if item.get(key)),
+                str(position + 1),
+            )
+        if rgb is not None:
+            palette.append((color_id, rgb))
+    if not palette:
+        raise PipelineError("settings file has no usable colors")
+    return palette
+
+
+# Stages --------------------------------------------------------------------
+
+
+def _run_lengths(values):
+    return [sum(1 for _ in group) for _, group in groupby(values)]
+
+
+def _detect_block_size(width, height, rgba):
+    # Upscaled pixel art repeats each cell as a block; the gcd of interior run
+    # lengths along sampled rows and columns recovers the block edge.
+    pixels = memoryview(rgba).cast("I")
+    block = 0
+    for y in range(0, height, max(1, height // 16)):
+        runs = _run_lengths(pixels[y * width : (y + 1) * width])
+        for run in runs[1:-1]:
+            block = math.gcd(block, run)
+    for x in range(0, width, max(1, width // 16)):
+        runs = _run_lengths(pixels[x::width])
+        for run in runs[1:-1]:
+            block = math.gcd(block, run)
+    return block if block > 1 else 1
+
+
+def _sample_grid(width, height, rgba, grid_width, grid_height):
+    pixels = memoryview(rgba).cast("I")
+    out = []
+    for gy in range(grid_height):
+        y = min(height - 1, int((gy + 0.5) * height / grid_height))
+        row = y * width
+        for gx in range(grid_width):
+            x = min(width - 1, int((gx + 0.5) * width / grid_width))
+            out.append(pixels[row + x])
+    return struct.pack(f"={len(out)}I", *out)
+
+
+def perfect_pixel(width, height, rgba, grid_mode="default"):
+    if grid_mode == "none":
+        return width, height, bytes(rgba)
+    block = _detect_block_size(width, height, rgba)
+    if block > 1:
+        grid_width = max(1, round(width / block))
+        grid_height = max(1, round(height / block))
+    else:
+        scale = min(1.0, DEFAULT_GRID_EDGE / max(width, height))
+        grid_width = max(1, round(width * scale))
+        grid_height = max(1, round(height * scale))
+    if (grid_width, grid_height) == (width, height):
+        return width, height, bytes(rgba)
+    return grid_width, grid_height, _sample_grid(width, height, rgba, grid_width, grid_height)
+
+
+def crop_box(width, height, mask):
+    rows = [y for y in range(height) if 0 in mask[y * width : (y + 1) * width]]
+    if not rows:
+        return 0, 0, width, height
+    columns = [x for x in range(width) if 0 in mask[x::width]]
+    return columns[0], rows[0], columns[-1] + 1, rows[-1] + 1
+
+
+def crop(width, rgba_or_mask, box, channels):
+    left, top, right, bottom = box
+    stride = width * channels
+    return b"".join(
+        bytes(rgba_or_mask[y * stride + left * channels : y * stride + right * channels])
+        for y in range(top, bottom)
+    )
+
+
+def color_map(
+    width, height, rgba, mask, palette, max_colors=None, alpha_harden=True, metric="rgb"
+):
+    """Map every visible pixel to a palette entry.
+
+    Returns ``(entries, mapping)`` where ``mapping`` holds one 1-based index
+    into ``entries`` per pixel and 0 for background or transparent pixels.
+    """
+    index = get_palette_index([rgb for _color_id, rgb in palette], metric)
+    alpha_cutoff = ALPHA_THRESHOLD if alpha_harden else 1
+    pixels = []
+    pixel_counts = {}
+    for pixel in range(width * height):
+        offset = pixel * 4
+        if mask[pixel] or rgba[offset + 3] < alpha_cutoff:
+            pixels.append(None)
+            continue
+        rgb = tuple(rgba[offset : offset + 3])
+        pixels.append(rgb)
+        pixel_counts[rgb] = pixel_counts.get(rgb, 0) + 1
+
+    def tally():
+        totals = {}
+        for rgb, count in pixel_counts.items():
+            totals[nearest[rgb]] = totals.get(nearest[rgb], 0) + count
+        return totals, sorted(totals, key=lambda index: (-totals[index], index))
+
+    distinct = list(pixel_counts)
+    nearest = dict(zip(distinct, index.nearest_many(distinct)))
+    counts, kept = tally()
+    if max_colors is not None and max_colors > 0 and len(kept) > max_colors:
+        kept_set = set(kept[:max_colors])
+        kept_index = index.subset(sorted(kept_set))
+        dropped = [rgb for rgb in distinct if nearest[rgb] not in kept_set]
+        nearest.update(zip(dropped, kept_index.nearest_many(dropped)))
+        counts, kept = tally()
+
+    position = {index: slot + 1 for slot, index in enumerate(kept)}
+    entries = []
+    for slot, palette_index in enumerate(kept):
+        color_id, (r, g, b) = palette[palette_index]
+        entries.append(
+            {
+                "idx": slot + 1,
+                "id": color_id,
+                "count": counts[palette_index],
+                "rgba": [r, g, b, 255],
+                "hex": f"#{r:02x}{g:02x}{b:02x}",
+            }
+        )
+    mapping = struct.pack(
+        f"<{len(pixels)}H",
+        *(position[nearest[rgb]] if rgb is not None else 0 for rgb in pixels),
+    )
+    return entries, mapping
+
+
+def decode_perfect_pixel(source, grid_mode="default"):
+    width, height, rgba = decode_image(source)
+    return perfect_pixel(width, height, rgba, grid_mode)
+
+
+def remove_background(width, height, rgba, tight_crop, tolerance):
+    """Return ``(box, rgba, mask)`` for the background-removed crop."""
+    mask = detect_background(width, height, rgba, tolerance, ALPHA_THRESHOLD)
+    box = crop_box(width, height, mask) if tight_crop else (0, 0, width, height)
+    return box, crop(width, rgba, box, 4), crop(width, mask, box, 1)
+
+
+# Per-session orchestration -------------------------------------------------
+#
+# Each stage result is stored on the session under ``stages`` together with the
+# parameters that produced it. Asking for a stage with the same parameters
+# returns the stored result; recomputing a stage drops everything after it.
+#
+# ``run(fn, *args)`` executes the CPU-bound part of each stage; the server
+# passes a compute pool's run so stages can leave the request thread.
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+_STAGE_ORDER = ("perfect_pixel", "background", "color_map")
+
+
+def _invalidate_after(session, stage):
+    stages = session.setdefault("stages", {})
+    for later in _STAGE_ORDER[_STAGE_ORDER.index(stage) + 1 :]:
+        stages.pop(later, None)
+
+
+def ensure_perfect_pixel(session, grid_mode=None, run=_call):
+    stages = session.setdefault("stages", {})
+    current = stages.get("perfect_pixel")
+    if current is not None and grid_mode in (None, current["params"]):
+        return current
+    grid_mode = grid_mode or "default"
+    grid_width, grid_height, grid = run(decode_perfect_pixel, session["source"], grid_mode)
+    result = {"params": grid_mode, "width": grid_width, "height": grid_height, "rgba": grid}
+    _invalidate_after(session, "perfect_pixel")
+    stages["perfect_pixel"] = result
+    return result
+
+
+def ensure_background(session, tight_crop=None, tolerance=None, run=_call):
+    stages = session.setdefault("stages", {})
+    current = stages.get("background")
+    if current is not None:
+        current_crop, current_tolerance = current["params"]
+        if tight_crop in (None, current_crop) and tolerance in (None, current_tolerance):
+            return current
+    tight_crop = bool(tight_crop)
+    tolerance = DEFAULT_TOLERANCE if tolerance is None else tolerance
+    grid = ensure_perfect_pixel(session, run=run)
+    width, height = grid["width"], grid["height"]
+    box, rgba, mask = run(remove_background, width, height, grid["rgba"], tight_crop, tolerance)
+    left, top, right, bottom = box
+    result = {
+        "params": (tight_crop, tolerance),
+        "width": right - left,
+        "height": bottom - top,
+        "rgba": rgba,
+        "mask": mask,
+        "padding": [left, top, width - right, height - bottom],
+    }
+    _invalidate_after(session, "background")
+    stages["background"] = result
+    return result
+
+
+def ensure_color_map(
+    session, palette, max_colors=None, alpha_harden=True, mode="nearest", run=_call
+):
+    if mode not in COLOR_MAP_MODES:
+        raise PipelineError(f"unsupported color_map_mode: {mode}")
+    stages = session.setdefault("stages", {})
+    background = ensure_background(session, run=run)
+    params = (max_colors, bool(alpha_harden), mode)
+    entries = tuple(palette)
+    current = stages.get("color_map")
+    # Mappings made from another palette, e.g. before its settings file was
+    # reloaded, are dropped.
+    if current is None or current["palette"] != entries:
+        current = stages["color_map"] = {"palette": entries, "results": {}}
+    cached = current["results"]
+    if params not in cached:
+        entries, mapping = run(
+            color_map,
+            background["width"],
+            background["height"],
+            background["rgba"],
+            background["mask"],
+            palette,
+            max_colors,
+            alpha_harden,
+            COLOR_MAP_MODES[mode],
+        )
+        cached[params] = {
+            "width": background["width"],
+            "height": background["height"],
+            "palette": entries,
+            "mapping": mapping,
+            "padding": background["padding"],
+        }
+    return cached[params]
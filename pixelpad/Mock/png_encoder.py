@@ -0,0 +1,409 @@
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; every step has a pure-Python path.
+    np = None
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+COLOR_MODES = ("auto", "rgba")
+FILTER_MODES = ("adaptive", "none")
+DEFAULT_LEVEL = 6
+MAX_PALETTE = 256
+FILTER_CHUNK_ROWS = 256
+IDAT_CHUNK_BYTES = 64 * 1024
+
+# Both engines produce byte-identical files: palettes are ordered the same way
+# (translucent entries first so tRNS stays short, then by packed value) and
+# filter ties resolve to the lowest filter type.
+
+
+def _chunk(tag, payload):
+    return (
+        struct.pack(">I", len(payload))
+        + tag
+        + payload
+        + struct.pack(">I", zlib.crc32(tag + payload) & 0xFFFFFFFF)
+    )
+
+
+def _header(width, height, bit_depth, color_type, palette):
+    ihdr = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    chunks = [PNG_SIGNATURE, _chunk(b"IHDR", ihdr)]
+    if palette is not None:
+        chunks.append(_chunk(b"PLTE", b"".join(bytes(color[:3]) for color in palette)))
+        alphas = bytes(color[3] for color in palette).rstrip(b"\xff")
+        if alphas:
+            chunks.append(_chunk(b"tRNS", alphas))
+    return b"".join(chunks)
+
+
+def encode_png(width, height, raw, level=DEFAULT_LEVEL, bit_depth=8, color_type=6, palette=None):
+    """Wrap already filtered scanlines in a PNG container.
+
+    ``palette`` is a list of RGBA tuples and is required for color type 3.
+    """
+    return b"".join(
+        [
+            _header(width, height, bit_depth, color_type, palette),
+            _chunk(b"IDAT", zlib.compress(raw, level)),
+            _chunk(b"IEND", b""),
+        ]
+    )
+
+
+def iter_png(
+    width,
+    height,
+    raw_parts,
+    level=DEFAULT_LEVEL,
+    bit_depth=8,
+    color_type=6,
+    palette=None,
+    idat_bytes=IDAT_CHUNK_BYTES,
+):
+    """Like :func:`encode_png`, but yields the file piece by piece.
+
+    ``raw_parts`` is an iterable of filtered scanline bytes; each part is
+    compressed as it arrives and the stream is cut into IDAT chunks of
+    ``idat_bytes``, so only one part and one chunk are held at a time.
+    """
+    yield _header(width, height, bit_depth, color_type, palette)
+    compressor = zlib.compressobj(level)
+    pending = bytearray()
+    for raw in raw_parts:
+        pending += compressor.compress(raw)
+        while len(pending) >= idat_bytes:
+            yield _chunk(b"IDAT", bytes(pending[:idat_bytes]))
+            del pending[:idat_bytes]
+    pending += compressor.flush()
+    yield _chunk(b"IDAT", bytes(pending))
+    yield _chunk(b"IEND", b"")
+
+
+def _palette_order(colors):
+    # colors: 4-byte RGBA values; returns them in output order.
+    return sorted(colors, key=lambda rgba: (rgba[3] == 255, int.from_bytes(rgba, "little")))
+
+
+def _bit_depth(count):
+    for depth in (1, 2, 4):
+        if count <= 1 << depth:
+            return depth
+    return 8
+
+
+# Filters -------------------------------------------------------------------
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def _py_filter_row(kind, row, prev, bpp):
+    if kind == 0:
+        return bytes(row)
+    out = bytearray(len(row))
+    for i, value in enumerate(row):
+        a = row[i - bpp] if i >= bpp else 0
+        b = prev[i]
+        if kind == 1:
+            predictor = a
+        elif kind == 2:
+            predictor = b
+        elif kind == 3:
+            predictor = (a + b) >> 1
+        else:
+            predictor = _paeth(a, b, prev[i - bpp] if i >= bpp else 0)
+        out[i] = (value - predictor) & 0xFF
+    return bytes(out)
+
+
+def _score(filtered):
+    # libpng's heuristic: sum of the bytes read as signed values.
+    return sum(value if value < 128 else 256 - value for value in filtered)
+
+
+def _py_filter(rows, bpp, adaptive, prev=None):
+    # ``prev`` is the scanline above rows[0] when filtering a band of a
+    # larger image.
+    if prev is None:
+        prev = bytes(len(rows[0])) if rows else b""
+    raw = bytearray()
+    for row in rows:
+        if adaptive:
+            candidates = [_py_filter_row(kind, row, prev, bpp) for kind in range(5)]
+            kind = min(range(5), key=lambda k: _score(candidates[k]))
+            raw.append(kind)
+            raw += candidates[kind]
+        else:
+            raw.append(0)
+            raw += row
+        prev = row
+    return bytes(raw)
+
+
+def _np_filter(rows, bpp, adaptive, prev=None):
+    height, stride = rows.shape
+    raw = np.empty((height, stride + 1), dtype=np.uint8)
+    if not adaptive:
+        raw[:, 0] = 0
+        raw[:, 1:] = rows
+        return raw.tobytes()
+    for start in range(0, height, FILTER_CHUNK_ROWS):
+        stop = min(height, start + FILTER_CHUNK_ROWS)
+        x = rows[start:stop].astype(np.int16)
+        b = np.zeros_like(x)
+        if start:
+            b[0] = rows[start - 1]
+        elif prev is not None:
+            b[0] = prev
+        b[1:] = x[:-1]
+        a = np.zeros_like(x)
+        a[:, bpp:] = x[:, :-bpp]
+        c = np.zeros_like(x)
+        c[:, bpp:] = b[:, :-bpp]
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        candidates = (
+            np.stack([x, x - a, x - b, x - ((a + b) >> 1), x - paeth]) & 0xFF
+        ).astype(np.uint8)
+        scores = np.abs(candidates.view(np.int8).astype(np.int32)).sum(axis=2)
+        kinds = scores.argmin(axis=0)
+        raw[start:stop, 0] = kinds
+        raw[start:stop, 1:] = candidates[kinds, np.arange(stop - start)]
+    return raw.tobytes()
+
+
+# Palette reduction -----------------------------------------------------------
+
+
+def _np_rows(width, height, pixels):
+    if not isinstance(pixels, np.ndarray):
+        pixels = np.frombuffer(pixels, dtype=np.uint8)
+    return np.ascontiguousarray(pixels).reshape(height, width * 4)
+
+
+def _py_indexed(width, height, pixels):
+    # Returns (palette, per-pixel slot bytes) or None past MAX_PALETTE colors.
+    values = memoryview(bytes(pixels)).cast("I")
+    slots = {}
+    indices = bytearray(width * height)
+    for position, value in enumerate(values):
+        slot = slots.get(value)
+        if slot is None:
+            if len(slots) == MAX_PALETTE:
+                return None
+            slot = slots[value] = len(slots)
+        indices[position] = slot
+    seen = [struct.pack("=I", value) for value in slots]
+    palette = _palette_order(seen)
+    table = bytearray(256)
+    for slot, color in enumerate(seen):
+        table[slot] = palette.index(color)
+    return [tuple(color) for color in palette], bytes(indices.translate(table))
+
+
+def _np_indexed(width, height, pixels):
+    packed = _np_rows(width, height, pixels).view("<u4").reshape(-1)
+    # Guess the colors from a sample and only sort the pixels the guess misses;
+    # a full np.unique over every pixel costs more than the compression saves.
+    unique = np.unique(packed[:: max(1, len(packed) // 4096)])
+    while True:
+        if len(unique) > MAX_PALETTE:
+            return None
+        inverse = np.minimum(np.searchsorted(unique, packed), len(unique) - 1)
+        missing = unique[inverse] != packed
+        if not missing.any():
+            break
+        unique = np.union1d(unique, packed[missing])
+    colors = unique.astype("<u4").view(np.uint8).reshape(-1, 4)
+    order = np.lexsort((unique, colors[:, 3] == 255))
+    rank = np.empty(len(order), dtype=np.uint8)
+    rank[order] = np.arange(len(order), dtype=np.uint8)
+    palette = [tuple(color) for color in colors[order].tolist()]
+    return palette, rank[inverse].reshape(height, width)
+
+
+def _py_pack(width, height, indices, depth):
+    if depth == 8:
+        return [indices[y * width : (y + 1) * width] for y in range(height)]
+    per_byte = 8 // depth
+    rows = []
+    for y in range(height):
+        row = bytearray()
+        line = indices[y * width : (y + 1) * width]
+        for start in range(0, width, per_byte):
+            value = 0
+            for offset, slot in enumerate(line[start : start + per_byte]):
+                value |= slot << (8 - depth * (offset + 1))
+            row.append(value)
+        rows.append(bytes(row))
+    return rows
+
+
+def _np_pack(width, height, indices, depth):
+    if depth == 8:
+        return indices
+    per_byte = 8 // depth
+    padded = np.zeros((height, -(-width // per_byte) * per_byte), dtype=np.uint8)
+    padded[:, :width] = indices
+    shifts = (8 - depth * (np.arange(per_byte) + 1)).astype(np.uint8)
+    groups = padded.reshape(height, -1, per_byte) << shifts
+    return np.bitwise_or.reduce(groups, axis=2).astype(np.uint8)
+
+
+def encode_pixels(
+    width, height, pixels, use_numpy=False, mode="auto", filters="adaptive", level=DEFAULT_LEVEL
+):
+    """Encode ``width`` x ``height`` RGBA pixels (bytes or an ndarray).
+
+    ``mode`` "auto" writes a palette image (color type 3 at the smallest bit
+    depth that fits) when there are at most 256 distinct colors and RGBA
+    otherwise. Adaptive filtering picks a filter per row for RGBA output;
+    palette images always use filter 0, as the PNG spec recommends.
+    """
+    if mode not in COLOR_MODES:
+        raise ValueError(f"unknown png color mode: {mode}")
+    if filters not in FILTER_MODES:
+        raise ValueError(f"unknown png filter mode: {filters}")
+    if not 0 <= level <= 9:
+        raise ValueError(f"invalid compression level: {level}")
+    indexed = None
+    if mode != "rgba" and width * height:
+        indexed = (_np_indexed if use_numpy else _py_indexed)(width, height, pixels)
+    if indexed is None:
+        if use_numpy:
+            raw = _np_filter(_np_rows(width, height, pixels), 4, filters == "adaptive")
+        else:
+            stride = width * 4
+            rows = [bytes(pixels[y * stride : (y + 1) * stride]) for y in range(height)]
+            raw = _py_filter(rows, 4, filters == "adaptive")
+        return encode_png(width, height, raw, level)
+    palette, indices = indexed
+    depth = _bit_depth(len(palette))
+    if use_numpy:
+        raw = _np_filter(_np_pack(width, height, indices, depth), 1, False)
+    else:
+        raw = _py_filter(_py_pack(width, height, indices, depth), 1, False)
+    return encode_png(width, height, raw, level, depth, 3, palette)
+
+
+def encode_row_templates(width, height, colors, templates, order, level=DEFAULT_LEVEL):
+    """Encode an image whose rows repeat a few templates.
+
+    ``templates`` are rows of one index into ``colors`` per pixel and row y of
+    the image is ``templates[order[y]]``. The output is byte-identical to
+    :func:`encode_pixels` on the expanded RGBA pixels, but only the distinct
+    rows are ever indexed and packed.
+    """
+    if not 0 <= level <= 9:
+        raise ValueError(f"invalid compression level: {level}")
+    used = sorted({slot for index in set(order) for slot in templates[index]})
+    if len(used) > MAX_PALETTE:
+        raise ValueError("row templates use more than 256 colors")
+    palette = _palette_order(list({bytes(colors[slot]) for slot in used}))
+    table = bytearray(256)
+    for slot in used:
+        table[slot] = palette.index(bytes(colors[slot]))
+    depth = _bit_depth(len(palette))
+    packed = {
+        index: b"\x00" + _py_pack(width, 1, bytes(templates[index]).translate(table), depth)[0]
+        for index in set(order)
+    }
+    raw = b"".join(packed[index] for index in order)
+    return encode_png(width, height, raw, level, depth, 3, [tuple(color) for color in palette])
+
+
+# Streaming -------------------------------------------------------------------
+
+
+def _band_height(width, pixels):
+    size = pixels.size if np is not None and isinstance(pixels, np.ndarray) else len(pixels)
+    return size // (width * 4)
+
+
+def _rgba_parts(width, bands, use_numpy, adaptive):
+    stride = width * 4
+    prev = None
+    for pixels in bands:
+        if use_numpy:
+            rows = _np_rows(width, _band_height(width, pixels), pixels)
+            if len(rows):
+                yield _np_filter(rows, 4, adaptive, prev)
+                prev = rows[-1].copy()
+        else:
+            data = bytes(pixels)
+            rows = [data[y * stride : (y + 1) * stride] for y in range(len(data) // stride)]
+            if rows:
+                yield _py_filter(rows, 4, adaptive, prev)
+                prev = rows[-1]
+
+
+def _indexed_parts(width, bands, palette, depth, use_numpy):
+    if use_numpy:
+        keys = np.frombuffer(b"".join(palette), dtype="<u4")
+        order = np.argsort(keys).astype(np.uint8)
+        keys = keys[order]
+    else:
+        slots = {struct.unpack("=I", color)[0]: slot for slot, color in enumerate(palette)}
+    for pixels in bands:
+        height = _band_height(width, pixels)
+        if not height:
+            continue
+        if use_numpy:
+            packed = _np_rows(width, height, pixels).view("<u4").reshape(-1)
+            position = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+            if (keys[position] != packed).any():
+                raise ValueError("pixel color missing from the stream palette")
+            indices = order[position].reshape(height, width)
+            yield _np_filter(_np_pack(width, height, indices, depth), 1, False)
+        else:
+            try:
+                indices = bytes([slots[value] for value in memoryview(bytes(pixels)).cast("I")])
+            except KeyError:
+                raise ValueError("pixel color missing from the stream palette") from None
+            yield _py_filter(_py_pack(width, height, indices, depth), 1, False)
+
+
+def stream_pixels(
+    width,
+    height,
+    bands,
+    colors=None,
+    use_numpy=False,
+    filters="adaptive",
+    level=DEFAULT_LEVEL,
+    idat_bytes=IDAT_CHUNK_BYTES,
+):
+    """Yield a PNG built from ``bands``, RGBA buffers covering consecutive rows.
+
+    The colors cannot be counted before the first bytes go out, so a palette
+    image is written only when ``colors`` lists every RGBA value the bands
+    may contain and there are at most 256 of them; otherwise the output is
+    RGBA. RGBA output matches :func:`encode_pixels` scanline for scanline.
+    """
+    if filters not in FILTER_MODES:
+        raise ValueError(f"unknown png filter mode: {filters}")
+    if not 0 <= level <= 9:
+        raise ValueError(f"invalid compression level: {level}")
+    palette = None
+    if colors is not None:
+        unique = {bytes(color) for color in colors}
+        if len(unique) <= MAX_PALETTE:
+            palette = _palette_order(list(unique))
+    if palette is None:
+        parts = _rgba_parts(width, bands, use_numpy, filters == "adaptive")
+        return iter_png(width, height, parts, level, idat_bytes=idat_bytes)
+    depth = _bit_depth(len(palette))
+    parts = _indexed_parts(width, bands, palette, depth, use_numpy)
+    return iter_png(
+        width, height, parts, level, depth, 3, [tuple(color) for color in palette], idat_bytes
+    )
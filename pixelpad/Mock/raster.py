@@ -0,0 +1,224 @@
+import os
+
+from png_encoder import (  # noqa: F401
+    DEFAULT_LEVEL,
+    PNG_SIGNATURE,
+    encode_pixels,
+    encode_png,
+    encode_row_templates,
+    stream_pixels,
+)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python engine is always available.
+    np = None
+
+ENGINES = ("python", "numpy")
+TRANSPARENT = (0, 0, 0, 0)
+# Streamed renders draw about this many pixels (1 MiB of RGBA) per band.
+STREAM_BAND_PIXELS = 1 << 18
+DEFAULT_ENGINE = os.environ.get("PIXELPAD_RASTER_ENGINE", "auto").strip().lower()
+
+
+def available_engines():
+    return [name for name in ENGINES if name != "numpy" or np is not None]
+
+
+def resolve_engine(engine=None):
+    name = (engine or DEFAULT_ENGINE or "auto").lower()
+    if name == "auto":
+        return "numpy" if np is not None else "python"
+    if name not in ENGINES:
+        raise ValueError(f"unknown raster engine: {name}")
+    if name == "numpy" and np is None:
+        raise RuntimeError("numpy raster engine requested but numpy is not installed")
+    return name
+
+
+# Pure-Python engine: builds the RGBA buffer pixel by pixel.
+
+
+def _py_banded_pixels(width, height, palette, region):
+    x0, y0, out_width, out_height, step = region
+    band_height = max(1, height // len(palette))
+    pixels = bytearray()
+    for row in range(out_height):
+        idx = min((y0 + row * step) // band_height, len(palette) - 1)
+        r, g, b, a = palette[idx]
+        for _ in range(out_width):
+            pixels.extend([r, g, b, a])
+    return bytes(pixels)
+
+
+# A pixel of an isolated layer is lit when (x * 3 + y * 5 + seed) % 11 == 0.
+# That depends on x only through x * 3 % 11 and on y and the seed only through
+# (y * 5 + seed) % 11, so a layer has at most 11 distinct rows. Both engines
+# build those rows once per layer from residues shared by every layer.
+
+
+def _py_isolated_layers(width, height, layers, region):
+    x0, y0, out_width, out_height, step = region
+    columns = [(x0 + column * step) * 3 % 11 for column in range(out_width)]
+    rows = [(y0 + row * step) * 5 % 11 for row in range(out_height)]
+    clear = bytes(4)
+    out = []
+    for rgba, seed in layers:
+        color = bytes(rgba)
+        templates = [
+            b"".join(color if (residue + offset) % 11 == 0 else clear for residue in columns)
+            for offset in range(11)
+        ]
+        out.append(b"".join(templates[(residue + seed) % 11] for residue in rows))
+    return out
+
+
+# NumPy engine: builds whole (height, width, 4) arrays at once.
+
+
+def _np_axis(origin, count, step):
+    return origin + np.arange(count, dtype=np.int64) * step
+
+
+def _np_banded_pixels(width, height, palette, region):
+    x0, y0, out_width, out_height, step = region
+    band_height = max(1, height // len(palette))
+    colors = np.asarray(palette, dtype=np.uint8).reshape(-1, 4)
+    rows = np.minimum(_np_axis(y0, out_height, step) // band_height, len(palette) - 1)
+    return np.ascontiguousarray(
+        np.broadcast_to(colors[rows][:, None, :], (out_height, out_width, 4))
+    )
+
+
+def _np_isolated_layers(width, height, layers, region):
+    x0, y0, out_width, out_height, step = region
+    columns = _np_axis(x0, out_width, step) * 3 % 11
+    rows = _np_axis(y0, out_height, step) * 5 % 11
+    lit = (columns[None, :] + np.arange(11)[:, None]) % 11 == 0
+    out = []
+    for rgba, seed in layers:
+        templates = np.zeros((11, out_width, 4), dtype=np.uint8)
+        templates[lit] = np.asarray(rgba, dtype=np.uint8)
+        out.append(templates[(rows + seed) % 11])
+    return out
+
+
+def png_from_pixels(
+    width, height, pixels, engine=None, mode="auto", filters="adaptive", level=DEFAULT_LEVEL
+):
+    # See png_encoder.encode_pixels for mode, filters and level.
+    use_numpy = resolve_engine(engine) == "numpy"
+    return encode_pixels(width, height, pixels, use_numpy, mode, filters, level)
+
+
+def draw_png(draw, region, level=DEFAULT_LEVEL, engine=None):
+    """Encode ``function(*args, region)`` for ``draw = (function, args)``.
+
+    A plain function of picklable arguments, so it can run in a worker process.
+    """
+    function, args = draw
+    pixels = function(*args, region)
+    return png_from_pixels(region[2], region[3], pixels, engine, level=level)
+
+
+def layer_pngs(draws, region, level=DEFAULT_LEVEL, engine=None):
+    """Encode several :func:`draw_png` draws over the same region.
+
+    Returns the PNGs in the order of ``draws``, byte-identical to draw_png.
+    isolated_pixels draws never expand to RGBA: every layer is one of the same
+    11 index rows (see above), so those rows are built once for all layers
+    and each layer only picks its row order and colors.
+    """
+    x0, y0, out_width, out_height, step = region
+    templates = rows = None
+    images = []
+    for function, args in draws:
+        if function is not isolated_pixels:
+            images.append(draw_png((function, args), region, level, engine))
+            continue
+        if templates is None:
+            columns = [(x0 + column * step) * 3 % 11 for column in range(out_width)]
+            templates = [
+                bytes(int((residue + offset) % 11 == 0) for residue in columns)
+                for offset in range(11)
+            ]
+            rows = [(y0 + row * step) * 5 % 11 for row in range(out_height)]
+        _width, _height, rgba, seed = args
+        order = [(residue + seed) % 11 for residue in rows]
+        images.append(
+            encode_row_templates(
+                out_width, out_height, [TRANSPARENT, tuple(rgba)], templates, order, level
+            )
+        )
+    return images
+
+
+def stream_png(
+    width, height, bands, colors=None, engine=None, filters="adaptive", level=DEFAULT_LEVEL
+):
+    # See png_encoder.stream_pixels; yields the PNG in pieces.
+    use_numpy = resolve_engine(engine) == "numpy"
+    return stream_pixels(width, height, bands, colors, use_numpy, filters, level)
+
+
+def solid_png(width, height, rgba, engine=None):
+    engine = resolve_engine(engine)
+    if engine == "numpy":
+        pixels = np.empty((height, width, 4), dtype=np.uint8)
+        pixels[:, :] = np.asarray(rgba, dtype=np.uint8)
+    else:
+        r, g, b, a = rgba
+        pixels = bytes([r, g, b, a]) * (width * height)
+    return png_from_pixels(width, height, pixels, engine)
+
+
+# Patterns are defined over the full width x height image. ``region`` is
+# (x, y, out_width, out_height, step): the output covers out_width x out_height
+# samples starting at (x, y), taking every ``step``-th pixel in each direction.
+
+
+def full_region(width, height):
+    return 0, 0, width, height, 1
+
+
+def region_bands(region, band_pixels=STREAM_BAND_PIXELS):
+    """Split ``region`` into consecutive row bands of about ``band_pixels``."""
+    x0, y0, out_width, out_height, step = region
+    rows = max(1, band_pixels // max(1, out_width))
+    for start in range(0, out_height, rows):
+        yield x0, y0 + start * step, out_width, min(rows, out_height - start), step
+
+
+def banded_pixels(width, height, palette, region=None, engine=None):
+    region = region or full_region(width, height)
+    if not palette:
+        return bytes(region[2] * region[3] * 4)
+    if resolve_engine(engine) == "numpy":
+        return _np_banded_pixels(width, height, palette, region)
+    return _py_banded_pixels(width, height, palette, region)
+
+
+def isolated_pixels(width, height, rgba, seed, region=None, engine=None):
+    return isolated_layers(width, height, [(rgba, seed)], region, engine)[0]
+
+
+def isolated_layers(width, height, layers, region=None, engine=None):
+    """Pixels for several isolated layers, ``layers`` being (rgba, seed) pairs."""
+    region = region or full_region(width, height)
+    if resolve_engine(engine) == "numpy":
+        return _np_isolated_layers(width, height, layers, region)
+    return _py_isolated_layers(width, height, layers, region)
+
+
+def banded_png(width, height, palette, engine=None):
+    if not palette:
+        return solid_png(width, height, (0, 0, 0, 0), engine)
+    engine = resolve_engine(engine)
+    pixels = banded_pixels(width, height, palette, engine=engine)
+    return png_from_pixels(width, height, pixels, engine)
+
+
+def isolated_png(width, height, rgba, seed, engine=None):
+    engine = resolve_engine(engine)
+    pixels = isolated_pixels(width, height, rgba, seed, engine=engine)
+    return png_from_pixels(width, height, pixels, engine)
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def make_etag(data):
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def render_key(session_id, selected_ids, width, height, level=None):
+    # Order and repeats change the rendered image, so ids are trimmed but kept as given.
+    normalized = tuple(item.strip() for item in selected_ids if item.strip())
+    return session_id, normalized, int(width), int(height), level
+
+
+class RenderCache:
+    """LRU cache of encoded PNGs bounded by the total size of stored bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max(0, int(max_bytes or 0))
+        self._entries = OrderedDict()
+        self._sessions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "rejected": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def put(self, key, data):
+        entry = (make_etag(data), data)
+        with self._lock:
+            if len(data) > self.max_bytes:
+                self._counters["rejected"] += 1
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            self._sessions.setdefault(key[0], set()).add(key)
+            self._bytes += len(data)
+            self._counters["stores"] += 1
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters["evictions"] += 1
+        return entry
+
+    def invalidate_session(self, session_id):
+        with self._lock:
+            for key in list(self._sessions.get(session_id, ())):
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[1])
+        keys = self._sessions.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._sessions[key[0]]
+
+    def stats(self):
+        with self._lock:
+            payload = dict(self._counters)
+            payload.update(
+                {
+                    "entries": len(self._entries),
+                    "bytes": self._bytes,
+                    "max_bytes": self.max_bytes,
+                }
+            )
+        lookups = payload["hits"] + payload["misses"]
+        payload["hit_ratio"] = payload["hits"] / lookups if lookups else 0.0
+        return payload
@@ -0,0 +1,125 @@
+import sys
+from array import array
+
+
+def intern_ids(ids):
+    # Only the strings are interned: a table of whole tuples would grow with
+    # every distinct palette subset for the life of the process.
+    return tuple(sys.intern(str(color_id)) for color_id in ids)
+
+
+def _rgba_from_hex(hex_value):
+    hex_value = (hex_value or "").lstrip("#")
+    if len(hex_value) != 6:
+        return 0, 0, 0, 255
+    return int(hex_value[0:2], 16), int(hex_value[2:4], 16), int(hex_value[4:6], 16), 255
+
+
+def _entry_rgba(entry):
+    rgba = entry.get("rgba")
+    if isinstance(rgba, (list, tuple)) and len(rgba) == 4:
+        return tuple(int(value) & 0xFF for value in rgba)
+    return _rgba_from_hex(entry.get("hex"))
+
+
+class ColorTable:
+    """Detected colors as a tuple of interned ids, packed RGBA bytes and uint32 counts."""
+
+    __slots__ = ("ids", "rgba", "counts")
+
+    def __init__(self, ids, rgba, counts):
+        self.ids = intern_ids(ids)
+        self.rgba = bytes(rgba)
+        self.counts = array("I", counts)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Build from ``[{"id", "count", "rgba" or "hex"}, ...]`` dicts."""
+        rgba = bytearray()
+        for entry in entries:
+            rgba.extend(_entry_rgba(entry))
+        return cls(
+            [entry.get("id", "") for entry in entries],
+            rgba,
+            [int(entry.get("count") or 0) for entry in entries],
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def colors(self):
+        rgba = self.rgba
+        return [tuple(rgba[offset : offset + 4]) for offset in range(0, len(rgba), 4)]
+
+    def find(self, color_id):
+        """Return the RGBA tuple for ``color_id``, or None."""
+        try:
+            offset = self.ids.index(color_id) * 4
+        except ValueError:
+            return None
+        return tuple(self.rgba[offset : offset + 4])
+
+    def to_json(self):
+        entries = []
+        for color_id, count, rgba in zip(self.ids, self.counts, self.colors()):
+            entries.append(
+                {
+                    "id": color_id,
+                    "count": count,
+                    "rgba": list(rgba),
+                    "hex": "#%02x%02x%02x" % rgba[:3],
+                }
+            )
+        return entries
+
+    def __getstate__(self):
+        return self.ids, self.rgba, self.counts
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+EMPTY_COLORS = ColorTable((), b"", ())
+
+
+class MockSession:
+    """A /process session.
+
+    Holds the shared settings :class:`palette_registry.Palette` (or None) and
+    a :class:`ColorTable`; the JSON payload is only built by :meth:`to_json`.
+    """
+
+    __slots__ = ("session_id", "settings_file", "palette", "width", "height", "total_pixels", "colors")
+
+    def __init__(self, session_id, settings_file, width, height, total_pixels, colors, palette=None):
+        self.session_id = session_id
+        self.settings_file = sys.intern(settings_file)
+        self.palette = palette
+        self.width = width
+        self.height = height
+        self.total_pixels = total_pixels
+        self.colors = colors
+
+    def to_json(self):
+        return {
+            "session_id": self.session_id,
+            "total_pixels": self.total_pixels,
+            "detected_colors": self.colors.to_json(),
+            "settings_file": self.settings_file,
+            "width": self.width,
+            "height": self.height,
+        }
+
+    def __getstate__(self):
+        return (
+            self.session_id,
+            self.settings_file,
+            self.width,
+            self.height,
+            self.total_pixels,
+            self.colors,
+            self.palette,
+        )
+
+    def __setstate__(self, state):
+        self.__init__(*state)
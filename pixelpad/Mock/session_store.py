@@ -0,0 +1,258 @@
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from snapshot import Snapshot, SnapshotError, write_sections
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 30 * 60
+BACKENDS = ("memory", "sqlite")
+
+
+class SessionStore:
+    """Interface shared by all session backends.
+
+    Payloads are opaque to the store. ``max_entries`` and ``ttl_seconds`` of
+    ``None`` or ``0`` disable the corresponding bound.
+    """
+
+    backend = "abstract"
+
+    def __init__(
+        self,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries or None
+        self.ttl_seconds = ttl_seconds or None
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "puts": 0,
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "deleted": 0,
+        }
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def put(self, session_id, payload):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def _count(self, key, amount=1):
+        self._counters[key] += amount
+
+    def stats(self):
+        with self._lock:
+            payload = dict(self._counters)
+        payload.update(
+            {
+                "backend": self.backend,
+                "entries": len(self),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+        )
+        return payload
+
+
+class MemorySessionStore(SessionStore):
+    backend = "memory"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ordered by last access, so the head is both the LRU and the oldest entry.
+        self._entries = OrderedDict()
+
+    def _expired(self, accessed, now):
+        return self.ttl_seconds is not None and now - accessed > self.ttl_seconds
+
+    def _purge_expired(self, now):
+        while self._entries:
+            session_id, (accessed, _payload) = next(iter(self._entries.items()))
+            if not self._expired(accessed, now):
+                break
+            del self._entries[session_id]
+            self._count("evicted_ttl")
+
+    def get(self, session_id):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self._count("misses")
+                return None
+            accessed, payload = entry
+            if self._expired(accessed, now):
+                del self._entries[session_id]
+                self._count("evicted_ttl")
+                self._count("misses")
+                return None
+            self._entries[session_id] = (now, payload)
+            self._entries.move_to_end(session_id)
+            self._count("hits")
+            return payload
+
+    def put(self, session_id, payload):
+        now = self._clock()
+        with self._lock:
+            self._purge_expired(now)
+            self._entries[session_id] = (now, payload)
+            self._entries.move_to_end(session_id)
+            self._count("puts")
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count("evicted_lru")
+
+    def delete(self, session_id):
+        with self._lock:
+            if self._entries.pop(session_id, None) is not None:
+                self._count("deleted")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def snapshot(self, path):
+        """Write every live session to ``path``, least recently used first."""
+        with self._lock:
+            self._purge_expired(self._clock())
+            # Pickled under the lock: pipeline sessions are mutated in place.
+            blob = pickle.dumps(
+                [(session_id, payload) for session_id, (_accessed, payload) in self._entries.items()],
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+            count = len(self._entries)
+        meta = json.dumps({"sessions": count}).encode("utf-8")
+        write_sections(path, [("meta", meta), ("sessions", blob)])
+        return count
+
+    def restore(self, path):
+        """Load sessions written by :meth:`snapshot`; their idle time restarts now.
+
+        Returns the number restored. Raises ``OSError`` or
+        :class:`snapshot.SnapshotError` when ``path`` is unusable.
+        """
+        snapshot = Snapshot(path)
+        try:
+            entries = pickle.loads(snapshot.section("sessions"))
+        except (KeyError, EOFError, AttributeError, ImportError, pickle.UnpicklingError) as exc:
+            raise SnapshotError(f"unusable session snapshot: {path}") from exc
+        finally:
+            snapshot.close()
+        for session_id, payload in entries:
+            self.put(session_id, payload)
+        return len(entries)
+
+
+class SqliteSessionStore(SessionStore):
+    """Session store shared between processes through a sqlite file.
+
+    Counters are per process; entry counts reflect the shared table.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, *args, **kwargs):
+        kwargs.setdefault("clock", time.time)
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, payload BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)"
+        )
+
+    def get(self, session_id):
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, accessed FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            blob, accessed = row
+            if self.ttl_seconds is not None and now - accessed > self.ttl_seconds:
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._count("evicted_ttl")
+                self._count("misses")
+                return None
+            self._conn.execute(
+                "UPDATE sessions SET accessed = ? WHERE session_id = ?", (now, session_id)
+            )
+            self._count("hits")
+        return pickle.loads(blob)
+
+    def put(self, session_id, payload):
+        now = self._clock()
+        blob = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self.ttl_seconds is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM sessions WHERE accessed < ?", (now - self.ttl_seconds,)
+                )
+                self._count("evicted_ttl", max(0, cursor.rowcount))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, payload, accessed) "
+                "VALUES (?, ?, ?)",
+                (session_id, blob, now),
+            )
+            self._count("puts")
+            if self.max_entries is not None:
+                overflow = len(self) - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM sessions WHERE session_id IN ("
+                        "SELECT session_id FROM sessions ORDER BY accessed LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._count("evicted_lru", overflow)
+
+    def delete(self, session_id):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            if cursor.rowcount > 0:
+                self._count("deleted")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(
+    backend="memory",
+    max_entries=DEFAULT_MAX_ENTRIES,
+    ttl_seconds=DEFAULT_TTL_SECONDS,
+    path=None,
+):
+    if backend == "memory":
+        return MemorySessionStore(max_entries, ttl_seconds)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("sqlite session store requires a database path")
+        return SqliteSessionStore(path, max_entries, ttl_seconds)
+    raise ValueError(f"unknown session backend: {backend}")
@@ -0,0 +1,140 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+
+MAGIC = b"PPSNAP1\n"
+# Section count and byte order, then one (name, offset, length) per section.
+_HEADER = struct.Struct("<I4s")
+_ENTRY = struct.Struct("<16sQQ")
+_BYTE_ORDER = sys.byteorder[:1].encode("ascii") * 4
+_ALIGN = 8
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _chunks(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return (value,)
+    return value
+
+
+def write_sections(path, sections):
+    """Atomically write ``[(name, data), ...]`` to ``path``.
+
+    ``data`` is a bytes-like value or an iterable of them. Sections start on
+    8-byte boundaries so arrays can be cast in place, and arrays are written
+    in the machine's byte order, which the header records.
+    """
+    temp_path = f"{path}.tmp"
+    table_bytes = _HEADER.size + _ENTRY.size * len(sections)
+    start = len(MAGIC) + table_bytes
+    start += -start % _ALIGN
+    table = []
+    with open(temp_path, "wb") as handle:
+        handle.seek(start)
+        offset = start
+        for name, data in sections:
+            length = 0
+            for chunk in _chunks(data):
+                handle.write(chunk)
+                length += len(chunk)
+            table.append(_ENTRY.pack(name.encode("ascii"), offset, length))
+            offset += length
+            padding = -offset % _ALIGN
+            handle.write(b"\0" * padding)
+            offset += padding
+        handle.seek(0)
+        handle.write(MAGIC + _HEADER.pack(len(sections), _BYTE_ORDER) + b"".join(table))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, path)
+
+
+class Snapshot:
+    """A snapshot file mapped read-only; sections are views into the mapping.
+
+    Nothing is copied on open, so opening costs the same at any file size.
+    Raises :class:`SnapshotError` when ``path`` is not a snapshot and
+    ``OSError`` when it cannot be read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            if handle.read(len(MAGIC)) != MAGIC:
+                raise SnapshotError(f"not a snapshot: {path}")
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        count, byte_order = _HEADER.unpack_from(self._map, len(MAGIC))
+        if byte_order != _BYTE_ORDER:
+            self.close()
+            raise SnapshotError(f"snapshot written with another byte order: {path}")
+        self._sections = {}
+        for index in range(count):
+            name, offset, length = _ENTRY.unpack_from(
+                self._map, len(MAGIC) + _HEADER.size + index * _ENTRY.size
+            )
+            if offset + length > len(self._map):
+                self.close()
+                raise SnapshotError(f"truncated snapshot: {path}")
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def section(self, name):
+        offset, length = self._sections[name]
+        return self._view[offset : offset + length]
+
+    def array(self, name, typecode):
+        return self.section(name).cast(typecode)
+
+    def close(self):
+        # Views handed out keep the mapping alive; it is then freed with them.
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            pass
+
+
+class Snapshotter:
+    """Runs ``jobs`` every ``interval`` seconds on a daemon thread.
+
+    :meth:`close` stops the thread and runs every job once more. A failing
+    job is reported and retried on the next tick.
+    """
+
+    def __init__(self, interval, jobs):
+        self.interval = interval
+        self.jobs = list(jobs)
+        self.runs = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+        if interval > 0 and self.jobs:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run()
+
+    def run(self):
+        for job in self.jobs:
+            try:
+                job()
+                self.runs += 1
+            except Exception as exc:
+                self.failures += 1
+                print(f"Snapshot failed: {exc}", file=sys.stderr)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.run()
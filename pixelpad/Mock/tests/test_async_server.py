@@ -0,0 +1,69 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from async_server import MAX_HEADER_BYTES, serve_async
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    threading.Thread(target=serve_async, args=(EchoHandler, "127.0.0.1", port, 2), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _exchange(port, request):
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(request)
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+    return response
+
+
+def _status(response):
+    return int(response.split(b" ", 2)[1])
+
+
+def test_echoes_body(port):
+    response = _exchange(port, b"POST / HTTP/1.0\r\nContent-Length: 5\r\n\r\nhello")
+    assert _status(response) == 200
+    assert response.endswith(b"\r\n\r\nhello")
+
+
+@pytest.mark.parametrize("value", [b"abc", b"-5", b"", b"1.5"])
+def test_bad_content_length_is_400(port, value):
+    response = _exchange(port, b"POST / HTTP/1.0\r\nContent-Length: " + value + b"\r\n\r\nhello")
+    assert _status(response) == 400
+    assert b"invalid Content-Length" in response
+
+
+def test_oversized_header_is_431(port):
+    padding = b"X-Padding: " + b"a" * MAX_HEADER_BYTES + b"\r\n"
+    response = _exchange(port, b"GET / HTTP/1.0\r\n" + padding + b"\r\n")
+    assert _status(response) == 431
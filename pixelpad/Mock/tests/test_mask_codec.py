@@ -0,0 +1,118 @@
+import struct
+
+import pytest
+
+import mask_codec
+from mask_codec import decode_rle, detect_background, encode_rle
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(mask_codec, "np", None)
+    elif mask_codec.np is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+def _runs(data):
+    return [length for (length,) in struct.iter_unpack("<I", data)]
+
+
+@pytest.mark.parametrize(
+    "mask, runs, start",
+    [
+        (b"\x00" * 5, [5], False),
+        (b"\x01" * 5, [5], True),
+        (b"\x01\x01\x00\x00\x00\x01", [2, 3, 1], True),
+        (b"\x00\x01" * 3, [1] * 6, False),
+        (b"\x01\x00\x01\x00\x01", [1] * 5, True),
+        (b"\x01", [1], True),
+        (b"\x00", [1], False),
+    ],
+)
+def test_encode_rle_runs(engine, mask, runs, start):
+    data, bg_mask_start = encode_rle(mask)
+    assert _runs(data) == runs
+    assert bg_mask_start is start
+    assert decode_rle(data, bg_mask_start, len(mask)) == mask
+
+
+def test_encode_rle_empty_mask(engine):
+    assert encode_rle(b"") == (b"", False)
+    assert decode_rle(b"", False, 0) == b""
+
+
+def test_encode_rle_treats_nonzero_as_set(engine):
+    data, start = encode_rle(bytes([0, 7, 255, 0]))
+    assert (_runs(data), start) == ([1, 2, 1], False)
+
+
+def test_width_one_column_round_trips(engine):
+    # A 1-pixel wide image: the mask is just the column top to bottom.
+    rgba = bytes([255, 255, 255, 255]) * 2 + bytes([200, 0, 0, 255]) + bytes([255, 255, 255, 255]) * 2
+    mask = detect_background(1, 5, rgba)
+    assert mask == b"\x01\x01\x00\x01\x01"
+    data, start = encode_rle(mask)
+    assert decode_rle(data, start, 5) == mask
+
+
+def test_decode_rle_clamps_to_total(engine):
+    data = struct.pack("<3I", 2, 2, 10)
+    assert decode_rle(data, True, 3) == b"\x01\x01\x00"
+    # Missing pixels are padded as foreground, a trailing partial run is ignored.
+    assert decode_rle(data + b"\x01\x00", False, 16) == b"\x00\x00\x01\x01" + b"\x00" * 12
+    assert decode_rle(data, True, 0) == b""
+
+
+def test_engines_agree(monkeypatch):
+    if mask_codec.np is None:
+        pytest.skip("NumPy is not installed")
+    mask = bytes((index * 7919) % 5 < 2 for index in range(4099))
+    expected = encode_rle(mask)
+    monkeypatch.setattr(mask_codec, "np", None)
+    assert encode_rle(mask) == expected
+    assert decode_rle(*expected, len(mask)) == mask
+
+
+def _image(rows, colors):
+    return b"".join(bytes(colors[cell]) for row in rows for cell in row)
+
+
+def test_detect_background_tolerance():
+    colors = {".": (250, 250, 250, 255), "~": (230, 240, 250, 255), "#": (20, 20, 20, 255)}
+    rows = [
+        ".....",
+        ".~~#.",
+        ".....",
+    ]
+    rgba = _image(rows, colors)
+    # "~" is within 20 of the border color on every channel.
+    assert detect_background(5, 3, rgba, tolerance=20) == bytes(
+        [1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1]
+    )
+    assert detect_background(5, 3, rgba, tolerance=19) == bytes(
+        [1, 1, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 1, 1, 1]
+    )
+
+
+def test_detect_background_keeps_unconnected_interior():
+    colors = {".": (255, 255, 255, 255), "#": (0, 0, 0, 255), " ": (9, 9, 9, 0)}
+    rows = [
+        ".......",
+        ".#####.",
+        ".#. #..",
+        ".#####.",
+        ".......",
+    ]
+    mask = detect_background(7, 5, _image(rows, colors))
+    expected = [
+        [1, 1, 1, 1, 1, 1, 1],
+        [1, 0, 0, 0, 0, 0, 1],
+        # The enclosed white pixel matches the border but is not reached by
+        # the fill; the enclosed transparent pixel is background anyway.
+        [1, 0, 0, 1, 0, 1, 1],
+        [1, 0, 0, 0, 0, 0, 1],
+        [1, 1, 1, 1, 1, 1, 1],
+    ]
+    assert mask == bytes(value for row in expected for value in row)
@@ -0,0 +1,156 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; tiles fall back to per-pixel loops.
+    np = None
+
+from raster import resolve_engine
+
+TILE_SIZE = 256
+MAX_TILE_SIZE = 1024
+MAX_ZOOM = 16
+
+
+class RegionError(ValueError):
+    pass
+
+
+# Regions -------------------------------------------------------------------
+#
+# A region is (x, y, out_width, out_height, step) in full-resolution
+# coordinates, the same tuple the raster pattern builders take.
+
+
+def _field(fields, name):
+    value = fields.get(name)
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise RegionError(f"invalid {name}") from None
+
+
+def wants_region(fields):
+    return any(str(fields.get(name) or "").strip() for name in ("tile", "x", "y", "w", "h"))
+
+
+def resolve_region(width, height, fields):
+    """Return the region requested by ``fields``.
+
+    ``tile="z/x/y"`` picks a ``tile_size`` square (default 256) from level
+    ``z``, where level 0 is full resolution and each level halves it.
+    Otherwise ``x``/``y``/``w``/``h`` give a full-resolution rectangle that is
+    clipped to the image.
+    """
+    tile = str(fields.get("tile") or "").strip()
+    if tile:
+        try:
+            zoom, column, row = (int(part) for part in tile.split("/"))
+        except ValueError:
+            raise RegionError("invalid tile") from None
+        size = _field(fields, "tile_size") or TILE_SIZE
+        if not 0 < size <= MAX_TILE_SIZE or not 0 <= zoom <= MAX_ZOOM:
+            raise RegionError("invalid tile")
+        step = 1 << zoom
+        level_width = math.ceil(width / step)
+        level_height = math.ceil(height / step)
+        left, top = column * size, row * size
+        if column < 0 or row < 0 or left >= level_width or top >= level_height:
+            raise RegionError("tile out of range")
+        return (
+            left * step,
+            top * step,
+            min(size, level_width - left),
+            min(size, level_height - top),
+            step,
+        )
+    x = max(0, _field(fields, "x") or 0)
+    y = max(0, _field(fields, "y") or 0)
+    w = _field(fields, "w")
+    h = _field(fields, "h")
+    right = width if w is None else min(width, x + w)
+    bottom = height if h is None else min(height, y + h)
+    if right <= x or bottom <= y:
+        raise RegionError("region out of range")
+    return x, y, right - x, bottom - y, 1
+
+
+# Boards --------------------------------------------------------------------
+#
+# A board is a color-mapped session: ``mapping`` holds one u16le palette slot
+# per cell (0 = background) and ``palette`` the entries it refers to.
+
+
+def board_slots(board, selected_ids):
+    """Map color ids to 1-based palette slots; an empty selection means all."""
+    slots = {str(entry["id"]): entry["idx"] for entry in board["palette"]}
+    if not selected_ids:
+        return set(slots.values())
+    selected = set()
+    for color_id in selected_ids:
+        if color_id not in slots:
+            return None
+        selected.add(slots[color_id])
+    return selected
+
+
+def _np_cells(board, region):
+    x0, y0, out_width, out_height, step = region
+    cells = np.frombuffer(board["mapping"], dtype="<u2").reshape(board["height"], board["width"])
+    return cells[
+        y0 : y0 + out_height * step : step,
+        x0 : x0 + out_width * step : step,
+    ]
+
+
+def _py_cells(board, region):
+    x0, y0, out_width, out_height, step = region
+    mapping = memoryview(board["mapping"]).cast("H")
+    width = board["width"]
+    for row in range(out_height):
+        start = (y0 + row * step) * width + x0
+        yield mapping[start : start + out_width * step : step]
+
+
+def tile_selection(board, selected, region, engine=None):
+    """The selected slots that actually occur in ``region``.
+
+    Used as the tile cache key, so toggling a color only changes the key of
+    tiles that contain it.
+    """
+    if resolve_engine(engine) == "numpy":
+        present = set(np.unique(_np_cells(board, region)).tolist())
+    else:
+        present = set()
+        for cells in _py_cells(board, region):
+            present.update(cells)
+    return tuple(sorted(present & selected))
+
+
+def crop_board_rows(board, region):
+    """The rows of ``board`` that ``region`` reads, and ``region`` moved onto them.
+
+    Lets a band be drawn in a worker without copying the whole mapping there.
+    """
+    x0, y0, out_width, out_height, step = region
+    stop = y0 + (out_height - 1) * step + 1
+    row_bytes = board["width"] * 2
+    mapping = bytes(memoryview(board["mapping"])[y0 * row_bytes : stop * row_bytes])
+    return dict(board, mapping=mapping, height=stop - y0), (x0, 0, out_width, out_height, step)
+
+
+def board_pixels(board, selected, region, engine=None):
+    lut = bytearray(4 * (len(board["palette"]) + 1))
+    for entry in board["palette"]:
+        if entry["idx"] in selected:
+            lut[entry["idx"] * 4 : entry["idx"] * 4 + 4] = bytes(entry["rgba"])
+    if resolve_engine(engine) == "numpy":
+        table = np.frombuffer(bytes(lut), dtype=np.uint8).reshape(-1, 4)
+        return np.ascontiguousarray(table[_np_cells(board, region)])
+    pixels = bytearray()
+    for cells in _py_cells(board, region):
+        for cell in cells:
+            pixels += lut[cell * 4 : cell * 4 + 4]
+    return bytes(pixels)
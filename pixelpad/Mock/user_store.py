@@ -0,0 +1,589 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+from array import array
+
+from snapshot import Snapshot, SnapshotError, write_sections
+
+BACKENDS = ("journal", "sqlite", "memory")
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_COMPACT_AFTER = 10_000
+
+
+class UserStore:
+    """Interface shared by all user backends.
+
+    Users are dicts with an integer ``id`` and a ``phone``. Returned users are
+    copies, so callers may modify them freely.
+    """
+
+    backend = "abstract"
+    # Data file an older format was upgraded from at open, if any.
+    migrated_from = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._counters = {"created": 0, "updated": 0, "logins": 0, "failed_logins": 0}
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def authenticate(self, phone, password):
+        """Return the first user (lowest id) with this phone and password."""
+        raise NotImplementedError
+
+    def create(self, build):
+        """Store ``build(user_id)`` under the next free id and return it."""
+        raise NotImplementedError
+
+    def update(self, user_id, changes):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def flush(self):
+        pass
+
+    def snapshot(self):
+        """Persist the current state in one file, if the backend keeps one."""
+
+    def close(self):
+        self.flush()
+
+    def _count(self, key, amount=1):
+        self._counters[key] += amount
+
+    def stats(self):
+        with self._lock:
+            payload = dict(self._counters)
+        payload.update({"backend": self.backend, "users": len(self)})
+        return payload
+
+
+class MemoryUserStore(UserStore):
+    backend = "memory"
+
+    def __init__(self, users=None, next_id=None):
+        super().__init__()
+        self._users = {}
+        # phone -> sorted ids; phones are not unique, and login picks the lowest id.
+        self._by_phone = {}
+        self.next_id = 1
+        for user in (users or {}).values():
+            self._put(user)
+        self.next_id = max(self.next_id, next_id or 0)
+
+    def _put(self, user):
+        # Stored dicts are never mutated, so snapshots can share them.
+        previous = self._users.get(user["id"])
+        if previous is not None:
+            ids = self._by_phone.get(previous.get("phone"), [])
+            if user["id"] in ids:
+                ids.remove(user["id"])
+            if not ids:
+                self._by_phone.pop(previous.get("phone"), None)
+        self._users[user["id"]] = user
+        bisect.insort(self._by_phone.setdefault(user.get("phone"), []), user["id"])
+        self.next_id = max(self.next_id, user["id"] + 1)
+
+    def _record(self, user):
+        # Persistence hooks for subclasses: _record runs with the lock held,
+        # _committed after it is released.
+        pass
+
+    def _committed(self):
+        pass
+
+    def _lookup(self, user_id):
+        return self._users.get(user_id)
+
+    def _phone_ids(self, phone):
+        return self._by_phone.get(phone, ())
+
+    def get(self, user_id):
+        with self._lock:
+            user = self._lookup(user_id)
+            return dict(user) if user is not None else None
+
+    def authenticate(self, phone, password):
+        with self._lock:
+            for user_id in self._phone_ids(phone):
+                user = self._lookup(user_id)
+                if user.get("phone") == phone and user.get("password") == password:
+                    self._count("logins")
+                    return dict(user)
+            self._count("failed_logins")
+            return None
+
+    def create(self, build):
+        with self._lock:
+            user = dict(build(self.next_id))
+            self._put(user)
+            self._record(user)
+            self._count("created")
+        self._committed()
+        return dict(user)
+
+    def update(self, user_id, changes):
+        with self._lock:
+            current = self._lookup(user_id)
+            if current is None:
+                return None
+            user = dict(current)
+            user.update(changes)
+            user["id"] = user_id
+            self._put(user)
+            self._record(user)
+            self._count("updated")
+        self._committed()
+        return dict(user)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
+
+
+def read_snapshot(path):
+    """Read a JSON ``{"next_id": n, "users": {id: user}}`` file; None when unusable.
+
+    Only used to migrate data files written before binary snapshots.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            payload = json.load(handle)
+        users = {int(key): value for key, value in payload.get("users", {}).items()}
+        next_id = int(payload.get("next_id", max(users, default=0) + 1))
+    except (OSError, ValueError, AttributeError):
+        return None
+    return users, next_id
+
+
+def _legacy_paths(path):
+    # The data file may be opened under its pre-snapshot name or beside it.
+    paths = [path]
+    stem, extension = os.path.splitext(path)
+    if extension != ".json":
+        paths.append(f"{stem}.json")
+    return paths
+
+
+def _encode_user(user):
+    phone = user.get("phone")
+    phone = "" if phone is None else str(phone)
+    return phone.encode("utf-8"), json.dumps(user, ensure_ascii=False).encode("utf-8")
+
+
+def write_user_snapshot(path, records, next_id):
+    """Write ``(id, phone_bytes, user_json_bytes)`` records, in ascending id order.
+
+    Besides the records the file holds the sorted id array and a
+    phone-ordered permutation of it, so :class:`SnapshotUsers` can answer
+    lookups straight from the mapped file.
+    """
+    ids = array("q")
+    record_offsets = array("Q", [0])
+    phone_offsets = array("Q", [0])
+    records_out = []
+    phones = []
+    for user_id, phone, record in records:
+        ids.append(user_id)
+        records_out.append(record)
+        record_offsets.append(record_offsets[-1] + len(record))
+        phones.append(phone)
+        phone_offsets.append(phone_offsets[-1] + len(phone))
+    # sorted() is stable, so users sharing a phone stay in id order.
+    phone_order = array("I", sorted(range(len(phones)), key=phones.__getitem__))
+    meta = json.dumps({"next_id": next_id, "users": len(ids)}).encode("utf-8")
+    write_sections(
+        path,
+        [
+            ("meta", meta),
+            ("user_ids", ids.tobytes()),
+            ("record_offsets", record_offsets.tobytes()),
+            ("records", records_out),
+            ("phone_offsets", phone_offsets.tobytes()),
+            ("phones", phones),
+            ("phone_order", phone_order.tobytes()),
+        ],
+    )
+
+
+class SnapshotUsers:
+    """Read-only users served from a mapped snapshot file.
+
+    Nothing is decoded up front: ids are found by binary search over the
+    mapped id array, phones by binary search over the phone permutation, and
+    only the matching records are parsed.
+    """
+
+    def __init__(self, path):
+        self._snapshot = Snapshot(path)
+        try:
+            meta = json.loads(bytes(self._snapshot.section("meta")))
+            self.next_id = int(meta["next_id"])
+            self._ids = self._snapshot.array("user_ids", "q")
+            self._record_offsets = self._snapshot.array("record_offsets", "Q")
+            self._records = self._snapshot.section("records")
+            self._phone_offsets = self._snapshot.array("phone_offsets", "Q")
+            self._phones = self._snapshot.section("phones")
+            self._phone_order = self._snapshot.array("phone_order", "I")
+            self._count = len(self._ids)
+        except (KeyError, TypeError, ValueError) as exc:
+            self.close()
+            raise SnapshotError(f"unusable user snapshot: {path}") from exc
+
+    def __len__(self):
+        return self._count
+
+    def _position(self, user_id):
+        position = bisect.bisect_left(self._ids, user_id)
+        if position < len(self._ids) and self._ids[position] == user_id:
+            return position
+        return None
+
+    def __contains__(self, user_id):
+        return self._position(user_id) is not None
+
+    def _record(self, position):
+        return self._records[self._record_offsets[position] : self._record_offsets[position + 1]]
+
+    def _phone(self, position):
+        return bytes(
+            self._phones[self._phone_offsets[position] : self._phone_offsets[position + 1]]
+        )
+
+    def get(self, user_id):
+        position = self._position(user_id)
+        if position is None:
+            return None
+        return json.loads(bytes(self._record(position)))
+
+    def phone_ids(self, phone):
+        target = str(phone).encode("utf-8")
+        order = self._phone_order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._phone(order[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        ids = []
+        while low < len(order) and self._phone(order[low]) == target:
+            ids.append(self._ids[order[low]])
+            low += 1
+        return ids
+
+    def records(self):
+        for position in range(len(self._ids)):
+            yield self._ids[position], self._phone(position), self._record(position)
+
+    def close(self):
+        for name in (
+            "_ids",
+            "_record_offsets",
+            "_records",
+            "_phone_offsets",
+            "_phones",
+            "_phone_order",
+        ):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self._snapshot.close()
+
+
+def _merge_records(base, overlay):
+    # Ascending-id records for the users in ``base`` updated by ``overlay``.
+    changed = sorted(overlay)
+    position = 0
+    for user_id, phone, record in base.records() if base is not None else ():
+        while position < len(changed) and changed[position] < user_id:
+            yield (changed[position], *_encode_user(overlay[changed[position]]))
+            position += 1
+        if position < len(changed) and changed[position] == user_id:
+            yield (user_id, *_encode_user(overlay[user_id]))
+            position += 1
+        else:
+            yield user_id, phone, record
+    for user_id in changed[position:]:
+        yield (user_id, *_encode_user(overlay[user_id]))
+
+
+class JournalUserStore(MemoryUserStore):
+    """Users persisted as a binary snapshot plus an append-only journal.
+
+    The snapshot at ``path`` is mapped and read lazily through
+    :class:`SnapshotUsers`, so opening it takes milliseconds at any size;
+    only users changed since then are held in memory. A JSON data file from
+    before binary snapshots, given as ``path`` or found beside it as
+    ``<stem>.json``, is loaded whole with its ``.journal`` replayed and
+    rewritten as a snapshot; ``migrated_from`` then names it.
+
+    Each change appends one JSON line to ``<path>.journal``. A background
+    thread writes queued lines and fsyncs once per ``flush_interval`` seconds,
+    so a crash loses at most that window; ``flush_interval=0`` writes and
+    fsyncs inside every change. Once the journal holds more lines than
+    ``max(compact_after, users)`` the snapshot is rewritten and the journal
+    emptied, which keeps the rewrite cost amortized O(1) per change.
+    """
+
+    backend = "journal"
+
+    def __init__(
+        self,
+        path,
+        seed=None,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        compact_after=DEFAULT_COMPACT_AFTER,
+    ):
+        # Set before MemoryUserStore.__init__, whose _put calls need them.
+        self._base = None
+        self._added = 0
+        try:
+            self._base = SnapshotUsers(path)
+        except (OSError, SnapshotError):
+            pass
+        if self._base is not None:
+            super().__init__(None, self._base.next_id)
+        else:
+            for legacy_path in _legacy_paths(path):
+                legacy = read_snapshot(legacy_path)
+                if legacy is not None:
+                    break
+            super().__init__(*(legacy or (seed,)))
+            if legacy is not None:
+                self.migrated_from = legacy_path
+                if legacy_path != path:
+                    self._replay(f"{legacy_path}.journal")
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self._counters.update({"journal_lines": 0, "fsyncs": 0, "compactions": 0})
+        self._pending = []
+        self._io_lock = threading.Lock()
+        self._journal_lines, valid_bytes = self._replay(self.journal_path)
+        self._journal = open(self.journal_path, "ab")
+        # Drop a torn final line so new lines are not appended after it.
+        self._journal.truncate(valid_bytes)
+        if self._base is None:
+            self.compact()
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _replay(self, journal_path):
+        lines = valid_bytes = 0
+        try:
+            with open(journal_path, "rb") as handle:
+                for line in handle:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._put(entry["user"])
+                    self.next_id = max(self.next_id, entry.get("next_id", 0))
+                    lines += 1
+                    valid_bytes += len(line)
+        except FileNotFoundError:
+            pass
+        return lines, valid_bytes
+
+    def _put(self, user):
+        if user["id"] not in self._users and (
+            self._base is None or user["id"] not in self._base
+        ):
+            self._added += 1
+        super()._put(user)
+
+    def _lookup(self, user_id):
+        user = self._users.get(user_id)
+        if user is None and self._base is not None:
+            user = self._base.get(user_id)
+        return user
+
+    def _phone_ids(self, phone):
+        ids = self._by_phone.get(phone, ())
+        if self._base is None:
+            return ids
+        # The snapshot index may list users whose phone changed since;
+        # authenticate() checks each candidate's current phone.
+        return sorted(set(ids).union(self._base.phone_ids(phone)))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._base or ()) + self._added
+
+    def _record(self, user):
+        line = json.dumps({"next_id": self.next_id, "user": user}, ensure_ascii=False)
+        self._pending.append(line.encode("utf-8") + b"\n")
+
+    def _committed(self):
+        if not self.flush_interval:
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._io_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._journal.write(b"".join(batch))
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal_lines += len(batch)
+                with self._lock:
+                    self._count("journal_lines", len(batch))
+                    self._count("fsyncs")
+            if self._journal_lines > max(self.compact_after, len(self)):
+                self._compact()
+
+    def compact(self):
+        with self._io_lock:
+            self._compact()
+
+    def snapshot(self):
+        with self._io_lock:
+            if self._journal_lines or self._pending or self._base is None:
+                self._compact()
+
+    def _compact(self):
+        # Lines still pending are already part of the copied users, so they
+        # are dropped rather than journaled. The copy and the old snapshot
+        # are merged without holding the lock; users changed meanwhile stay
+        # in memory on top of the new snapshot.
+        with self._lock:
+            self._pending = []
+            changed, next_id, base = dict(self._users), self.next_id, self._base
+        write_user_snapshot(self.path, _merge_records(base, changed), next_id)
+        self._journal.truncate(0)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_lines = 0
+        fresh = SnapshotUsers(self.path)
+        with self._lock:
+            for user_id, user in changed.items():
+                if self._users.get(user_id) is user:
+                    del self._users[user_id]
+            self._base = fresh
+            self._by_phone = {}
+            for user in self._users.values():
+                bisect.insort(self._by_phone.setdefault(user.get("phone"), []), user["id"])
+            self._added = sum(1 for user_id in self._users if user_id not in fresh)
+            self._count("compactions")
+        if base is not None:
+            base.close()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._journal.close()
+        if self._base is not None:
+            self._base.close()
+
+
+class SqliteUserStore(UserStore):
+    """Users in a sqlite table with an index on phone; WAL with synchronous=NORMAL."""
+
+    backend = "sqlite"
+
+    def __init__(self, path, seed=None):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "id INTEGER PRIMARY KEY, phone TEXT, password TEXT, payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS users_phone ON users (phone, id)")
+        if seed and not len(self):
+            with self._lock:
+                for user in seed.values():
+                    self._write(user)
+
+    def _write(self, user):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO users (id, phone, password, payload) VALUES (?, ?, ?, ?)",
+            (user["id"], user.get("phone"), user.get("password"), json.dumps(user)),
+        )
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM users WHERE id = ?", (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def authenticate(self, phone, password):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM users WHERE phone = ? AND password = ? ORDER BY id LIMIT 1",
+                (phone, password),
+            ).fetchone()
+            self._count("logins" if row else "failed_logins")
+        return json.loads(row[0]) if row else None
+
+    def create(self, build):
+        with self._lock:
+            (next_id,) = self._conn.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM users"
+            ).fetchone()
+            user = dict(build(next_id))
+            self._write(user)
+            self._count("created")
+        return user
+
+    def update(self, user_id, changes):
+        with self._lock:
+            user = self.get(user_id)
+            if user is None:
+                return None
+            user.update(changes)
+            user["id"] = user_id
+            self._write(user)
+            self._count("updated")
+        return user
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_user_store(
+    backend="memory",
+    path=None,
+    seed=None,
+    flush_interval=DEFAULT_FLUSH_INTERVAL,
+    compact_after=DEFAULT_COMPACT_AFTER,
+):
+    if backend == "memory":
+        return MemoryUserStore(seed)
+    if not path:
+        raise ValueError(f"{backend} user store requires a path")
+    if backend == "journal":
+        return JournalUserStore(path, seed, flush_interval, compact_after)
+    if backend == "sqlite":
+        return SqliteUserStore(path, seed)
+    raise ValueError(f"unknown user backend: {backend}")
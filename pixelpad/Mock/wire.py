@@ -0,0 +1,149 @@
+import gzip
+import io
+import json
+import struct
+import uuid
+import zipfile
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip and deflate are always offered.
+    brotli = None
+
+FRAME_CONTENT_TYPE = "application/x-pixelpad-frame"
+FRAME_MAGIC = b"PXPF"
+FRAME_VERSION = 1
+MIN_COMPRESS_BYTES = 1024
+COMPRESS_LEVEL = 6
+BUNDLE_FORMATS = ("multipart", "zip")
+ZIP_CONTENT_TYPE = "application/zip"
+
+# Frame layout, all integers little-endian:
+#   magic "PXPF" | u8 version | u32 header length | header JSON (UTF-8)
+#   then per section: u8 name length | name (ASCII) | u32 data length | data
+# The header carries every non-binary field of the JSON response; each section
+# carries the raw bytes that the JSON form sends as "<name>_base64".
+
+
+def _parse_accept(value):
+    # Returns {token: q} for an Accept or Accept-Encoding header.
+    result = {}
+    for item in (value or "").split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        result[token.lower()] = quality
+    return result
+
+
+def accepts_frame(accept):
+    return _parse_accept(accept).get(FRAME_CONTENT_TYPE, 0.0) > 0
+
+
+def available_encodings():
+    return ("br", "gzip", "deflate") if brotli is not None else ("gzip", "deflate")
+
+
+def negotiate_encoding(accept_encoding):
+    offered = _parse_accept(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = offered.get(encoding, offered.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "deflate":
+        return zlib.compress(data, level)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=min(11, level))
+    raise ValueError(f"unsupported content encoding: {encoding}")
+
+
+def encode_frame(header, sections):
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    parts = [
+        FRAME_MAGIC,
+        struct.pack("<BI", FRAME_VERSION, len(header_bytes)),
+        header_bytes,
+    ]
+    for name, data in sections.items():
+        encoded_name = name.encode("ascii")
+        parts.append(struct.pack("<B", len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(bytes(data))
+    return b"".join(parts)
+
+
+def decode_frame(data):
+    if data[:4] != FRAME_MAGIC:
+        raise ValueError("not a pixelpad frame")
+    version, header_length = struct.unpack_from("<BI", data, 4)
+    if version != FRAME_VERSION:
+        raise ValueError(f"unsupported frame version: {version}")
+    offset = 9
+    header = json.loads(data[offset : offset + header_length].decode("utf-8"))
+    offset += header_length
+    sections = {}
+    while offset < len(data):
+        (name_length,) = struct.unpack_from("<B", data, offset)
+        offset += 1
+        name = data[offset : offset + name_length].decode("ascii")
+        offset += name_length
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        sections[name] = data[offset : offset + length]
+        offset += length
+    return header, sections
+
+
+# Bundles -------------------------------------------------------------------
+#
+# Several files in one response: multipart/mixed, one part per file with its
+# own headers, or a zip archive. PNGs are already deflated, so zip entries
+# are stored uncompressed.
+
+
+def negotiate_bundle(requested, accept):
+    """Pick a bundle format from an explicit request or the Accept header."""
+    if requested:
+        return requested if requested in BUNDLE_FORMATS else None
+    offered = _parse_accept(accept)
+    if offered.get(ZIP_CONTENT_TYPE, 0.0) > offered.get("multipart/mixed", 0.0):
+        return "zip"
+    return "multipart"
+
+
+def encode_bundle(files, bundle_format, boundary=None):
+    """Return ``(content_type, body)`` for ``files`` of (name, headers, data)."""
+    if bundle_format == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for name, _headers, data in files:
+                archive.writestr(zipfile.ZipInfo(name), data)
+        return ZIP_CONTENT_TYPE, buffer.getvalue()
+    boundary = boundary or uuid.uuid4().hex
+    parts = []
+    for name, headers, data in files:
+        lines = [f"--{boundary}", f'Content-Disposition: attachment; filename="{name}"']
+        lines += [f"{key}: {value}" for key, value in headers.items()]
+        lines.append(f"Content-Length: {len(data)}")
+        parts.append(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+        parts.append(bytes(data))
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("ascii"))
+    return f"multipart/mixed; boundary={boundary}", b"".join(parts)
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""Drive a mix of requests against the mock backend and report throughput and latency."""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+MOCK_DIR = Path(__file__).resolve().parent.parent / "pixelpad" / "Mock"
+SERVER_MODES = ("single", "threaded", "async")
+DEFAULT_MIX = "login=4,register=1,process=2,render=3"
+OPERATIONS = ("login", "register", "process", "render")
+DEFAULT_PNG_SIZES = (64, 256, 1024)
+COLOR_IDS = ("", "A1", "B2", "C3", "A1,B2")
+SEED_USERS = 200
+SEED_SESSIONS = 8
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation in mix: {name}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name}: {weight}") from exc
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_kb(pid: int | str = "self") -> dict[str, int | None]:
+    """Current (VmRSS) and peak (VmHWM) resident set size in KiB."""
+    values: dict[str, int | None] = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as handle:
+            for line in handle:
+                key, _, rest = line.partition(":")
+                if key == "VmRSS":
+                    values["rss_kb"] = int(rest.split()[0])
+                elif key == "VmHWM":
+                    values["peak_rss_kb"] = int(rest.split()[0])
+    except OSError:
+        if pid == "self":
+            # ru_maxrss is KiB on Linux and bytes on macOS.
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            values["peak_rss_kb"] = peak // 1024 if sys.platform == "darwin" else peak
+    return values
+
+
+def make_pngs(sizes: list[int], seed: int) -> dict[int, bytes]:
+    # Blocky pixel art with a few dozen colors, encoded by the backend's own writer.
+    sys.path.insert(0, str(MOCK_DIR))
+    import raster
+
+    rng = random.Random(seed)
+    images = {}
+    for size in sizes:
+        colors = [bytes([rng.randrange(256) for _ in range(3)] + [255]) for _ in range(32)]
+        block = max(1, size // 32)
+        cells = -(-size // block)
+        grid = [rng.choice(colors) for _ in range(cells * cells)]
+        rows = []
+        for y in range(size):
+            row = grid[(y // block) * cells : (y // block + 1) * cells]
+            rows.append(b"".join(color * block for color in row)[: size * 4])
+        images[size] = raster.png_from_pixels(size, size, b"".join(rows))
+    return images
+
+
+def encode_multipart(fields: dict[str, str], files: dict[str, tuple[str, bytes]]) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, payload) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\nContent-Type: image/png\r\n\r\n'.encode()
+            + payload
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Server:
+    """A backend to benchmark: started in this process, in a child, or already running."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.target = args.target
+        self.mode = args.mode
+        self.host = "127.0.0.1"
+        self.port = args.port or free_port()
+        self.pid: int | None = None
+        self._process: subprocess.Popen[bytes] | None = None
+        self._tempdir: tempfile.TemporaryDirectory[str] | None = None
+        self._workers = args.workers
+        if args.url:
+            host, _, port = args.url.removeprefix("http://").rstrip("/").partition(":")
+            self.host, self.port = host, int(port or 80)
+
+    def start(self) -> None:
+        if self.target == "external":
+            return
+        if self.target == "subprocess":
+            self._tempdir = tempfile.TemporaryDirectory()
+            command = [
+                sys.executable,
+                str(MOCK_DIR / "mock_backend.py"),
+                "--host", self.host,
+                "--port", str(self.port),
+                "--mode", self.mode,
+                "--workers", str(self._workers),
+                "--user-db", os.path.join(self._tempdir.name, "users.json"),
+                # Keeps the benchmark's sessions out of the real snapshot file.
+                "--session-snapshot", "",
+            ]
+            self._process = subprocess.Popen(command, cwd=MOCK_DIR, stdout=subprocess.DEVNULL)
+            self.pid = self._process.pid
+        else:
+            sys.path.insert(0, str(MOCK_DIR))
+            import mock_backend
+            from async_server import serve_async
+            from http.server import HTTPServer, ThreadingHTTPServer
+
+            if self.mode == "async":
+                target = lambda: serve_async(  # noqa: E731
+                    mock_backend.MockHandler, self.host, self.port, workers=self._workers
+                )
+            else:
+                server_class = ThreadingHTTPServer if self.mode == "threaded" else HTTPServer
+                server = server_class((self.host, self.port), mock_backend.MockHandler)
+                target = server.serve_forever
+            threading.Thread(target=target, daemon=True).start()
+        self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 15.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                status, _body = request(self, "GET", "/health")
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError(f"backend at {self.host}:{self.port} did not become ready")
+
+    def rss(self) -> dict[str, int | None]:
+        if self.target == "inprocess":
+            return read_rss_kb("self")
+        if self.pid is not None:
+            return read_rss_kb(self.pid)
+        return {"rss_kb": None, "peak_rss_kb": None}
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+
+def request(
+    server: Server, method: str, path: str, body: bytes = b"", content_type: str = ""
+) -> tuple[int, bytes]:
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=60)
+    try:
+        headers = {"Content-Type": content_type} if content_type else {}
+        connection.request(method, path, body=body or None, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+class Workload:
+    """Builds requests for each operation and remembers state they depend on."""
+
+    def __init__(self, server: Server, pngs: dict[int, bytes]) -> None:
+        self.server = server
+        self.pngs = pngs
+        self.users: list[tuple[str, str]] = []
+        self.sessions: list[str] = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _next_phone(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"177{os.getpid() % 1000:03d}{self._counter:05d}"
+
+    def prepare(self, users: int, sessions: int) -> None:
+        rng = random.Random(0)
+        for _ in range(users):
+            status, _body = self.register(rng)[:2]
+            if status != 201:
+                raise RuntimeError(f"seeding users failed with HTTP {status}")
+        for _ in range(sessions):
+            status, _body = self.process(rng)[:2]
+            if status != 200:
+                raise RuntimeError(f"seeding sessions failed with HTTP {status}")
+
+    def login(self, rng: random.Random) -> tuple[int, bytes, int]:
+        phone, password = rng.choice(self.users)
+        body = json.dumps({"phone": phone, "password": password}).encode()
+        return (*request(self.server, "POST", "/login", body, "application/json"), len(body))
+
+    def register(self, rng: random.Random) -> tuple[int, bytes, int]:
+        phone, password = self._next_phone(), "bench-pass"
+        body = json.dumps({"phone": phone, "password": password}).encode()
+        status, payload = request(self.server, "POST", "/register", body, "application/json")
+        if status == 201:
+            with self._lock:
+                self.users.append((phone, password))
+        return status, payload, len(body)
+
+    def process(self, rng: random.Random) -> tuple[int, bytes, int]:
+        size = rng.choice(list(self.pngs))
+        body, content_type = encode_multipart(
+            {"settings_file": "MARD-24.json"}, {"file": (f"bench-{size}.png", self.pngs[size])}
+        )
+        status, payload = request(self.server, "POST", "/process", body, content_type)
+        if status == 200:
+            session_id = json.loads(payload)["session_id"]
+            with self._lock:
+                self.sessions.append(session_id)
+        return status, payload, len(body)
+
+    def render(self, rng: random.Random) -> tuple[int, bytes, int]:
+        with self._lock:
+            session_id = rng.choice(self.sessions)
+        body, content_type = encode_multipart(
+            {"session_id": session_id, "color_id": rng.choice(COLOR_IDS)}, {}
+        )
+        return (*request(self.server, "POST", "/render", body, content_type), len(body))
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], count: int, elapsed: float) -> dict[str, float]:
+    return {
+        "requests": count,
+        "rps": count / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "max_ms": max(latencies, default=0.0) * 1000,
+    }
+
+
+def run_load(workload: Workload, args: argparse.Namespace) -> dict[str, object]:
+    names = [name for name, weight in args.mix.items() if weight > 0]
+    weights = [args.mix[name] for name in names]
+    results = {
+        name: {"latencies": [], "errors": 0, "statuses": {}, "sent": 0, "received": 0}
+        for name in names
+    }
+    lock = threading.Lock()
+    remaining = [args.requests]
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def take() -> bool:
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(index: int) -> None:
+        rng = random.Random(args.seed * 1000 + index)
+        local = {name: {"latencies": [], "errors": 0, "statuses": {}, "sent": 0, "received": 0}
+                 for name in names}
+        while take():
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, payload, sent = getattr(workload, name)(rng)
+            except OSError:
+                status, payload, sent = 0, b"", 0
+            elapsed = time.perf_counter() - started
+            entry = local[name]
+            entry["latencies"].append(elapsed)
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+            entry["sent"] += sent
+            entry["received"] += len(payload)
+            if not 200 <= status < 300:
+                entry["errors"] += 1
+        with lock:
+            for name, entry in local.items():
+                target = results[name]
+                target["latencies"].extend(entry["latencies"])
+                target["errors"] += entry["errors"]
+                target["sent"] += entry["sent"]
+                target["received"] += entry["received"]
+                for status, count in entry["statuses"].items():
+                    key = str(status)
+                    target["statuses"][key] = target["statuses"].get(key, 0) + count
+
+    rss_samples: list[int] = []
+    stop_sampling = threading.Event()
+
+    def sample_rss() -> None:
+        while not stop_sampling.wait(0.25):
+            rss = workload.server.rss()["rss_kb"]
+            if rss is not None:
+                rss_samples.append(rss)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    rss_before = workload.server.rss()
+    sampler.start()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    sampler.join()
+    rss_after = workload.server.rss()
+
+    all_latencies = [value for entry in results.values() for value in entry["latencies"]]
+    endpoints = {}
+    for name, entry in results.items():
+        endpoints[name] = summarize(entry["latencies"], len(entry["latencies"]), elapsed)
+        endpoints[name].update(
+            {
+                "errors": entry["errors"],
+                "statuses": entry["statuses"],
+                "bytes_sent": entry["sent"],
+                "bytes_received": entry["received"],
+            }
+        )
+    overall = summarize(all_latencies, len(all_latencies), elapsed)
+    overall.update(
+        {
+            "elapsed_s": elapsed,
+            "errors": sum(entry["errors"] for entry in results.values()),
+            "bytes_sent": sum(entry["sent"] for entry in results.values()),
+            "bytes_received": sum(entry["received"] for entry in results.values()),
+        }
+    )
+    return {
+        "overall": overall,
+        "endpoints": endpoints,
+        "server": {
+            "rss_start_kb": rss_before["rss_kb"],
+            "rss_end_kb": rss_after["rss_kb"],
+            "rss_max_sampled_kb": max(rss_samples, default=rss_after["rss_kb"]),
+            "peak_rss_kb": rss_after["peak_rss_kb"],
+        },
+    }
+
+
+def print_report(report: dict[str, object]) -> None:
+    overall = report["overall"]
+    print(
+        f"{overall['requests']} requests in {overall['elapsed_s']:.2f}s: "
+        f"{overall['rps']:.1f} req/s, {overall['errors']} errors, "
+        f"{overall['bytes_sent']} bytes sent, {overall['bytes_received']} bytes received"
+    )
+    print(f"{'endpoint':<10}{'n':>8}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}")
+    for name, entry in [*report["endpoints"].items(), ("all", overall)]:
+        print(
+            f"{name:<10}{entry['requests']:>8}{entry['rps']:>10.1f}"
+            f"{entry['p50_ms']:>8.1f}ms{entry['p95_ms']:>8.1f}ms{entry['p99_ms']:>8.1f}ms"
+            f"{entry['errors']:>8}"
+        )
+    server = report["server"]
+    print(
+        f"server rss: start {server['rss_start_kb']} KiB, end {server['rss_end_kb']} KiB, "
+        f"peak {server['peak_rss_kb']} KiB"
+    )
+
+
+def print_comparison(report: dict[str, object], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    print(f"compared with {baseline_path}:")
+    rows = [*report["endpoints"].items(), ("all", report["overall"])]
+    for name, entry in rows:
+        before = baseline["overall"] if name == "all" else baseline["endpoints"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if before.get(key):
+                changes.append(f"{key} {(entry[key] / before[key] - 1) * 100:+.1f}%")
+        print(f"  {name:<10}" + "  ".join(changes))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--target",
+        choices=("inprocess", "subprocess", "external"),
+        default="subprocess",
+        help="where the backend runs; external needs --url",
+    )
+    parser.add_argument("--url", help="base URL of an already running backend")
+    parser.add_argument("--port", type=int, default=0, help="port for a started backend")
+    parser.add_argument("--mode", choices=SERVER_MODES, default="threaded")
+    parser.add_argument("--workers", type=int, default=4, help="worker pool size for --mode async")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="total requests to send")
+    parser.add_argument(
+        "--duration", type=float, default=0.0, help="run for this many seconds instead"
+    )
+    parser.add_argument(
+        "--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"default: {DEFAULT_MIX}"
+    )
+    parser.add_argument(
+        "--png-sizes", type=int, nargs="+", default=list(DEFAULT_PNG_SIZES),
+        help="edge lengths of the PNGs uploaded to /process",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="print changes relative to an earlier --output file")
+    args = parser.parse_args(argv)
+    if args.target == "external" and not args.url:
+        parser.error("--target external requires --url")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    server = Server(args)
+    server.start()
+    try:
+        workload = Workload(server, make_pngs(args.png_sizes, args.seed))
+        workload.prepare(SEED_USERS, SEED_SESSIONS)
+        report = run_load(workload, args)
+    finally:
+        server.stop()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "target": args.target,
+            "mode": args.mode,
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "mix": args.mix,
+            "png_sizes": args.png_sizes,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        **report,
+    }
+    print_report(report)
+    if args.compare:
+        print_comparison(report, args.compare)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
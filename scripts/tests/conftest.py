@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts are run directly, not installed; import them from their folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+import update_image
+
+REMOTE_DIR = "/sdcard/DCIM/Camera"
+
+# Each online device is a directory under the stub root; remote paths starting
+# with /sdcard are redirected into it. Every call and every command sent to an
+# interactive shell is logged as "<serial> <command>".
+STUB_ADB = '''#!{python}
+import os, shutil, subprocess, sys
+root = {root!r}
+def log(serial, text):
+    with open(os.path.join(root, "calls.log"), "a", encoding="utf-8") as calls:
+        calls.write(f"{{serial}} {{text}}\\n")
+args = sys.argv[1:]
+if args == ["devices"]:
+    log("-", "devices")
+    print("List of devices attached")
+    for serial in sorted(os.listdir(root)):
+        if os.path.isdir(os.path.join(root, serial)):
+            print(f"{{serial}}\\tdevice")
+    print("emulator-5558\\toffline")
+    sys.exit(0)
+serial, command = args[1], args[2:]
+base = os.path.join(root, serial)
+if command == ["shell"]:
+    shell = subprocess.Popen(["sh"], stdin=subprocess.PIPE, text=True, bufsize=1)
+    for line in sys.stdin:
+        log(serial, line.strip())
+        shell.stdin.write(line.replace("/sdcard", base + "/sdcard"))
+        shell.stdin.flush()
+    shell.stdin.close()
+    sys.exit(shell.wait())
+log(serial, " ".join(command))
+if command[0] == "push":
+    shutil.copy(command[1], base + command[2])
+    print("1 file pushed")
+    sys.exit(0)
+if command[0] == "shell":
+    sys.exit(subprocess.call(["sh", "-c", command[1].replace("/sdcard", base + "/sdcard")]))
+sys.exit(1)
+'''
+
+
+@pytest.fixture
+def stub(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> dict[str, Path]:
+    root = tmp_path / "devices"
+    for serial in ("emulator-5554", "emulator-5556"):
+        (root / serial / REMOTE_DIR.lstrip("/")).mkdir(parents=True)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    adb = bin_dir / "adb"
+    adb.write_text(STUB_ADB.format(python=sys.executable, root=str(root)), encoding="utf-8")
+    # The media scanner: succeeds so the am broadcast fallback is never tried.
+    scanner = bin_dir / "cmd"
+    scanner.write_text("#!/bin/sh\necho ok\n", encoding="utf-8")
+    for script in (adb, scanner):
+        script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(update_image, "SHELL_POOL", None)
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.png").write_bytes(b"local a")
+    (images / "b.png").write_bytes(b"local b")
+    return {"root": root, "adb": adb, "images": images, "manifest": tmp_path / "manifest.json"}
+
+
+def _remote(stub: dict[str, Path], serial: str) -> Path:
+    return stub["root"] / serial / REMOTE_DIR.lstrip("/")
+
+
+def _take_calls(stub: dict[str, Path]) -> dict[str, list[str]]:
+    """The logged calls by serial; the log is cleared for the next run."""
+    log = stub["root"] / "calls.log"
+    calls: dict[str, list[str]] = {}
+    for line in log.read_text(encoding="utf-8").splitlines():
+        serial, _, call = line.partition(" ")
+        calls.setdefault(serial, []).append(call)
+    log.unlink()
+    return calls
+
+
+def _pushed(calls: list[str]) -> list[str]:
+    return sorted(Path(call.split()[1]).name for call in calls if call.startswith("push "))
+
+
+def _upload(stub: dict[str, Path], *extra: str) -> None:
+    update_image.main(
+        [
+            str(stub["images"]),
+            "--adb",
+            str(stub["adb"]),
+            "--remote-dir",
+            REMOTE_DIR,
+            "--manifest",
+            str(stub["manifest"]),
+            *extra,
+        ]
+    )
+
+
+@pytest.mark.parametrize("shell_pool", [[], ["--no-shell-pool"]], ids=["pool", "one-shot"])
+def test_batch_upload(stub: dict[str, Path], shell_pool: list[str]) -> None:
+    _remote(stub, "emulator-5554").joinpath("a.png").write_bytes(b"already there")
+    _upload(stub, *shell_pool)
+
+    calls = _take_calls(stub)
+    assert set(calls) == {"-", "emulator-5554", "emulator-5556"}
+    for serial in ("emulator-5554", "emulator-5556"):
+        assert sum("mkdir -p" in call for call in calls[serial]) == 1
+        assert sum("cmd media rescan" in call for call in calls[serial]) == 1
+        assert not any("get-state" in call for call in calls[serial])
+        assert _pushed(calls[serial]) == ["a.png", "b.png"]
+
+    assert sorted(path.name for path in _remote(stub, "emulator-5556").iterdir()) == ["a.png", "b.png"]
+    remote = _remote(stub, "emulator-5554")
+    assert remote.joinpath("a.png").read_bytes() == b"already there"
+    assert remote.joinpath("b.png").read_bytes() == b"local b"
+    [renamed] = [path for path in remote.iterdir() if path.name not in ("a.png", "b.png")]
+    assert re.fullmatch(r"a_\d{8}_\d{6}\.png", renamed.name)
+    assert renamed.read_bytes() == b"local a"
+
+
+def test_sync_skips_and_overwrites(stub: dict[str, Path]) -> None:
+    remote = _remote(stub, "emulator-5554")
+    remote.joinpath("a.png").write_bytes(b"already there")
+    # Content the device already has under another name is not pushed again.
+    remote.joinpath("IMG_0001.png").write_bytes(b"local b")
+    _upload(stub, "--sync")
+    calls = _take_calls(stub)
+    assert _pushed(calls["emulator-5554"]) == ["a.png"]
+    assert _pushed(calls["emulator-5556"]) == ["a.png", "b.png"]
+    for serial in ("emulator-5554", "emulator-5556"):
+        assert sum("mkdir -p" in call for call in calls[serial]) == 1
+    names = sorted(path.name for path in remote.iterdir())
+    assert len(names) == 3
+
+    # Nothing changed: no pushes and no rescans.
+    _upload(stub, "--sync")
+    calls = _take_calls(stub)
+    for serial in ("emulator-5554", "emulator-5556"):
+        assert _pushed(calls[serial]) == []
+        assert not any("media rescan" in call for call in calls[serial])
+
+    # A file this script pushed before overwrites its own remote copy.
+    stub["images"].joinpath("a.png").write_bytes(b"local a, edited")
+    _upload(stub, "--sync")
+    calls = _take_calls(stub)
+    for serial in ("emulator-5554", "emulator-5556"):
+        assert _pushed(calls[serial]) == ["a.png"]
+    assert sorted(path.name for path in remote.iterdir()) == names
+    assert sorted(path.read_bytes() for path in remote.iterdir()) == [
+        b"already there",
+        b"local a, edited",
+        b"local b",
+    ]
+    assert _remote(stub, "emulator-5556").joinpath("a.png").read_bytes() == b"local a, edited"
+    manifest = json.loads(stub["manifest"].read_text(encoding="utf-8"))
+    assert set(manifest["devices"]) == {"emulator-5554", "emulator-5556"}
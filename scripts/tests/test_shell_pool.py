@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import stat
+from pathlib import Path
+
+import pytest
+
+import update_image
+from update_image import AdbShellPool
+
+ADB = "adb"
+DEVICE = "emulator-5554"
+
+
+@pytest.fixture
+def pool():
+    pool = AdbShellPool(argv=lambda *_: ["sh"])
+    yield pool
+    pool.close()
+
+
+def test_output_without_trailing_newline(pool: AdbShellPool) -> None:
+    process = pool.run(ADB, DEVICE, "printf abc; printf def >&2", timeout=5)
+    assert process is not None
+    assert (process.returncode, process.stdout, process.stderr) == (0, "abc", "def")
+
+
+def test_exit_code_and_stderr(pool: AdbShellPool) -> None:
+    process = pool.run(ADB, DEVICE, "echo out; echo err >&2; exit 3", timeout=5)
+    assert process is not None
+    assert (process.returncode, process.stdout, process.stderr) == (3, "out\n", "err\n")
+    assert process.args == ["shell", "echo out; echo err >&2; exit 3"]
+
+
+def test_commands_share_one_shell(pool: AdbShellPool) -> None:
+    first = pool.run(ADB, DEVICE, "echo $PPID", timeout=5)
+    second = pool.run(ADB, DEVICE, "echo $PPID", timeout=5)
+    assert first is not None and second is not None
+    assert first.stdout == second.stdout
+    assert pool.stats.summary()["shell"]["count"] == 2
+
+
+def test_timeout_raises_and_next_call_opens_new_shell(pool: AdbShellPool) -> None:
+    before = pool.run(ADB, DEVICE, "echo $PPID", timeout=5)
+    with pytest.raises(RuntimeError, match="超时"):
+        pool.run(ADB, DEVICE, "sleep 5", timeout=0.2)
+    after = pool.run(ADB, DEVICE, "echo $PPID", timeout=5)
+    assert before is not None and after is not None
+    assert after.returncode == 0
+    assert after.stdout != before.stdout
+
+
+def test_dead_shell_falls_back_to_one_shot(
+    pool: AdbShellPool, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    adb = tmp_path / "adb"
+    adb.write_text('#!/bin/sh\nshift 2\necho "one-shot $*"\n', encoding="utf-8")
+    adb.chmod(adb.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setattr(update_image, "SHELL_POOL", pool)
+
+    assert update_image.run_adb(str(adb), ["shell", "echo pooled"], device=DEVICE).stdout == "pooled\n"
+    # Killing the persistent shell from inside makes the next read hit EOF.
+    assert pool.run(str(adb), DEVICE, "kill $PPID; sleep 1", timeout=5) is None
+    assert pool.run(str(adb), DEVICE, "echo pooled", timeout=5) is None
+    process = update_image.run_adb(str(adb), ["shell", "echo again"], device=DEVICE)
+    assert process.stdout == "one-shot shell echo again\n"
+    assert pool.stats.summary()["adb"]["count"] == 1
+
+
+def test_not_persistent_always_falls_back() -> None:
+    pool = AdbShellPool(argv=lambda *_: ["sh"], persistent=False)
+    assert pool.run(ADB, DEVICE, "echo hi", timeout=5) is None
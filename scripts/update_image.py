@@ -1,17 +1,42 @@
 #!/usr/bin/env python3
-"""Upload a local image to the Android emulator gallery via ADB."""
+"""Upload local images to Android emulator galleries via ADB.
+
+Without arguments a window uploads one image to the emulator. Given files,
+directories or glob patterns it runs headless instead and pushes all of them
+to every attached device (or each --device), several files at a time.
+Shell commands go over one persistent `adb shell` per device.
+"""
 
 from __future__ import annotations
 
+import argparse
+import glob
+import hashlib
+import json
 import os
+import queue
 import shlex
 import shutil
 import subprocess
+import sys
 import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from tkinter import filedialog, messagebox, ttk
-import tkinter as tk
+from typing import Callable
+
+try:
+    from tkinter import filedialog, messagebox, ttk
+    import tkinter as tk
+except ImportError:  # Headless batch mode works without Tk.
+    tk = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Only --transcode needs Pillow.
+    Image = None
 
 
 WINDOW_TITLE = "PixelPad 图片上传到模拟器相册"
@@ -19,9 +44,25 @@ DEVICE_ID = "emulator-5554"
 REMOTE_DIR = "/sdcard/DCIM/Camera"
 ADB_CANDIDATES = ("/home/cqc/Android/Sdk/platform-tools/adb",)
 IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+DEFAULT_JOBS = 4
+MANIFEST_PATH = Path.home() / ".cache" / "pixelpad" / "update_image_manifest.json"
+# Keeps each batched `adb shell` command line well under device limits.
+MAX_SHELL_ARGS_BYTES = 32 * 1024
+LATENCY_LABELS = {"shell": "持久 shell", "adb": "单次 adb 进程"}
+TRANSCODE_CACHE_DIR = Path.home() / ".cache" / "pixelpad" / "transcoded"
+TRANSCODE_FORMATS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_QUALITY = 85
+# Part of every cache key; bump when transcode_file output changes.
+TRANSCODE_VERSION = 1
+
+
+def find_adb(override: str | None = None) -> str:
+    if override:
+        if Path(override).is_file() and os.access(override, os.X_OK):
+            return override
+        raise RuntimeError(f"指定的 adb 不可执行：{override}")
 
-
-def find_adb() -> str:
     for candidate in ADB_CANDIDATES:
         if Path(candidate).is_file() and os.access(candidate, os.X_OK):
             return candidate
@@ -44,22 +85,232 @@ def extract_process_details(process: subprocess.CompletedProcess[str]) -> str:
     return "\n".join(parts)
 
 
+class ShellSessionError(RuntimeError):
+    pass
+
+
+def pump_lines(stream, lines: queue.Queue[str | None]) -> None:
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+class AdbShellSession:
+    """One long-lived shell process that runs commands one after another.
+
+    Each command runs as ``sh -c <command>`` with stdin from /dev/null and is
+    followed by sentinel lines on stdout (carrying the exit status) and on
+    stderr, so output is framed without a pty or prompt parsing. Older adb
+    versions merge stderr into stdout; the stderr sentinel then shows up on
+    stdout and is recognised there.
+    """
+
+    def __init__(self, argv: list[str]) -> None:
+        self.process = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self._stdout: queue.Queue[str | None] = queue.Queue()
+        self._stderr: queue.Queue[str | None] = queue.Queue()
+        for stream, lines in ((self.process.stdout, self._stdout), (self.process.stderr, self._stderr)):
+            threading.Thread(target=pump_lines, args=(stream, lines), daemon=True).start()
+
+    def run(self, command: str, timeout: float) -> subprocess.CompletedProcess[str]:
+        """Run ``command``; raises subprocess.TimeoutExpired or ShellSessionError."""
+        token = uuid.uuid4().hex
+        out_marker = f"__pixelpad_{token}_out__"
+        err_marker = f"__pixelpad_{token}_err__"
+        script = (
+            f"sh -c {shlex.quote(command)} </dev/null; "
+            f"rc=$?; echo {err_marker} >&2; echo {out_marker} $rc\n"
+        )
+        assert self.process.stdin is not None
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except (OSError, ValueError) as exc:
+            raise ShellSessionError("shell 已退出") from exc
+
+        deadline = time.monotonic() + timeout
+        stdout_parts: list[str] = []
+        stderr_parts: list[str] = []
+        status = None
+        stderr_done = False
+        while status is None:
+            line = self._next_line(self._stdout, command, timeout, deadline)
+            if err_marker in line:
+                stderr_done = True
+                line = line.replace(f"{err_marker}\n", "").replace(err_marker, "")
+            if out_marker in line:
+                before, _, status = line.partition(out_marker)
+                stdout_parts.append(before)
+            else:
+                stdout_parts.append(line)
+        while not stderr_done:
+            line = self._next_line(self._stderr, command, timeout, deadline)
+            before, found, _ = line.partition(err_marker)
+            stderr_parts.append(before)
+            stderr_done = bool(found)
+        try:
+            returncode = int(status.strip())
+        except ValueError as exc:
+            raise ShellSessionError(f"无法解析退出码：{status!r}") from exc
+        return subprocess.CompletedProcess(
+            ["shell", command], returncode, "".join(stdout_parts), "".join(stderr_parts)
+        )
+
+    def _next_line(
+        self, lines: queue.Queue[str | None], command: str, timeout: float, deadline: float
+    ) -> str:
+        try:
+            line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty as exc:
+            raise subprocess.TimeoutExpired(command, timeout) from exc
+        if line is None:
+            raise ShellSessionError("shell 已退出")
+        return line
+
+    def close(self, wait: float = 2) -> None:
+        try:
+            if self.process.stdin is not None:
+                self.process.stdin.close()
+            self.process.wait(timeout=wait)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+class LatencyStats:
+    """Thread-safe per-kind latency samples for ADB commands."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._samples: dict[str, list[float]] = {}
+
+    def add(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(kind, []).append(seconds)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            samples = {kind: sorted(values) for kind, values in self._samples.items()}
+        return {
+            kind: {
+                "count": len(values),
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": values[len(values) // 2] * 1000,
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+            for kind, values in samples.items()
+        }
+
+
+def default_shell_argv(adb_path: str, device: str) -> list[str]:
+    return [adb_path, "-s", device, "shell"]
+
+
+class AdbShellPool:
+    """Keeps one persistent ``adb shell`` per device and runs commands over it.
+
+    :meth:`run` returns None whenever the caller should fall back to a
+    one-shot ``adb shell`` process: the pool is not ``persistent``, the shell
+    could not be started, or it died. A device whose shell failed that way
+    stays on one-shot calls. A command that times out closes its shell (the
+    next command opens a new one) and raises RuntimeError like run_adb.
+    ``argv`` builds the shell command line, so tests can pass a local ``sh``.
+    """
+
+    def __init__(
+        self,
+        argv: Callable[[str, str], list[str]] = default_shell_argv,
+        *,
+        persistent: bool = True,
+    ) -> None:
+        self.argv = argv
+        self.persistent = persistent
+        self.stats = LatencyStats()
+        self._lock = threading.Lock()
+        self._device_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._sessions: dict[tuple[str, str], AdbShellSession] = {}
+        self._broken: set[tuple[str, str]] = set()
+
+    def run(
+        self, adb_path: str, device: str, command: str, timeout: float
+    ) -> subprocess.CompletedProcess[str] | None:
+        if not self.persistent:
+            return None
+        key = (adb_path, device)
+        with self._lock:
+            if key in self._broken:
+                return None
+            device_lock = self._device_locks.setdefault(key, threading.Lock())
+        with device_lock:
+            started = time.perf_counter()
+            session = self._sessions.get(key)
+            try:
+                if session is None:
+                    session = AdbShellSession(self.argv(adb_path, device))
+                    self._sessions[key] = session
+                process = session.run(command, timeout)
+            except subprocess.TimeoutExpired as exc:
+                self._drop(key)
+                raise RuntimeError(f"ADB 命令执行超时：shell {command}") from exc
+            except (OSError, ShellSessionError):
+                self._drop(key)
+                with self._lock:
+                    self._broken.add(key)
+                return None
+        self.stats.add("shell", time.perf_counter() - started)
+        return process
+
+    def _drop(self, key: tuple[str, str], wait: float = 0) -> None:
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            session.close(wait)
+
+    def close(self) -> None:
+        with self._lock:
+            keys = list(self._sessions)
+        for key in keys:
+            with self._device_locks[key]:
+                self._drop(key, wait=2)
+
+
+# Set by main(); run_adb sends `shell` commands through it when present.
+SHELL_POOL: AdbShellPool | None = None
+
+
 def run_adb(
     adb_path: str,
     args: list[str],
     *,
+    device: str = DEVICE_ID,
     check: bool = True,
     timeout: int = 30,
 ) -> subprocess.CompletedProcess[str]:
-    try:
-        process = subprocess.run(
-            [adb_path, "-s", DEVICE_ID, *args],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-    except subprocess.TimeoutExpired as exc:
-        raise RuntimeError(f"ADB 命令执行超时：{' '.join(args)}") from exc
+    process = None
+    if SHELL_POOL is not None and len(args) == 2 and args[0] == "shell":
+        process = SHELL_POOL.run(adb_path, device, args[1], timeout)
+    if process is None:
+        started = time.perf_counter()
+        try:
+            process = subprocess.run(
+                [adb_path, "-s", device, *args],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired as exc:
+            raise RuntimeError(f"ADB 命令执行超时：{' '.join(args)}") from exc
+        if SHELL_POOL is not None:
+            SHELL_POOL.stats.add("adb", time.perf_counter() - started)
     if check and process.returncode != 0:
         detail = extract_process_details(process)
         message = "ADB 命令执行失败。"
@@ -69,7 +320,9 @@ def run_adb(
     return process
 
 
-def build_device_error(process: subprocess.CompletedProcess[str]) -> str:
+def build_device_error(
+    process: subprocess.CompletedProcess[str], device: str = DEVICE_ID
+) -> str:
     detail = extract_process_details(process)
     combined = "\n".join(
         part for part in ((process.stdout or "").strip(), (process.stderr or "").strip()) if part
@@ -77,30 +330,38 @@ def build_device_error(process: subprocess.CompletedProcess[str]) -> str:
     lowered = combined.lower()
 
     if "offline" in lowered:
-        reason = f"设备 {DEVICE_ID} 当前处于 offline 状态。"
+        reason = f"设备 {device} 当前处于 offline 状态。"
     elif "device not found" in lowered or "no devices" in lowered:
-        reason = f"未找到目标设备 {DEVICE_ID}。"
+        reason = f"未找到目标设备 {device}。"
     elif "cannot connect" in lowered or "connection refused" in lowered:
         reason = "ADB 无法连接到目标模拟器。"
     elif "daemon" in lowered or "vsock" in lowered or "socket" in lowered:
         reason = "ADB 服务启动或连接异常。"
     else:
-        reason = f"无法确认设备 {DEVICE_ID} 已就绪。"
+        reason = f"无法确认设备 {device} 已就绪。"
 
     lines = [
         reason,
         "请先确认 Android 模拟器已启动。",
-        f"请在当前终端确认 `adb devices` 或 `flutter devices` 能看到 `{DEVICE_ID}`。",
+        f"请在当前终端确认 `adb devices` 或 `flutter devices` 能看到 `{device}`。",
     ]
     if detail:
         lines.append(detail)
     return "\n".join(lines)
 
 
-def check_device_ready(adb_path: str) -> None:
+def check_device_ready(adb_path: str, device: str = DEVICE_ID) -> None:
+    # A shell that answers is proof enough; otherwise get-state explains why not.
+    if SHELL_POOL is not None:
+        try:
+            process = SHELL_POOL.run(adb_path, device, "true", 20)
+        except RuntimeError:
+            process = None
+        if process is not None and process.returncode == 0:
+            return
     try:
         process = subprocess.run(
-            [adb_path, "-s", DEVICE_ID, "get-state"],
+            [adb_path, "-s", device, "get-state"],
             capture_output=True,
             text=True,
             timeout=20,
@@ -111,7 +372,7 @@ def check_device_ready(adb_path: str) -> None:
         ) from exc
     state = (process.stdout or "").strip()
     if process.returncode != 0 or state != "device":
-        raise RuntimeError(build_device_error(process))
+        raise RuntimeError(build_device_error(process, device))
 
 
 def validate_image(path_str: str) -> Path:
@@ -182,10 +443,12 @@ def resolve_remote_filename(adb_path: str, local_path: Path) -> str:
     return f"{REMOTE_DIR}/{renamed}"
 
 
-def push_file(adb_path: str, local_path: Path, remote_path: str) -> None:
+def push_file(
+    adb_path: str, local_path: Path, remote_path: str, device: str = DEVICE_ID
+) -> None:
     try:
         process = subprocess.run(
-            [adb_path, "-s", DEVICE_ID, "push", str(local_path), remote_path],
+            [adb_path, "-s", device, "push", str(local_path), remote_path],
             capture_output=True,
             text=True,
             timeout=120,
@@ -200,7 +463,9 @@ def push_file(adb_path: str, local_path: Path, remote_path: str) -> None:
         raise RuntimeError(message)
 
 
-def refresh_media_store(adb_path: str, remote_path: str) -> str | None:
+def refresh_media_store(
+    adb_path: str, remote_path: str, device: str = DEVICE_ID
+) -> str | None:
     attempts = [
         ["shell", f"cmd media rescan {shlex.quote(remote_path)}"],
         [
@@ -213,13 +478,8 @@ def refresh_media_store(adb_path: str, remote_path: str) -> str | None:
 
     for args in attempts:
         try:
-            process = subprocess.run(
-                [adb_path, "-s", DEVICE_ID, *args],
-                capture_output=True,
-                text=True,
-                timeout=30,
-            )
-        except subprocess.TimeoutExpired:
+            process = run_adb(adb_path, args, device=device, check=False)
+        except RuntimeError:
             failures.append(f"{' '.join(args)}\n命令执行超时")
             continue
         if process.returncode == 0:
@@ -231,6 +491,594 @@ def refresh_media_store(adb_path: str, remote_path: str) -> str | None:
     return "\n\n".join(failures) if failures else "媒体库刷新失败。"
 
 
+def list_devices(adb_path: str) -> list[str]:
+    """Serials that `adb devices` reports in the `device` (ready) state."""
+    try:
+        process = subprocess.run(
+            [adb_path, "devices"],
+            capture_output=True,
+            text=True,
+            timeout=20,
+        )
+    except subprocess.TimeoutExpired as exc:
+        raise RuntimeError("列出设备超时，请确认 ADB 服务运行正常。") from exc
+    if process.returncode != 0:
+        detail = extract_process_details(process)
+        raise RuntimeError(f"无法列出设备。\n{detail}".strip())
+    devices = []
+    for line in (process.stdout or "").splitlines():
+        serial, _, device_state = line.partition("\t")
+        if device_state.strip() == "device":
+            devices.append(serial.strip())
+    return devices
+
+
+def collect_images(patterns: list[str]) -> list[Path]:
+    """Expand files, directories (not recursive) and glob patterns to image paths."""
+    images: list[Path] = []
+    seen: set[Path] = set()
+    for pattern in patterns:
+        path = Path(pattern).expanduser()
+        if path.is_dir():
+            candidates = sorted(path.iterdir())
+        elif path.is_file():
+            candidates = [validate_image(str(path))]
+        else:
+            candidates = [Path(match) for match in sorted(glob.glob(str(path), recursive=True))]
+            if not candidates:
+                raise RuntimeError(f"没有找到匹配的文件：{pattern}")
+        for candidate in candidates:
+            if not candidate.is_file() or candidate.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            resolved = candidate.resolve()
+            if resolved not in seen:
+                seen.add(resolved)
+                images.append(candidate)
+    if not images:
+        raise RuntimeError("没有找到可上传的图片。")
+    return images
+
+
+def prepare_remote_dir(adb_path: str, remote_dir: str, device: str) -> set[str]:
+    """Create ``remote_dir`` and list its files with a single adb call."""
+    quoted = shlex.quote(remote_dir)
+    process = run_adb(adb_path, ["shell", f"mkdir -p {quoted} && ls -1a {quoted}"], device=device)
+    return {line.strip() for line in (process.stdout or "").splitlines() if line.strip()}
+
+
+def plan_remote_paths(local_paths: list[Path], existing: set[str], remote_dir: str) -> list[str]:
+    """Pick remote names, renaming like resolve_remote_filename on collisions."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    taken = set(existing)
+    remote_paths = []
+    for local_path in local_paths:
+        name = local_path.name
+        counter = 0
+        while name in taken:
+            counter += 1
+            suffix = f"_{counter}" if counter > 1 else ""
+            name = f"{local_path.stem}_{timestamp}{suffix}{local_path.suffix}"
+        taken.add(name)
+        remote_paths.append(f"{remote_dir}/{name}")
+    return remote_paths
+
+
+def load_manifest(path: Path) -> dict[str, dict]:
+    """Read the sync manifest: local hashes and, per device, remote files we know.
+
+    ``local`` maps an absolute path to its size, mtime_ns and sha256.
+    ``devices`` maps a serial to remote paths with their size, mtime, sha256
+    and, for files this script pushed, the local ``source`` path.
+    """
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    return {
+        "local": dict(payload.get("local") or {}),
+        "devices": dict(payload.get("devices") or {}),
+    }
+
+
+def save_manifest(path: Path, manifest: dict[str, dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f"{path.name}.tmp")
+    temp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    os.replace(temp_path, path)
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_local_files(paths: list[Path], cache: dict[str, dict]) -> dict[Path, str]:
+    """sha256 of each file, re-read only when its size or mtime changed."""
+    hashes = {}
+    for path in paths:
+        key = str(path.resolve())
+        info = path.stat()
+        entry = cache.get(key)
+        if not entry or entry.get("size") != info.st_size or entry.get("mtime_ns") != info.st_mtime_ns:
+            entry = {"size": info.st_size, "mtime_ns": info.st_mtime_ns, "sha256": hash_file(path)}
+            cache[key] = entry
+        hashes[path] = entry["sha256"]
+    return hashes
+
+
+def transcode_file(
+    source: str, target: str, max_edge: int, image_format: str, quality: int
+) -> int:
+    """Write ``source`` downscaled to ``max_edge`` and re-encoded to ``target``.
+
+    Orientation from EXIF is applied to the pixels; EXIF, ICC profiles and
+    text chunks are not carried over. JPEG output is flattened onto white.
+    Returns the size of ``target`` in bytes. Runs in a worker process.
+    """
+    with Image.open(source) as image:
+        # Lets the JPEG decoder scale down by 1/2..1/8 while decoding.
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        if image_format == "jpeg":
+            if has_alpha:
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "P") or (
+            image_format == "webp" and image.mode == "P"
+        ):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        transparency = image.info.get("transparency") if image.mode in ("P", "L", "RGB") else None
+        image.info = {} if transparency is None else {"transparency": transparency}
+        options: dict[str, object] = {"optimize": True}
+        if image_format in ("jpeg", "webp"):
+            options["quality"] = quality
+        temp_path = f"{target}.{os.getpid()}.tmp"
+        image.save(temp_path, format=image_format.upper(), **options)
+    os.replace(temp_path, target)
+    return os.path.getsize(target)
+
+
+def transcode_cache_path(
+    cache_dir: Path, digest: str, source: Path, options: dict[str, object]
+) -> Path:
+    params = f"{digest}:{options['max_edge']}:{options['format']}:{options['quality']}:{TRANSCODE_VERSION}"
+    key = hashlib.sha256(params.encode("utf-8")).hexdigest()
+    extension = TRANSCODE_FORMATS[str(options["format"])]
+    # The source's stem is kept so remote names still match the originals.
+    return cache_dir / key[:2] / key / f"{source.stem}{extension}"
+
+
+def transcode_images(
+    local_paths: list[Path], options: dict[str, object], hash_cache: dict[str, dict]
+) -> tuple[list[Path], dict[Path, Path], dict[str, object]]:
+    """Swap each image for a cached, downscaled and re-encoded copy.
+
+    ``options`` holds ``max_edge``, ``format``, ``quality``, ``cache_dir``
+    and ``jobs``. Copies are keyed by the source's sha256 and the options,
+    so renamed or duplicate sources and later runs reuse them; only misses
+    are encoded, in a pool of ``jobs`` processes. Returns the paths to
+    upload, a map from each copy back to its source and a report. Sources
+    that fail to transcode are left out and listed in the report.
+    """
+    if Image is None:
+        raise RuntimeError("转码需要 Pillow，请先执行 `pip install Pillow`。")
+    started = time.perf_counter()
+    cache_dir = Path(str(options["cache_dir"])).expanduser()
+    hashes = hash_local_files(local_paths, hash_cache)
+    targets = {
+        path: transcode_cache_path(cache_dir, hashes[path], path, options) for path in local_paths
+    }
+    misses: dict[Path, Path] = {}
+    links: dict[Path, Path] = {}
+    for path, target in targets.items():
+        if target.is_file() or target in links or target in misses.values():
+            continue
+        # Same content under another name is encoded once and linked.
+        sibling = next((other for other in misses.values() if other.parent == target.parent), None)
+        if sibling is None and target.parent.is_dir():
+            sibling = next(target.parent.glob(f"*{target.suffix}"), None)
+        if sibling is not None:
+            links[target] = sibling
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            misses[path] = target
+
+    errors: dict[Path, str] = {}
+    if misses:
+        jobs = max(1, min(int(options["jobs"]), len(misses)))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                target: pool.submit(
+                    transcode_file,
+                    str(path),
+                    str(target),
+                    int(options["max_edge"]),
+                    str(options["format"]),
+                    int(options["quality"]),
+                )
+                for path, target in misses.items()
+            }
+            for target, future in futures.items():
+                try:
+                    future.result()
+                except Exception as exc:
+                    errors[target] = f"{type(exc).__name__}: {exc}"
+    for target, sibling in links.items():
+        if sibling in errors:
+            errors[target] = errors[sibling]
+            continue
+        try:
+            os.link(sibling, target)
+        except OSError:
+            shutil.copyfile(sibling, target)
+
+    failed = [(str(path), errors[targets[path]]) for path in local_paths if targets[path] in errors]
+    kept = [path for path in local_paths if targets[path] not in errors]
+    outputs = [targets[path] for path in kept]
+    report: dict[str, object] = {
+        "files": len(outputs),
+        "encoded": len(misses) - len(set(misses.values()) & set(errors)),
+        "failed": failed,
+        "source_bytes": sum(path.stat().st_size for path in kept),
+        "output_bytes": sum(path.stat().st_size for path in outputs),
+        "seconds": time.perf_counter() - started,
+    }
+    return outputs, {targets[path]: path for path in kept}, report
+
+
+def format_transcode_report(report: dict[str, object]) -> str:
+    failed = report["failed"]
+    source_bytes = report["source_bytes"]
+    output_bytes = report["output_bytes"]
+    seconds = report["seconds"]
+    assert isinstance(failed, list) and isinstance(seconds, float)
+    assert isinstance(source_bytes, int) and isinstance(output_bytes, int)
+    lines = [
+        f"转码 {report['files']} 张（新编码 {report['encoded']} 张，其余来自缓存），"
+        f"{source_bytes / 2**20:.1f} MiB → {output_bytes / 2**20:.1f} MiB，用时 {seconds:.2f} 秒"
+    ]
+    lines.extend(f"转码失败 {path}：{error}" for path, error in failed)
+    return "\n".join(lines)
+
+
+def batched_names(names: list[str]) -> list[list[str]]:
+    batches: list[list[str]] = []
+    size = MAX_SHELL_ARGS_BYTES
+    for name in names:
+        quoted = len(shlex.quote(name)) + 1
+        if size + quoted > MAX_SHELL_ARGS_BYTES:
+            batches.append([])
+            size = 0
+        batches[-1].append(name)
+        size += quoted
+    return batches
+
+
+def parse_stat_lines(output: str) -> dict[str, tuple[int, int]]:
+    files = {}
+    for line in output.splitlines():
+        size, _, rest = line.partition(" ")
+        mtime, _, name = rest.partition(" ")
+        if size.isdigit() and mtime.isdigit() and name:
+            files[name[2:] if name.startswith("./") else name] = (int(size), int(mtime))
+    return files
+
+
+def list_remote_files(adb_path: str, remote_dir: str, device: str) -> dict[str, tuple[int, int]]:
+    """Create ``remote_dir`` and return ``{name: (size, mtime)}`` in one adb call."""
+    quoted = shlex.quote(remote_dir)
+    process = run_adb(
+        adb_path,
+        [
+            "shell",
+            f"mkdir -p {quoted} && cd {quoted} && "
+            "find . -maxdepth 1 -type f -exec stat -c '%s %Y %n' {} +",
+        ],
+        device=device,
+    )
+    return parse_stat_lines(process.stdout or "")
+
+
+def stat_remote_files(
+    adb_path: str, remote_dir: str, names: list[str], device: str
+) -> dict[str, tuple[int, int]]:
+    files = {}
+    for batch in batched_names(names):
+        command = f"cd {shlex.quote(remote_dir)} && stat -c '%s %Y %n' -- {shlex.join(batch)}"
+        files.update(parse_stat_lines(run_adb(adb_path, ["shell", command], device=device).stdout or ""))
+    return files
+
+
+def hash_remote_files(
+    adb_path: str, remote_dir: str, names: list[str], device: str
+) -> dict[str, str]:
+    """sha256 of each named file in ``remote_dir``, batched into as few adb calls as fit."""
+    hashes = {}
+    for batch in batched_names(names):
+        command = f"cd {shlex.quote(remote_dir)} && sha256sum -- {shlex.join(batch)}"
+        process = run_adb(adb_path, ["shell", command], device=device)
+        for line in (process.stdout or "").splitlines():
+            digest, _, name = line.partition("  ")
+            if len(digest) == 64 and name:
+                hashes[name] = digest
+    return hashes
+
+
+def plan_sync(
+    adb_path: str,
+    device: str,
+    local_paths: list[Path],
+    hashes: dict[Path, str],
+    remote_dir: str,
+    entries: dict[str, dict],
+    origins: dict[Path, Path] | None = None,
+) -> list[tuple[Path, str]]:
+    """Return the ``(local, remote)`` pushes needed to get every file's content on the device.
+
+    ``entries`` is the device's manifest section and is brought up to date
+    with the remote listing. Remote files whose size and mtime still match
+    their entry keep its hash; the others are hashed on the device in one
+    batched call, but only if some local file has the same size. A local
+    file is skipped when its content is anywhere in ``remote_dir``; a file
+    this script pushed before and that changed locally overwrites its old
+    remote copy; everything else gets a free name. ``origins`` maps
+    transcoded copies back to the sources the manifest tracks.
+    """
+    remote = list_remote_files(adb_path, remote_dir, device)
+    prefix = f"{remote_dir}/"
+    for remote_path in [path for path in entries if path.startswith(prefix)]:
+        entry = entries[remote_path]
+        if remote.get(remote_path[len(prefix):]) != (entry.get("size"), entry.get("mtime")):
+            del entries[remote_path]
+
+    local_sizes = {path.stat().st_size for path in local_paths}
+    unknown = [
+        name
+        for name, (size, _mtime) in remote.items()
+        if f"{prefix}{name}" not in entries and size in local_sizes
+    ]
+    for name, digest in hash_remote_files(adb_path, remote_dir, unknown, device).items():
+        size, mtime = remote[name]
+        entries[f"{prefix}{name}"] = {"size": size, "mtime": mtime, "sha256": digest, "source": None}
+
+    present = {entry["sha256"] for path, entry in entries.items() if path.startswith(prefix)}
+    previous = {
+        entry["source"]: path
+        for path, entry in entries.items()
+        if path.startswith(prefix) and entry.get("source")
+    }
+    pushes: list[tuple[Path, str]] = []
+    new_paths = []
+    for local_path in local_paths:
+        digest = hashes[local_path]
+        if digest in present:
+            continue
+        present.add(digest)
+        source = (origins or {}).get(local_path, local_path)
+        remote_path = previous.get(str(source.resolve()))
+        if remote_path:
+            pushes.append((local_path, remote_path))
+        else:
+            new_paths.append(local_path)
+    pushes.extend(zip(new_paths, plan_remote_paths(new_paths, set(remote), remote_dir)))
+    return pushes
+
+
+def record_pushes(
+    adb_path: str,
+    device: str,
+    pushed: list[tuple[str, str]],
+    hashes: dict[Path, str],
+    remote_dir: str,
+    entries: dict[str, dict],
+    origins: dict[Path, Path] | None = None,
+) -> None:
+    # One stat call gives the size and mtime the next run compares against.
+    prefix = f"{remote_dir}/"
+    names = [remote_path[len(prefix):] for _local, remote_path in pushed]
+    try:
+        stats = stat_remote_files(adb_path, remote_dir, names, device)
+    except RuntimeError:
+        stats = {}
+    for (local_path, remote_path), name in zip(pushed, names):
+        if name in stats:
+            size, mtime = stats[name]
+            source = (origins or {}).get(Path(local_path), Path(local_path))
+            entries[remote_path] = {
+                "size": size,
+                "mtime": mtime,
+                "sha256": hashes[Path(local_path)],
+                "source": str(source.resolve()),
+            }
+
+
+def upload_to_device(
+    adb_path: str,
+    device: str,
+    local_paths: list[Path],
+    remote_dir: str,
+    jobs: int,
+    *,
+    check_state: bool = True,
+    hashes: dict[Path, str] | None = None,
+    entries: dict[str, dict] | None = None,
+    origins: dict[Path, Path] | None = None,
+) -> dict[str, object]:
+    """Push ``local_paths`` to one device with up to ``jobs`` concurrent pushes.
+
+    The device check, mkdir and remote listing run once, and the media store
+    is rescanned once for ``remote_dir`` after the last push. With ``hashes``
+    and the device's manifest ``entries`` only content missing from the
+    device is pushed (see plan_sync) and ``entries`` records what was.
+    Failures name the source from ``origins`` for transcoded copies.
+    """
+    origins = origins or {}
+    started = time.perf_counter()
+    pushed: list[tuple[str, str]] = []
+    failed: list[tuple[str, str]] = []
+    result: dict[str, object] = {
+        "device": device,
+        "pushed": pushed,
+        "failed": failed,
+        "skipped": 0,
+        "bytes": 0,
+        "rescan_error": None,
+        "seconds": 0.0,
+    }
+    try:
+        if check_state:
+            check_device_ready(adb_path, device)
+        if hashes is None or entries is None:
+            existing = prepare_remote_dir(adb_path, remote_dir, device)
+            items = list(zip(local_paths, plan_remote_paths(local_paths, existing, remote_dir)))
+        else:
+            items = plan_sync(adb_path, device, local_paths, hashes, remote_dir, entries, origins)
+            result["skipped"] = len(local_paths) - len(items)
+    except RuntimeError as exc:
+        failed.extend((str(origins.get(path, path)), str(exc)) for path in local_paths)
+        result["seconds"] = time.perf_counter() - started
+        return result
+
+    def push(item: tuple[Path, str]) -> tuple[Path, str, str | None]:
+        local_path, remote_path = item
+        try:
+            push_file(adb_path, local_path, remote_path, device)
+        except RuntimeError as exc:
+            return local_path, remote_path, str(exc)
+        return local_path, remote_path, None
+
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for local_path, remote_path, error in pool.map(push, items):
+            if error is None:
+                pushed.append((str(local_path), remote_path))
+                total_bytes += local_path.stat().st_size
+            else:
+                failed.append((str(origins.get(local_path, local_path)), error))
+    result["bytes"] = total_bytes
+    if pushed and hashes is not None and entries is not None:
+        record_pushes(adb_path, device, pushed, hashes, remote_dir, entries, origins)
+    if pushed:
+        result["rescan_error"] = refresh_media_store(adb_path, remote_dir, device)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def run_batch(
+    patterns: list[str],
+    *,
+    devices: list[str] | None = None,
+    remote_dir: str = REMOTE_DIR,
+    jobs: int = DEFAULT_JOBS,
+    adb: str | None = None,
+    sync: bool = False,
+    manifest_path: Path = MANIFEST_PATH,
+    transcode: dict[str, object] | None = None,
+) -> list[dict[str, object]]:
+    """Upload every matched image to every device; devices run in parallel.
+
+    With ``sync`` only content a device does not already have is pushed, and
+    the manifest at ``manifest_path`` is updated for the next run. With
+    ``transcode`` options (see transcode_images) downscaled copies are pushed
+    instead of the originals and the options gain a ``report`` entry.
+    """
+    local_paths = collect_images(patterns)
+    adb_path = find_adb(adb)
+    # Devices listed by `adb devices` as ready need no separate get-state.
+    check_state = bool(devices)
+    if not devices:
+        devices = list_devices(adb_path)
+        if not devices:
+            raise RuntimeError("没有已连接的设备，请先启动模拟器。")
+    manifest = load_manifest(manifest_path) if sync else None
+    origins: dict[Path, Path] = {}
+    if transcode is not None:
+        local_paths, origins, transcode["report"] = transcode_images(
+            local_paths, transcode, manifest["local"] if manifest else {}
+        )
+    hashes = hash_local_files(local_paths, manifest["local"]) if manifest else None
+    with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        futures = [
+            pool.submit(
+                upload_to_device,
+                adb_path,
+                device,
+                local_paths,
+                remote_dir,
+                jobs,
+                check_state=check_state,
+                hashes=hashes,
+                entries=manifest["devices"].setdefault(device, {}) if manifest else None,
+                origins=origins,
+            )
+            for device in devices
+        ]
+        results = [future.result() for future in futures]
+    if manifest:
+        save_manifest(manifest_path, manifest)
+    return results
+
+
+def format_summary(results: list[dict[str, object]], seconds: float) -> str:
+    lines = [f"{'设备':<20}{'成功':>6}{'跳过':>6}{'失败':>6}{'MiB':>9}{'秒':>8}{'张/秒':>9}"]
+    total_files = total_skipped = total_bytes = total_failed = 0
+    failures = []
+    for result in results:
+        pushed = result["pushed"]
+        failed = result["failed"]
+        skipped = result["skipped"]
+        size = result["bytes"]
+        elapsed = result["seconds"]
+        assert isinstance(pushed, list) and isinstance(failed, list)
+        assert isinstance(skipped, int) and isinstance(size, int) and isinstance(elapsed, float)
+        total_files += len(pushed)
+        total_skipped += skipped
+        total_bytes += size
+        total_failed += len(failed)
+        rate = len(pushed) / elapsed if elapsed else 0.0
+        lines.append(
+            f"{result['device']:<20}{len(pushed):>6}{skipped:>6}{len(failed):>6}{size / 2**20:>9.1f}"
+            f"{elapsed:>8.2f}{rate:>9.1f}"
+        )
+        failures.extend(
+            f"[{result['device']}] 上传失败 {local_path}：{error}" for local_path, error in failed
+        )
+        if result["rescan_error"]:
+            failures.append(f"[{result['device']}] 媒体库刷新失败：\n{result['rescan_error']}")
+    rate = total_files / seconds if seconds else 0.0
+    lines.append(
+        f"{'合计':<20}{total_files:>6}{total_skipped:>6}{total_failed:>6}"
+        f"{total_bytes / 2**20:>9.1f}"
+        f"{seconds:>8.2f}{rate:>9.1f}"
+    )
+    return "\n".join(lines + failures)
+
+
+def format_latency(stats: LatencyStats) -> str:
+    summary = stats.summary()
+    if not summary:
+        return ""
+    lines = [f"{'ADB 命令':<16}{'次数':>6}{'平均ms':>9}{'p50ms':>9}{'p95ms':>9}{'最大ms':>9}"]
+    for kind, row in summary.items():
+        lines.append(
+            f"{LATENCY_LABELS.get(kind, kind):<16}{row['count']:>6}{row['mean_ms']:>9.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['max_ms']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
 def set_status(state: dict[str, object], message: str, *, level: str) -> None:
     status_var = state["status_var"]
     status_label = state["status_label"]
@@ -401,7 +1249,138 @@ def build_gui() -> dict[str, object]:
     return state
 
 
-def main() -> None:
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="图片文件、目录或 glob 模式（如 'shots/**/*.png'）；省略时打开窗口",
+    )
+    parser.add_argument(
+        "--device",
+        action="append",
+        dest="devices",
+        help="目标设备序列号，可重复；默认使用所有已连接设备",
+    )
+    parser.add_argument("--remote-dir", default=REMOTE_DIR, help="设备上的目标目录")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="每台设备同时进行的上传数",
+    )
+    parser.add_argument("--adb", help="adb 可执行文件路径（默认自动查找）")
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="增量同步：按内容哈希跳过设备上已有的图片，只上传新增或修改的文件",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=MANIFEST_PATH,
+        help=f"--sync 使用的哈希清单文件（默认 {MANIFEST_PATH}）",
+    )
+    parser.add_argument(
+        "--no-shell-pool",
+        action="store_true",
+        help="每条 shell 命令单独启动 adb 进程，不复用每台设备的持久 shell",
+    )
+    parser.add_argument(
+        "--transcode",
+        action="store_true",
+        help="上传前缩小并重新编码图片（需要 Pillow），结果按内容哈希缓存",
+    )
+    parser.add_argument(
+        "--max-edge",
+        type=int,
+        default=DEFAULT_MAX_EDGE,
+        help="--transcode 时图片长边的最大像素数",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(TRANSCODE_FORMATS),
+        default="jpeg",
+        help="--transcode 的输出格式",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=DEFAULT_QUALITY,
+        help="--transcode 输出 jpeg/webp 的质量（1-100）",
+    )
+    parser.add_argument(
+        "--transcode-cache",
+        type=Path,
+        default=TRANSCODE_CACHE_DIR,
+        help=f"转码结果缓存目录（默认 {TRANSCODE_CACHE_DIR}）",
+    )
+    parser.add_argument(
+        "--transcode-jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="同时转码的进程数",
+    )
+    args = parser.parse_args(argv)
+    if args.max_edge < 1:
+        parser.error("--max-edge 必须大于 0")
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality 必须在 1 到 100 之间")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    global SHELL_POOL
+    args = parse_args(argv)
+    SHELL_POOL = AdbShellPool(persistent=not args.no_shell_pool)
+    try:
+        run_main(args)
+    finally:
+        SHELL_POOL.close()
+
+
+def run_main(args: argparse.Namespace) -> None:
+    if args.paths:
+        started = time.perf_counter()
+        transcode = None
+        if args.transcode:
+            transcode = {
+                "max_edge": args.max_edge,
+                "format": args.format,
+                "quality": args.quality,
+                "cache_dir": args.transcode_cache,
+                "jobs": args.transcode_jobs,
+            }
+        try:
+            results = run_batch(
+                args.paths,
+                devices=args.devices,
+                remote_dir=args.remote_dir.rstrip("/") or "/",
+                jobs=args.jobs,
+                adb=args.adb,
+                sync=args.sync,
+                manifest_path=args.manifest,
+                transcode=transcode,
+            )
+        except RuntimeError as exc:
+            print(exc, file=sys.stderr)
+            raise SystemExit(1) from exc
+        report = transcode.get("report") if transcode else None
+        if isinstance(report, dict):
+            print(format_transcode_report(report))
+        print(format_summary(results, time.perf_counter() - started))
+        assert SHELL_POOL is not None
+        latency = format_latency(SHELL_POOL.stats)
+        if latency:
+            print(latency)
+        if any(result["failed"] for result in results) or (
+            isinstance(report, dict) and report["failed"]
+        ):
+            raise SystemExit(1)
+        return
+
+    if tk is None:
+        raise SystemExit("当前 Python 没有 tkinter，请传入图片路径使用命令行模式。")
     state = build_gui()
     root = state["root"]
     assert isinstance(root, tk.Tk)